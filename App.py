@@ -1,11 +1,11 @@
-from flask import Flask, request, render_template_string, send_file, Response, abort
+from flask import Flask, request, render_template, send_file, Response, abort, jsonify
 import pandas as pd
 import os
 import time
-import chardet
 import io
+import contextlib
 import math
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.engine import URL
 from werkzeug.utils import secure_filename
 from openpyxl import Workbook
@@ -13,8 +13,38 @@ from openpyxl.comments import Comment
 from openpyxl.worksheet.datavalidation import DataValidation
 from openpyxl.utils import get_column_letter
 import base64, pdfplumber, re
+import datetime
+import threading
+import uuid
+import zipfile
+import hashlib
+import json
+from psycopg2.extras import execute_values
 from dateutil.parser import parse as dtparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pdf_extract import pdf_info, extract_pages
+from pdf_cache import ParseCache
+from staging import StagingStore
+from temp_store import TempStore
+from jobs import JobQueue
+from db import LazyEngine, pool_options_from_env
+import ledger
+import ingest_schema
+import key_locks
+import stock
+from record_stream import iter_json_records, RecordStreamError
+from static_assets import AssetManifest
+import upload_store
+from compression import init_compression
+import metrics
+from migrations import EDI_NATURAL_KEY, EDI_NATURAL_KEY_INDEX, EDI_NATURAL_KEY_EXPRS
+from upload_reader import read_upload, read_upload_head, iter_upload_chunks
+from normalize import (SUFFIX_TOKENS, safestr_series, normalize_avo_ref_series,
+                       clean_qty_series, norm_status_series)
 app = Flask(__name__)
+init_compression(app)
+metrics.init_app(app)
 
 # -----------------------
 # Database Connection
@@ -28,18 +58,45 @@ db_url = URL.create(
     port=5432,
     database="EDI_IA"
 )
-try:
-    engine = create_engine(db_url)
-    # Test connection
-    with engine.connect() as connection:
-        print("✅ Database connection successful.")
-except Exception as e:
-    print(f"❌ Database connection failed: {e}")
-    engine = None
+# Built on first use in each worker (no connection at import); pool tuned via DB_POOL_* env vars
+engine = LazyEngine(db_url, **pool_options_from_env())
 
 OUTPUT_DIR = "outputs"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+# uploaded files are streamed by the form parser straight into OUTPUT_DIR, hashed on the way
+app.request_class = upload_store.upload_request_class(OUTPUT_DIR)
+# per-process metric snapshots, merged by /metrics
+metrics.configure(os.path.join(OUTPUT_DIR, "metrics"))
 ALLOWED_EXTENSIONS = {"csv", "xls", "xlsx", "pdf"}
+staging = StagingStore(os.path.join(OUTPUT_DIR, "staging"))
+# uploads and staged batches are owned by their staging token: released after /insert,
+# otherwise expired / evicted (oldest first above the size cap) by a janitor thread
+temp_store = TempStore(
+    OUTPUT_DIR,
+    ttl=float(os.getenv("TEMP_TTL_HOURS", "24")) * 3600,
+    max_bytes=int(os.getenv("TEMP_MAX_MB", "2048")) * 1024 * 1024,
+    orphan_grace=int(os.getenv("TEMP_ORPHAN_GRACE_SECONDS", "900")),
+)
+TEMP_JANITOR_SECONDS = int(os.getenv("TEMP_JANITOR_SECONDS", "300"))
+temp_store.start_janitor(TEMP_JANITOR_SECONDS)
+
+
+@app.before_request
+def _ensure_temp_janitor():
+    # no-op once running; starts the janitor in workers forked after import (gunicorn --preload)
+    temp_store.start_janitor(TEMP_JANITOR_SECONDS)
+
+PREVIEW_ROWS = 20
+# CSV/Excel uploads above this size are streamed in chunks instead of loaded whole
+STREAM_THRESHOLD_BYTES = int(os.getenv("STREAM_THRESHOLD_MB", "20")) * 1024 * 1024
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "50000"))
+STREAM_COMMIT_PER_CHUNK = os.getenv("STREAM_COMMIT_PER_CHUNK", "0") == "1"
+insert_jobs = JobQueue(os.path.join(OUTPUT_DIR, "jobs"), workers=int(os.getenv("INSERT_JOB_WORKERS", "2")))
+# Fast preview: render the head of the upload at once, parse the rest in the background
+FAST_PREVIEW = os.getenv("FAST_PREVIEW", "1") == "1"
+parse_jobs = JobQueue(os.path.join(OUTPUT_DIR, "jobs"), workers=int(os.getenv("PARSE_JOB_WORKERS", "2")))
+PARSE_WAIT_SECONDS = 600
+PREVIEW_PAGE_MAX_ROWS = 500
 
 
 import re
@@ -93,10 +150,31 @@ def allowed_file(filename):
 # -----------------------
 # DB Insert Functions
 # -----------------------
-def insert_ediglobal(df):
+EDI_COPY_CHUNK_ROWS = 50_000
+
+def insert_ediglobal(df, bulk=True, *, batch_key=None, force=False, file_name=None):
+    """
+    Insert an EDI batch into "EDIGlobal".
+    bulk=True streams the frame through COPY into a temp staging table and moves it
+    into the target with a single INSERT ... SELECT (same transaction).
+    bulk=False keeps the historical one-INSERT-per-row path.
+    With batch_key the batch is checked against / recorded in the ingestion ledger in
+    the same transaction; a known batch raises ledger.AlreadyIngested unless force.
+    Returns the number of rows inserted.
+    """
     if not engine:
         raise ConnectionError("Database engine is not available.")
+    if bulk:
+        with engine.begin() as conn:
+            if batch_key:
+                ledger.claim(conn, batch_key, force=force)
+            n = _copy_ediglobal(conn, df)
+            if batch_key:
+                ledger.record(conn, batch_key, "EDI", n, file_name)
+            return n
     with engine.begin() as conn:
+        if batch_key:
+            ledger.claim(conn, batch_key, force=force)
         for _, row in df.iterrows():
             stmt = text("""
                 INSERT INTO "EDIGlobal" (
@@ -118,9 +196,213 @@ def insert_ediglobal(df):
                 "LastDeliveryDate","LastDeliveredQuantity",
                 "CumulatedQuantity","EDIStatus","ProductName","LastDeliveryNo"
             ]})
+        stock.refresh(conn, stock.frame_keys(df))
+        if batch_key:
+            ledger.record(conn, batch_key, "EDI", len(df), file_name)
+    return len(df)
+
+def _edi_frame(df):
+    """df shaped like "EDIGlobal": template columns only, missing ones as NULL."""
+    out = df.reindex(columns=TEMPLATE_SCHEMAS["edi_template"])
+    # whole-number float columns (NaN-promoted ints from read_excel) must not reach COPY as "12.0"
+    for c in out.columns:
+        s = out[c]
+        if pd.api.types.is_float_dtype(s) and (s.dropna() % 1 == 0).all():
+            out[c] = s.astype("Int64")
+    return out
+
+@metrics.stage("edi.copy")
+def _stage_ediglobal(conn, df, chunk_rows=EDI_COPY_CHUNK_ROWS):
+    """
+    COPY df into the temp table "EDIGlobal_stage" (shaped like "EDIGlobal", dropped on
+    commit). "_ord" keeps the batch order. Returns the quoted template column list.
+    """
+    cols = TEMPLATE_SCHEMAS["edi_template"]
+    col_list = ",".join(f'"{c}"' for c in cols)
+    out = _edi_frame(df)
+
+    conn.execute(text(f"""
+        DROP TABLE IF EXISTS pg_temp."EDIGlobal_stage";
+        CREATE TEMP TABLE "EDIGlobal_stage" ON COMMIT DROP AS
+        SELECT {col_list} FROM "EDIGlobal" WITH NO DATA;
+        ALTER TABLE "EDIGlobal_stage" ADD COLUMN "_ord" bigserial
+    """))
+    copy_sql = f"""COPY "EDIGlobal_stage" ({col_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"""
+    with conn.connection.cursor() as cur:
+        for start in range(0, len(out), chunk_rows):
+            buf = io.StringIO()
+            out.iloc[start:start + chunk_rows].to_csv(buf, index=False, header=False, na_rep="\\N")
+            buf.seek(0)
+            with metrics.db_call():
+                cur.copy_expert(copy_sql, buf)
+    return col_list
+
+def _copy_ediglobal(conn, df, chunk_rows=EDI_COPY_CHUNK_ROWS):
+    """
+    COPY df into a temp staging table shaped like "EDIGlobal", then move it across
+    with one set-based INSERT. Missing columns become NULL (like row.get() did);
+    empty strings stay empty strings, so the result matches the per-row path.
+    """
+    col_list = _stage_ediglobal(conn, df, chunk_rows)
+    res = conn.execute(text(f"""
+        INSERT INTO "EDIGlobal" ({col_list})
+        SELECT {col_list} FROM "EDIGlobal_stage" ORDER BY "_ord"
+    """))
+    stock.refresh(conn, stock.frame_keys(df))
+    return res.rowcount
+
+# "append" (every line inserted, historical behaviour) or "merge" (merge_ediglobal)
+EDI_INSERT_MODE = os.getenv("EDI_INSERT_MODE", "append")
+_edi_natural_key_ready = False
+
+def _edi_natural_key(conn):
+    """
+    Key expressions of the unique index merge_ediglobal's ON CONFLICT relies on. The
+    index is created by migration 5 (migrations.py, merge mode); the request path
+    only checks that it exists, caching a positive answer like stock._has_table.
+    """
+    global _edi_natural_key_ready
+    if not _edi_natural_key_ready:
+        found = conn.execute(text("SELECT to_regclass(:i)"), {"i": f'"{EDI_NATURAL_KEY_INDEX}"'}).scalar()
+        if found is None:
+            raise RuntimeError(
+                f'Merge mode needs the unique index "{EDI_NATURAL_KEY_INDEX}" on "EDIGlobal"; '
+                "apply it with EDI_INSERT_MODE=merge python migrations.py.")
+        _edi_natural_key_ready = True
+    return EDI_NATURAL_KEY_EXPRS
+
+@metrics.stage("edi.merge")
+def _merge_ediglobal(conn, df, chunk_rows=EDI_COPY_CHUNK_ROWS):
+    """
+    Upsert df into "EDIGlobal" on EDI_NATURAL_KEY with one INSERT ... ON CONFLICT DO UPDATE.
+    Lines whose other columns are all unchanged are left alone. Within the batch the
+    last line for a key wins. Returns {"inserted", "updated", "unchanged"}.
+    """
+    key_exprs = _edi_natural_key(conn)
+    col_list = _stage_ediglobal(conn, df, chunk_rows)
+    cols = TEMPLATE_SCHEMAS["edi_template"]
+    other = [c for c in cols if c not in EDI_NATURAL_KEY]
+    set_list = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in other)
+    old_vals = ",".join(f't."{c}"' for c in other)
+    new_vals = ",".join(f'EXCLUDED."{c}"' for c in other)
+    row = conn.execute(text(f"""
+        WITH src AS (
+            SELECT DISTINCT ON ({key_exprs}) {col_list}
+            FROM "EDIGlobal_stage"
+            ORDER BY {key_exprs}, "_ord" DESC
+        ), merged AS (
+            INSERT INTO "EDIGlobal" AS t ({col_list})
+            SELECT {col_list} FROM src
+            ON CONFLICT ({key_exprs}) DO UPDATE SET {set_list}
+            WHERE ({old_vals}) IS DISTINCT FROM ({new_vals})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT (SELECT count(*) FROM src) AS total,
+               count(*) FILTER (WHERE inserted) AS inserted,
+               count(*) FILTER (WHERE NOT inserted) AS updated
+        FROM merged
+    """)).mappings().one()
+    stock.refresh(conn, stock.frame_keys(df))
+    return {"inserted": row["inserted"], "updated": row["updated"],
+            "unchanged": row["total"] - row["inserted"] - row["updated"]}
+
+def merge_ediglobal(df, *, batch_key=None, force=False, file_name=None):
+    """
+    Delta-merge an EDI batch into "EDIGlobal": new lines are inserted, lines whose
+    quantity / status / other values changed are updated, identical ones are skipped.
+    Ledger arguments as for insert_ediglobal. Returns {"inserted", "updated", "unchanged"}.
+    """
+    if not engine:
+        raise ConnectionError("Database engine is not available.")
+    with engine.begin() as conn:
+        if batch_key:
+            ledger.claim(conn, batch_key, force=force)
+        counts = _merge_ediglobal(conn, df)
+        if batch_key:
+            ledger.record(conn, batch_key, "EDI", counts["inserted"] + counts["updated"], file_name)
+        return counts
+
+DELIVERY_BULK_PAGE_ROWS = 5_000
+
+# The InTransit queries are written against the indexes of migrations.py: AVOMaterialNo is
+# compared as is (a NULL part number matches ''), never through COALESCE(), so
+# "DeliveryDetails_intransit_latest" (Site, AVOMaterialNo, Date DESC) WHERE Status='InTransit'
+# answers "latest InTransit row" from the first index entry, and the UPDATEs find the row
+# through "DeliveryDetails_delivery_no" (DeliveryNo, Date).
+LATEST_INTRANSIT_SQL = """
+    SELECT "DeliveryNo","Quantity","Date"
+    FROM "DeliveryDetails"
+    WHERE "Site" = :site
+      AND ("AVOMaterialNo" = :avo_mat OR (:avo_mat = '' AND "AVOMaterialNo" IS NULL))
+      AND "Status" = 'InTransit'
+    ORDER BY "Date" DESC
+    LIMIT 1
+"""
 
-def insert_deliverydetails(df):
+MOVE_INTRANSIT_SQL = """
+    UPDATE "DeliveryDetails"
+    SET "Quantity" = :qty,
+        "Date" = :date,
+        "DeliveryNo" = :curr_del_no
+    WHERE "DeliveryNo" = :old_del_no
+      AND "Status" = 'InTransit'
+      AND "Date" = :old_date
+"""
+
+# every InTransit row of each key, one index range scan per key; the NULL branch only runs
+# for keys without a part number
+INTRANSIT_BATCH_SQL = """
+    SELECT k.site AS "Site", k.avo_mat, it."DeliveryNo", it."Quantity", it."Date"
+    FROM unnest(CAST(:sites AS text[]), CAST(:avos AS text[])) AS k(site, avo_mat)
+    CROSS JOIN LATERAL (
+        SELECT d."DeliveryNo", d."Quantity", d."Date"
+        FROM "DeliveryDetails" d
+        WHERE d."Site" = k.site AND d."AVOMaterialNo" = k.avo_mat AND d."Status" = 'InTransit'
+        UNION ALL
+        SELECT d."DeliveryNo", d."Quantity", d."Date"
+        FROM "DeliveryDetails" d
+        WHERE k.avo_mat = '' AND d."Site" = k.site AND d."AVOMaterialNo" IS NULL
+          AND d."Status" = 'InTransit'
+    ) it
+"""
+
+# execute_values template: the (DeliveryNo, Date) index finds each row, the rest is a filter
+BULK_MOVE_INTRANSIT_SQL = """
+    UPDATE "DeliveryDetails" AS d
+    SET "Quantity" = v.qty, "Date" = v.date, "DeliveryNo" = v.del_no
+    FROM (VALUES %s) AS v(site, avo_mat, old_del_no, old_date, del_no, qty, date)
+    WHERE d."DeliveryNo" = v.old_del_no
+      AND d."Date" = v.old_date
+      AND d."Status" = 'InTransit'
+      AND d."Site" = v.site
+      AND COALESCE(d."AVOMaterialNo",'') = v.avo_mat
+"""
+
+def insert_deliverydetails(df, bulk=True, *, batch_key=None, force=False, file_name=None):
+    """
+    Apply a delivery batch to "DeliveryDetails".
+    bulk=True loads the InTransit rows once, replays the batch in memory and writes
+    everything back with one UPDATE ... FROM (VALUES ...) and one multi-row INSERT.
+    bulk=False keeps the historical row-by-row path.
+    Both first lock the batch's (Site, AVOMaterialNo) keys (key_locks), so concurrent
+    imports only wait for each other on the parts they share.
+    batch_key / force / file_name: ingestion ledger, as for insert_ediglobal.
+    """
+    if not engine:
+        raise ConnectionError("Database engine is not available.")
+    if bulk:
+        with engine.begin() as conn:
+            if batch_key:
+                ledger.claim(conn, batch_key, force=force)
+            n = _apply_delivery_batch(conn, df)
+            if batch_key:
+                ledger.record(conn, batch_key, "LIVRAISON", len(df), file_name)
+            return n
     with engine.begin() as conn:
+        if batch_key:
+            ledger.claim(conn, batch_key, force=force)
+        # every key up front, in one sorted pass, before any InTransit row is read
+        key_locks.lock_keys(conn, {(e[0], e[1]) for e in _delivery_events(df)})
         for _, row in df.iterrows():
             site = _safestr(row.get("Site"))
             avo_mat = _safestr(row.get("AVOMaterialNo"))
@@ -135,16 +417,7 @@ def insert_deliverydetails(df):
                 continue
 
             def fetch_latest_intransit():
-                q = text("""
-                    SELECT "DeliveryNo","Quantity","Date"
-                    FROM "DeliveryDetails"
-                    WHERE "Site" = :site
-                      AND COALESCE("AVOMaterialNo",'') = :avo_mat
-                      AND "Status" = 'InTransit'
-                    ORDER BY "Date" DESC
-                    LIMIT 1
-                """)
-                return conn.execute(q, {
+                return conn.execute(text(LATEST_INTRANSIT_SQL), {
                     "site": site,  "avo_mat": avo_mat
                 }).mappings().fetchone()
 
@@ -153,16 +426,7 @@ def insert_deliverydetails(df):
                 if it:
                     new_qty = _clean_qty(it["Quantity"]) + qty
                     # IMPORTANT CHANGE: also update DeliveryNo to the CURRENT dispatched delivery_no
-                    update_stmt = text("""
-                        UPDATE "DeliveryDetails"
-                        SET "Quantity" = :qty,
-                            "Date" = :date,
-                            "DeliveryNo" = :curr_del_no
-                        WHERE "DeliveryNo" = :old_del_no
-                          AND "Status" = 'InTransit'
-                          AND "Date" = :old_date
-                    """)
-                    conn.execute(update_stmt, {
+                    conn.execute(text(MOVE_INTRANSIT_SQL), {
                         "qty": int(new_qty),
                         "date": date,
                         "curr_del_no": delivery_no,
@@ -197,16 +461,7 @@ def insert_deliverydetails(df):
                 if it:
                     new_qty = max(0, _clean_qty(it["Quantity"]) - qty)
                     # IMPORTANT CHANGE: also refresh DeliveryNo to the CURRENT delivered delivery_no
-                    update_stmt = text("""
-                        UPDATE "DeliveryDetails"
-                        SET "Quantity" = :qty,
-                            "Date" = :date,
-                            "DeliveryNo" = :curr_del_no
-                        WHERE "DeliveryNo" = :old_del_no
-                          AND "Status" = 'InTransit'
-                          AND "Date" = :old_date
-                    """)
-                    conn.execute(update_stmt, {
+                    conn.execute(text(MOVE_INTRANSIT_SQL), {
                         "qty": int(new_qty),
                         "date": date,
                         "curr_del_no": delivery_no,
@@ -245,6 +500,137 @@ def insert_deliverydetails(df):
                     "site": site, "avo_mat": avo_mat,
                     "del_no": delivery_no, "qty": int(qty), "date": date, "status": status
                 })
+        stock.refresh(conn, {(e[0], e[1]) for e in _delivery_events(df)})
+        if batch_key:
+            ledger.record(conn, batch_key, "LIVRAISON", len(df), file_name)
+
+def _delivery_events(df):
+    """Normalize batch rows the same way the row-by-row path does, skipping incomplete ones."""
+    events = []
+    for row in df.to_dict("records"):
+        site = _safestr(row.get("Site"))
+        avo_mat = _safestr(row.get("AVOMaterialNo"))
+        delivery_no = _safestr(row.get("DeliveryNo"))
+        date = _safestr(row.get("Date"))
+        qty = _clean_qty(row.get("Quantity"))
+        status = _norm_status(row.get("Status"))
+        if not delivery_no or not date or not status or not site:
+            continue
+        events.append((site, avo_mat, delivery_no, date, int(qty), status))
+    return events
+
+def _date_key(v):
+    # DB dates come back as date/datetime, batch dates as ISO strings: compare both as text
+    return v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else str(v)
+
+def _coerce_like(value, sample):
+    """Give a batch date the Python type the DB returned for the column, so VALUES compares cleanly."""
+    if isinstance(sample, datetime.datetime):
+        return dtparse(value)
+    if isinstance(sample, datetime.date):
+        return dtparse(value).date()
+    return value
+
+def _load_intransit(conn, keys):
+    """
+    Every InTransit row per (Site, AVOMaterialNo) for all keys, in a single query. All
+    of them, not just the newest: moving the newest row to an earlier event date can
+    make another one the newest for the next event, as LATEST_INTRANSIT_SQL would see it.
+    """
+    if not keys:
+        return {}
+    sites, avos = zip(*sorted(keys))
+    out = {}
+    for r in conn.execute(text(INTRANSIT_BATCH_SQL), {"sites": list(sites), "avos": list(avos)}).mappings():
+        out.setdefault((r["Site"], r["avo_mat"]), []).append({
+            "del_no": r["DeliveryNo"], "qty": _clean_qty(r["Quantity"]), "date": r["Date"],
+            "orig": (r["DeliveryNo"], r["Date"]),
+        })
+    return out
+
+def _replay_delivery_events(events, loaded):
+    """
+    Run the Dispatched / Delivered / InTransit transitions in memory, event by event,
+    each against the key's newest InTransit row at that point (like the row path's
+    LATEST_INTRANSIT_SQL lookup before every event).
+    loaded: {(site, avo_mat): [InTransit rows loaded from the DB]}; rows carry "orig"
+    (DeliveryNo, Date) so they can be matched again when written back.
+    Returns (DB rows that changed as (key, row) pairs, rows to insert).
+    """
+    # every InTransit candidate per key: the loaded rows plus the ones the batch inserts
+    transit = {k: list(rows) for k, rows in loaded.items()}
+    inserts = []
+
+    def newest(key):
+        # ORDER BY "Date" DESC puts NULL dates first; "None" sorts above any ISO date too
+        rows = transit.get(key)
+        return max(rows, key=lambda it: _date_key(it["date"])) if rows else None
+
+    def add_transit(key, del_no, qty, date):
+        it = {"del_no": del_no, "qty": qty, "date": date, "orig": None}
+        transit.setdefault(key, []).append(it)
+        inserts.append({"key": key, "status": "InTransit", "row": it})
+
+    def add_row(key, del_no, qty, date, status):
+        inserts.append({"key": key, "status": status,
+                        "row": {"del_no": del_no, "qty": qty, "date": date}})
+
+    for site, avo_mat, delivery_no, date, qty, status in events:
+        key = (site, avo_mat)
+        if status == "Dispatched":
+            it = newest(key)
+            if it:
+                it.update(qty=it["qty"] + qty, date=date, del_no=delivery_no, touched=True)
+            else:
+                add_transit(key, (delivery_no + "_T")[:30], qty, date)
+            add_row(key, delivery_no, qty, date, "Dispatched")
+        elif status == "Delivered":
+            it = newest(key)
+            if it:
+                it.update(qty=max(0, it["qty"] - qty), date=date, del_no=delivery_no, touched=True)
+            add_row(key, delivery_no, qty, date, "Delivered")
+        elif status == "InTransit":
+            add_transit(key, delivery_no, qty, date)
+        else:
+            add_row(key, delivery_no, qty, date, status)
+
+    updated = [(k, it) for k, rows in loaded.items() for it in rows if it.get("touched")]
+    return updated, inserts
+
+@metrics.stage("delivery.apply")
+def _apply_delivery_batch(conn, df, page_rows=DELIVERY_BULK_PAGE_ROWS):
+    events = _delivery_events(df)
+    # InTransit lines change what "latest" means for later batches, so all keys are locked
+    key_locks.lock_keys(conn, {(e[0], e[1]) for e in events})
+    keys = {(e[0], e[1]) for e in events if e[5] in ("Dispatched", "Delivered")}
+    loaded = _load_intransit(conn, keys)
+    updated, inserts = _replay_delivery_events(events, loaded)
+
+    with conn.connection.cursor() as cur:
+        if updated:
+            values = [
+                (site, avo_mat, it["orig"][0], it["orig"][1], it["del_no"], int(it["qty"]),
+                 _coerce_like(it["date"], it["orig"][1]))
+                for (site, avo_mat), it in updated
+            ]
+            # execute_values sends one statement per page
+            with metrics.db_call(math.ceil(len(values) / page_rows)):
+                execute_values(cur, BULK_MOVE_INTRANSIT_SQL, values, page_size=page_rows)
+        if inserts:
+            values = [
+                (ins["key"][0], ins["key"][1], ins["row"]["del_no"], int(ins["row"]["qty"]),
+                 ins["row"]["date"], ins["status"])
+                for ins in inserts
+            ]
+            # execute_values sends one statement per page
+            with metrics.db_call(math.ceil(len(values) / page_rows)):
+                execute_values(cur, """
+                    INSERT INTO "DeliveryDetails"
+                    ("Site","AVOMaterialNo","DeliveryNo","Quantity","Date","Status")
+                    VALUES %s
+                """, values, page_size=page_rows)
+    stock.refresh(conn, {(e[0], e[1]) for e in events})
+    return len(events)
 
 # -----------------------------------
 # Template Generation Setup
@@ -277,6 +663,52 @@ DELIVERY_NOTES = {
     "Status": "Delivery status (e.g., Delivered / Dispatched / In transit)",
 }
 
+# Customer spellings of the template headers accepted on upload. Matching ignores case,
+# accents, spaces and punctuation, so "Customer Part No." covers "CUSTOMER_PART_NO".
+HEADER_ALIASES = {
+    "edi_template": {
+        "Site": ["Plant", "AVO Site", "Usine"],
+        "ClientCode": ["Customer Code", "Customer", "Client", "Code Client", "Buyer Code"],
+        "ClientMaterialNo": ["Customer Part Number", "Customer Part No", "Customer Material No",
+                             "Client Part Number", "Buyer Part Number", "Ref Client", "Référence Client"],
+        "AVOMaterialNo": ["AVO Part Number", "AVO Part No", "AVO Material", "Supplier Part Number", "Ref AVO"],
+        "DateFrom": ["Delivery Week", "Week", "Due Week", "Semaine"],
+        "DateUntil": ["Delivery Date", "Due Date"],
+        "Quantity": ["Qty", "Requested Quantity", "Quantité", "Qté"],
+        "ForecastDate": ["Forecast Week", "Release Week", "Semaine Prévision"],
+        "LastDeliveryDate": ["Last Delivery Week"],
+        "LastDeliveredQuantity": ["Last Delivered Qty", "Last Delivery Quantity", "Last Delivery Qty"],
+        "CumulatedQuantity": ["Cumulative Quantity", "Cumulated Qty", "Cum Qty", "Cum Quantity"],
+        "EDIStatus": ["Status", "EDI Status", "Release Status"],
+        "ProductName": ["Description", "Product", "Product Description", "Désignation"],
+        "LastDeliveryNo": ["Last Delivery Note", "Last Delivery Number", "Last ASN"],
+    },
+    "delivery_template": {
+        "Site": ["Plant", "Usine"],
+        "AVOMaterialNo": ["AVO Part Number", "AVO Part No", "Part Number", "Reference", "Référence"],
+        "DeliveryNo": ["Delivery Note", "Delivery Number", "Delivery Note No", "BL", "N° BL"],
+        "Quantity": ["Qty", "Delivered Quantity", "Quantité", "Qté"],
+        "Date": ["Delivery Date", "Date Livraison"],
+        "Status": ["Delivery Status", "Statut"],
+    },
+}
+
+EDI_INT_COLUMNS = ["Quantity", "LastDeliveredQuantity", "CumulatedQuantity"]
+# Compiled per file type, for the uploads and the JSON API alike. EDI rows need a
+# site, a customer part number and the two weeks that identify the release (see
+# EDI_NOTES); delivery lines without site, delivery number, date or status would be
+# skipped by _delivery_events, so they are reported instead.
+INGEST_SCHEMAS = {
+    "EDI": ingest_schema.Schema(
+        TEMPLATE_SCHEMAS["edi_template"], aliases=HEADER_ALIASES["edi_template"],
+        required=["Site", "ClientMaterialNo", "DateFrom", "ForecastDate"],
+        weeks=["DateFrom", "ForecastDate", "LastDeliveryDate"], integers=EDI_INT_COLUMNS),
+    "LIVRAISON": ingest_schema.Schema(
+        TEMPLATE_SCHEMAS["delivery_template"], aliases=HEADER_ALIASES["delivery_template"],
+        required=["Site", "DeliveryNo", "Date", "Status"], dates=["Date"], quantities=["Quantity"]),
+}
+INGEST_MAX_REPORTED = 10
+
 def _build_excel_with_notes(headers, notes_map, n_rows=200):
     wb = Workbook()
     ws = wb.active
@@ -301,6 +733,56 @@ def _build_excel_with_notes(headers, notes_map, n_rows=200):
     wb.save(bio)
     bio.seek(0)
     return bio.read()
+
+
+# bump when _build_excel_with_notes or the CSV layout changes
+TEMPLATE_BUILD_VERSION = "1"
+TEMPLATE_MAX_AGE = int(os.getenv("TEMPLATE_MAX_AGE", "3600"))
+TEMPLATE_MIMETYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+# Same in every worker, unlike a build timestamp.
+_TEMPLATES_LAST_MODIFIED = datetime.datetime.fromtimestamp(
+    int(os.path.getmtime(os.path.abspath(__file__))), tz=datetime.timezone.utc)
+_template_cache = {}  # fingerprint -> bytes
+
+
+def _template_notes(name):
+    return EDI_NOTES if name == "edi_template" else DELIVERY_NOTES
+
+
+def _template_fingerprint(name, ext):
+    """Hash of everything a template's bytes depend on; used as cache key and ETag."""
+    spec = [TEMPLATE_BUILD_VERSION, name, ext, TEMPLATE_SCHEMAS[name]]
+    if ext == "xlsx":
+        spec.append(_template_notes(name))
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _template_bytes(name, ext):
+    """(fingerprint, bytes) of a template, built once per schema/notes version."""
+    fp = _template_fingerprint(name, ext)
+    data = _template_cache.get(fp)
+    if data is None:
+        headers = TEMPLATE_SCHEMAS[name]
+        if ext == "csv":
+            buf = io.StringIO()
+            pd.DataFrame(columns=headers).to_csv(buf, index=False)
+            data = buf.getvalue().encode("utf-8-sig")
+        else:
+            data = _build_excel_with_notes(headers, _template_notes(name))
+        _template_cache[fp] = data
+    return fp, data
+
+
+def _warm_templates():
+    for name in TEMPLATE_SCHEMAS:
+        for ext in TEMPLATE_MIMETYPES:
+            _template_bytes(name, ext)
+
+
+_warm_templates()
 # -----------------------
 # Responsive HTML Template
 # -----------------------
@@ -311,57 +793,28 @@ HTML_PAGE = """
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=no">
     <title>Delivery & EDI Management</title>
-    <link rel="icon" href="/static/avo_carbon.jpg" type="image/x-icon">
-    <style>
-      body{font-family:'Arial',sans-serif;background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);margin:0;padding:20px 0;min-height:100vh}
-      .container{background-color:#fff;padding:30px;border-radius:15px;box-shadow:0 15px 35px rgba(0,0,0,.1);text-align:center;width:90%;max-width:1200px;margin:0 auto;overflow:hidden;backdrop-filter:blur(10px);border:1px solid rgba(255,255,255,.2)}
-      .nav-tabs{display:flex;border-bottom:none;margin-bottom:30px;justify-content:center;flex-wrap:wrap;gap:10px;background:#f8f9fa;border-radius:12px;padding:8px}
-      .nav-tab{background:linear-gradient(145deg,#fff,#f0f0f0);border:none;padding:15px 25px;cursor:pointer;font-size:16px;font-weight:600;text-decoration:none;color:#555;border-radius:10px;transition:all .3s ease;display:flex;align-items:center;gap:12px;min-width:200px;justify-content:center;box-shadow:0 2px 4px rgba(0,0,0,.1)}
-      .nav-tab:hover{transform:translateY(-2px);box-shadow:0 8px 20px rgba(0,0,0,.15);color:#333}
-      .nav-tab.active{background:linear-gradient(145deg,#4f46e5,#7c3aed);color:#fff;transform:translateY(-2px);box-shadow:0 8px 25px rgba(79,70,229,.4)}
-      .tab-content{display:none;animation:fadeIn .5s ease-in-out}
-      .tab-content.active{display:block}
-      @keyframes fadeIn{from{opacity:0;transform:translateY(20px)}to{opacity:1;transform:translateY(0)}}
-      h1{color:#1f2937;font-size:28px;margin-bottom:10px;font-weight:700}
-      h2{color:#4f46e5;font-size:22px;margin:30px 0 20px 0;font-weight:600}
-      .subtitle{font-size:16px;color:#6b7280;margin-bottom:30px;font-weight:400}
-      form{display:flex;flex-direction:column;align-items:center;gap:20px;max-width:600px;margin:0 auto}
-      input[type=file],input[type=text],input[type=number],select,input[type=submit],a.download-btn{padding:15px 20px;font-size:16px;border:2px solid #e5e7eb;border-radius:12px;outline:none;transition:all .3s ease;width:100%;max-width:400px;font-family:inherit;background:#fff;box-sizing:border-box}
-      input[type=file]:hover,input[type=text]:hover,input[type=number]:hover,select:hover{border-color:#4f46e5;box-shadow:0 0 0 3px rgba(79,70,229,.1)}
-      input[type=file]:focus,input[type=text]:focus,input[type=number]:focus,select:focus{border-color:#4f46e5;box-shadow:0 0 0 3px rgba(79,70,229,.2)}
-      input[type=submit],a.download-btn{background:linear-gradient(145deg,#4f46e5,#7c3aed);color:#fff;cursor:pointer;border:none;text-decoration:none;display:inline-block;text-align:center;font-weight:600;text-transform:uppercase;letter-spacing:.5px;box-shadow:0 4px 15px rgba(79,70,229,.3)}
-      input[type=submit]:hover,a.download-btn:hover{transform:translateY(-2px);box-shadow:0 8px 25px rgba(79,70,229,.4)}
-      table{width:100%;border-collapse:collapse;margin-top:25px;border-radius:12px;overflow:hidden;box-shadow:0 4px 15px rgba(0,0,0,.1)}
-      table th,table td{border:none;padding:15px;text-align:left}
-      table th{background:linear-gradient(145deg,#4f46e5,#7c3aed);color:#fff;font-weight:600;text-transform:uppercase;letter-spacing:.5px}
-      table tbody tr:nth-child(odd){background-color:#f8f9fa}
-      table tbody tr:hover{background-color:#e5e7eb;transform:scale(1.01);transition:all .2s ease}
-      .scrollable{overflow-x:auto;margin-top:25px;max-height:400px;border-radius:12px}
-      .error-message{color:#dc2626;background:linear-gradient(145deg,#fef2f2,#fee2e2);border:2px solid #fecaca;padding:15px 20px;border-radius:12px;margin:15px auto;font-weight:500;box-shadow:0 4px 10px rgba(220,38,38,.1);max-width:600px}
-      .success-message{color:#059669;background:linear-gradient(145deg,#ecfdf5,#d1fae5);border:2px solid #a7f3d0;padding:15px 20px;border-radius:12px;margin:15px auto;font-weight:500;box-shadow:0 4px 10px rgba(5,150,105,.1);max-width:600px}
-      .action-group{display:flex;flex-direction:column;gap:15px;max-width:400px;margin:25px auto}
-      .secondary-btn{background:linear-gradient(145deg,#059669,#047857);box-shadow:0 4px 15px rgba(5,150,105,.3)}
-      .secondary-btn:hover{box-shadow:0 8px 25px rgba(5,150,105,.4)}
-      footer{margin-top:50px;color:#6b7280;font-size:14px;border-top:1px solid #e5e7eb;padding-top:25px;font-weight:500}
-      .logo{max-width:250px;margin-bottom:25px;filter:drop-shadow(0 4px 8px rgba(0,0,0,0.1))}
-      .template-download-section{animation:slideIn .6s ease-out;margin-bottom:30px;padding:20px;background:linear-gradient(145deg,#f8f9fa,#e9ecef);border-radius:12px;border:2px solid #dee2e6}
-      @keyframes slideIn{from{opacity:0;transform:translateX(-30px)}to{opacity:1;transform:translateX(0)}}
-      .file-type-options{display:flex;gap:15px;justify-content:center;flex-wrap:wrap;margin:25px 0}
-      @media (max-width:768px){.container{margin:10px;width:calc(100% - 20px);padding:20px}.nav-tabs{flex-direction:column}.nav-tab{min-width:auto;width:100%}}
-    </style>
+    <link rel="icon" href="{{ asset_url('avo_carbon.jpg') }}" type="image/x-icon">
+    <link rel="stylesheet" href="{{ asset_url('app.css') }}">
   </head>
   <body>
     <div class="container">
-    <img src="/static/logo-avocarbon.png" alt="AvoCarbon Logo" class="logo">      
+    <img src="{{ asset_url('logo-avocarbon.png') }}" alt="AvoCarbon Logo" class="logo">      
       <div class="nav-tabs">
         <a href="#" class="nav-tab" onclick="showTab('deliveries')" id="deliveries-tab">🚚 Delivery Management</a>
         <a href="#" class="nav-tab" onclick="showTab('edi')" id="edi-tab">📋 EDI Processing</a>
+        <a href="#" class="nav-tab" onclick="showTab('stock')" id="stock-tab">📦 Stock Position</a>
       </div>
 
       <div id="deliveries-content" class="tab-content">
         {% if deliv_msg %}
           <div class="{{ 'success-message' if deliv_ok else 'error-message' }}">{{ deliv_msg }}</div>
         {% endif %}
+        {% if job_id and active_tab == 'deliveries' %}
+          <div id="job-status" class="job-status info-message" data-job="{{ job_id }}">⏳ Sending to database…</div>
+        {% endif %}
+        {% if parse_job_id and active_tab == 'deliveries' %}
+          <div class="job-status info-message" data-job="{{ parse_job_id }}">⏳ Showing the first {{ preview_rows }} rows, parsing the rest of the file…</div>
+        {% endif %}
         
         <h1>Delivery Management System</h1>
         <p class="subtitle">Download the template, fill it with your data, and upload for processing</p>
@@ -379,7 +832,18 @@ HTML_PAGE = """
           <input type="hidden" name="file_type" value="LIVRAISON">
           <input type="submit" value="Preview Delivery File">
         </form>
+        <form action="/preview/batch" method="post" enctype="multipart/form-data" class="batch-form">
+          <input type="file" name="files" accept=".csv,.xlsx,.xls,.pdf,.zip" multiple required>
+          <input type="hidden" name="file_type" value="LIVRAISON">
+          <input type="submit" value="Preview Several Files / ZIP">
+        </form>
 
+        {% if batch_html and file_type == 'LIVRAISON' %}
+            <div class="scrollable">
+                <h2>Files</h2>
+                {{ batch_html|safe }}
+            </div>
+        {% endif %}
         {% if table_html and file_type == 'LIVRAISON' %}
             {% if pdf_file %}
                 <h2>PDF Preview</h2>
@@ -391,11 +855,13 @@ HTML_PAGE = """
                 <h2>Delivery Data Preview</h2>
                 <p class="subtitle">Please review the data below before processing.</p>
                 {{ table_html|safe }}
+                {% if page_token %}<button type="button" class="load-more" data-token="{{ page_token }}" data-offset="{{ preview_rows }}">Show more rows</button>{% endif %}
             </div>
             <div class="action-group">
-                <form action="/insert" method="post">
-                <input type="hidden" name="temp_file" value="{{ temp_file }}">
+                <form action="{{ '/insert/batch' if batch_tokens else '/insert' }}" method="post">
+                {% for t in batch_tokens or [token] %}<input type="hidden" name="token" value="{{ t }}">{% endfor %}
                 <input type="hidden" name="file_type" value="LIVRAISON">
+                {% if known_batch or parse_job_id %}<label class="force-label"{% if not known_batch %} hidden{% endif %}><input type="checkbox" name="force" value="1"> Import again</label>{% endif %}
                 <input type="submit" value="✅ Confirm & Send to Database" class="download-btn secondary-btn">
                 </form>
                 <a href="/" class="download-btn" style="background: linear-gradient(145deg, #f59e0b, #d97706);">✏️ Upload New File</a>
@@ -408,6 +874,12 @@ HTML_PAGE = """
         {% if edi_msg %}
           <div class="{{ 'success-message' if edi_ok else 'error-message' }}">{{ edi_msg }}</div>
         {% endif %}
+        {% if job_id and active_tab == 'edi' %}
+          <div id="job-status" class="job-status info-message" data-job="{{ job_id }}">⏳ Sending to database…</div>
+        {% endif %}
+        {% if parse_job_id and active_tab == 'edi' %}
+          <div class="job-status info-message" data-job="{{ parse_job_id }}">⏳ Showing the first {{ preview_rows }} rows, parsing the rest of the file…</div>
+        {% endif %}
         
         <h1>EDI Processing Center</h1>
         <p class="subtitle">Download the template, fill it with your data, and upload for processing</p>
@@ -425,18 +897,31 @@ HTML_PAGE = """
             <input type="hidden" name="file_type" value="EDI">
             <input type="submit" value="Preview EDI File">
         </form>
+        <form action="/preview/batch" method="post" enctype="multipart/form-data" class="batch-form">
+            <input type="file" name="files" accept=".csv,.xlsx,.xls,.zip" multiple required>
+            <input type="hidden" name="file_type" value="EDI">
+            <input type="submit" value="Preview Several Files / ZIP">
+        </form>
 
 
+        {% if batch_html and file_type == 'EDI' %}
+        <div class="scrollable">
+          <h2>Files</h2>
+          {{ batch_html|safe }}
+        </div>
+        {% endif %}
         {% if table_html and file_type == 'EDI' %}
         <div class="scrollable">
           <h2>EDI Data Preview</h2>
           <p class="subtitle">Please review the data below before sending to database.</p>
           {{ table_html|safe }}
+          {% if page_token %}<button type="button" class="load-more" data-token="{{ page_token }}" data-offset="{{ preview_rows }}">Show more rows</button>{% endif %}
         </div>
         <div class="action-group">
-          <form action="/insert" method="post">
-            <input type="hidden" name="temp_file" value="{{ temp_file }}">
+          <form action="{{ '/insert/batch' if batch_tokens else '/insert' }}" method="post">
+            {% for t in batch_tokens or [token] %}<input type="hidden" name="token" value="{{ t }}">{% endfor %}
             <input type="hidden" name="file_type" value="EDI">
+            {% if known_batch or parse_job_id %}<label class="force-label"{% if not known_batch %} hidden{% endif %}><input type="checkbox" name="force" value="1"> Import again</label>{% endif %}
             <input type="submit" value="✅ Confirm & Send to Database" class="download-btn secondary-btn">
           </form>
           <a href="/" class="download-btn" style="background: linear-gradient(145deg, #f59e0b, #d97706);">✏️ Upload New File</a>
@@ -444,6 +929,24 @@ HTML_PAGE = """
         {% endif %}
       </div>
 
+      <div id="stock-content" class="tab-content">
+        <h1>Stock Position</h1>
+        <p class="subtitle">InTransit, dispatched and delivered quantities per part, next to the latest EDI forecast</p>
+        <form id="stock-filter" class="stock-filter">
+          <input type="text" name="site" placeholder="Site">
+          <input type="text" name="avo" placeholder="AVO part number starts with…">
+          <input type="submit" value="Search">
+        </form>
+        <div id="stock-status" class="subtitle"></div>
+        <div class="scrollable">
+          <table id="stock-table">
+            <thead><tr><th>Site</th><th>AVO Material No</th><th>In transit</th><th>Dispatched</th><th>Delivered</th><th>Last movement</th><th>Forecast week</th><th>Forecast qty</th></tr></thead>
+            <tbody></tbody>
+          </table>
+        </div>
+        <button type="button" class="load-more" id="stock-more" hidden>Show more rows</button>
+      </div>
+
       <footer>
         &copy; 2025 Delivery & EDI Management System. All rights reserved. Powered by STS AI Team
       </footer>
@@ -458,13 +961,106 @@ HTML_PAGE = """
         document.getElementById(tabName + '-tab').classList.add('active');
         
         sessionStorage.setItem('activeTab', tabName);
+        if (tabName === 'stock' && !stockLoaded) loadStock(true);
+      }
+
+      let stockLoaded = false;
+      let stockOffset = 0;
+      function loadStock(reset) {
+        stockLoaded = true;
+        const form = document.getElementById('stock-filter');
+        const status = document.getElementById('stock-status');
+        const more = document.getElementById('stock-more');
+        const tbody = document.querySelector('#stock-table tbody');
+        if (reset) stockOffset = 0;
+        const params = new URLSearchParams({site: form.site.value, avo: form.avo.value, limit: 100, offset: stockOffset});
+        status.textContent = '⏳ Loading…';
+        fetch('/api/stock?' + params)
+          .then(r => r.json().then(page => [r.status, page]))
+          .then(([code, page]) => {
+            if (code !== 200) {
+              status.textContent = page.error || 'Could not load the stock position';
+              return;
+            }
+            if (reset) tbody.innerHTML = '';
+            page.rows.forEach(row => {
+              const tr = tbody.insertRow();
+              ['Site', 'AVOMaterialNo', 'InTransitQty', 'DispatchedQty', 'DeliveredQty',
+               'LastMovement', 'ForecastWeek', 'ForecastQty'].forEach(k => {
+                tr.insertCell().textContent = row[k] === null ? '' : row[k];
+              });
+            });
+            stockOffset += page.rows.length;
+            status.textContent = page.total ? stockOffset + ' of ' + page.total + ' parts' : 'No stock rows match.';
+            more.hidden = stockOffset >= page.total;
+          })
+          .catch(() => { status.textContent = 'Could not load the stock position'; });
       }
       
+      function pollJob(box) {
+        fetch('/jobs/' + box.dataset.job)
+          .then(r => r.json())
+          .then(job => {
+            if (job.state === 'done') {
+              box.className = 'job-status ' + (job.result && job.result.known ? 'error-message' : 'success-message');
+              box.textContent = job.message;
+              if (job.result && job.result.known) {
+                document.querySelectorAll('.force-label').forEach(el => { el.hidden = false; });
+              }
+            } else if (job.state === 'failed') {
+              box.className = 'job-status error-message';
+              box.textContent = (job.kind === 'parse' ? 'Error processing file: ' : 'Error during database insertion: ') + job.error;
+            } else {
+              if (job.kind !== 'parse') {
+                box.textContent = (job.state === 'queued' ? '⏳ Queued…' : '⏳ Sending to database…') +
+                  (job.rows_processed ? ' ' + job.rows_processed + ' rows processed' : '');
+              }
+              setTimeout(() => pollJob(box), 1500);
+            }
+          })
+          .catch(() => setTimeout(() => pollJob(box), 3000));
+      }
+
+      function loadMore(btn) {
+        fetch('/preview/rows/' + btn.dataset.token + '?offset=' + btn.dataset.offset + '&limit=50')
+          .then(r => r.json().then(page => [r.status, page]))
+          .then(([status, page]) => {
+            if (status === 202) {
+              btn.textContent = '⏳ Still parsing… click again in a moment';
+              return;
+            }
+            if (status !== 200) {
+              btn.textContent = page.error || 'Could not load more rows';
+              btn.disabled = true;
+              return;
+            }
+            const table = btn.parentElement.querySelector('table');
+            const tbody = table.tBodies[0] || table.createTBody();
+            page.data.forEach(row => {
+              const tr = tbody.insertRow();
+              row.forEach(v => { tr.insertCell().textContent = v === null ? 'NaN' : v; });
+            });
+            const shown = page.offset + page.data.length;
+            btn.dataset.offset = shown;
+            if (shown >= page.total) {
+              btn.textContent = 'All ' + page.total + ' rows shown';
+              btn.disabled = true;
+            } else {
+              btn.textContent = 'Show more rows (' + shown + ' / ' + page.total + ')';
+            }
+          });
+      }
+
       document.addEventListener('DOMContentLoaded', function() {
         const initialTab = '{{ active_tab | default("deliveries") }}';
         showTab(initialTab);
+
+        document.querySelectorAll('.job-status[data-job]').forEach(pollJob);
+        document.querySelectorAll('button.load-more[data-token]').forEach(btn => btn.addEventListener('click', () => loadMore(btn)));
+        document.getElementById('stock-more').addEventListener('click', () => loadStock(false));
+        document.getElementById('stock-filter').addEventListener('submit', e => { e.preventDefault(); loadStock(true); });
         
-        document.querySelectorAll('form').forEach(form => {
+        document.querySelectorAll('form:not(#stock-filter)').forEach(form => {
             form.addEventListener('submit', function() {
                 const submitBtn = form.querySelector('input[type="submit"]');
                 if (submitBtn) {
@@ -479,84 +1075,342 @@ HTML_PAGE = """
 </html>
 """
 
+# Compiled once; render_template accepts the Template object and still applies context processors
+PAGE_TEMPLATE = app.jinja_env.from_string(HTML_PAGE)
+assets = AssetManifest(app.static_folder)
+assets.warm()
+app.jinja_env.globals["asset_url"] = assets.url
+
+
 # -----------------------
 # Flask Routes
 # -----------------------
+@app.route("/assets/<name>")
+def static_asset(name):
+    return assets.response(name)
+
+
 @app.route("/")
 def index():
-    return render_template_string(HTML_PAGE, active_tab='deliveries')
+    return render_template(PAGE_TEMPLATE, active_tab='deliveries')
+
+
+def _dates_as_text(df):
+    """Datetime columns as the text the old CSV staging gave ('YYYY-MM-DD' when there is no time part)."""
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            d = s.dropna()
+            fmt = "%Y-%m-%d" if (d == d.dt.normalize()).all() else "%Y-%m-%d %H:%M:%S"
+            df[c] = s.dt.strftime(fmt)
+    return df
+
+
+@metrics.stage("normalize.delivery")
+def _normalize_delivery_frame(df):
+    """
+    Clean a delivery frame for insert_deliverydetails and pre-aggregate duplicate
+    (Site, AVOMaterialNo, DeliveryNo, Date, Status) lines. Returns (frame, lines read).
+    """
+    df = _dates_as_text(df)
+    # Normalize expected columns
+    for col in ["Site","AVOMaterialNo","DeliveryNo","Date","Status"]:
+        if col not in df.columns:
+            df[col] = ""
+        df[col] = safestr_series(df[col])
+    df["AVOMaterialNo"] = normalize_avo_ref_series(df["AVOMaterialNo"])
+    # Quantity as clean int
+    if "Quantity" not in df.columns:
+        df["Quantity"] = 0
+    df["Quantity"] = clean_qty_series(df["Quantity"])
+
+    # Status normalization
+    df["Status"] = norm_status_series(df["Status"])
+
+    # ---- NEW: pre-aggregate duplicates (same Site/AVO/Delivery/Date/Status) ----
+    key_cols = ["Site","AVOMaterialNo","DeliveryNo","Date","Status"]
+    pre_count = len(df)
+    df = (df.groupby(key_cols, as_index=False)["Quantity"].sum())
+    # Optional: drop zeros
+    df = df[df["Quantity"] != 0]
+    return df, pre_count
+
+
+def _usecols(file_type):
+    schema = INGEST_SCHEMAS.get(file_type)
+    return schema.accepts if schema else None
+
+
+@metrics.stage("normalize.schema")
+def _conform_upload(df, file_type, first_row=2):
+    """
+    Uploaded frame through its INGEST_SCHEMAS entry: headers mapped to the template,
+    weeks / dates / numbers coerced, invalid rows split off (ingest_schema.Conformed).
+    Raises ValueError for an unknown file type or a missing required column.
+    """
+    schema = INGEST_SCHEMAS.get(file_type)
+    if schema is None:
+        raise ValueError("Unknown file type specified.")
+    return schema.apply(df, first_row)
+
+
+def _ingest_notes(rejected, missing=(), total=None):
+    """What the schema left out of an upload, for the user ('' when nothing). total: rows rejected."""
+    notes = []
+    total = len(rejected) if total is None else total
+    if total:
+        shown = "; ".join(f"row {n}: {msg}" for n, msg in rejected[:INGEST_MAX_REPORTED])
+        more = total - min(len(rejected), INGEST_MAX_REPORTED)
+        notes.append(f"⚠️ {total} invalid row(s) left out ({shown}{f'; {more} more' if more > 0 else ''}).")
+    if missing:
+        notes.append(f"Not in the file, left empty: {', '.join(missing)}.")
+    return " ".join(notes)
+
+
+def _delivery_file_keys(path, ext, chunk_rows):
+    """
+    Every (Site, AVOMaterialNo) of a delivery upload, normalized as _normalize_delivery_frame
+    does. A first pass over the file that reads those two columns only.
+    """
+    schema = INGEST_SCHEMAS["LIVRAISON"]
+    keys = set()
+    usecols = lambda h: schema.column_of(h) in ("Site", "AVOMaterialNo")  # noqa: E731
+    for chunk in iter_upload_chunks(path, ext, chunk_rows=chunk_rows, usecols=usecols):
+        layout = schema.layout(tuple(chunk.columns))
+        chunk = chunk[list(layout.columns)].rename(columns=layout.rename)
+        site = safestr_series(chunk["Site"]) if "Site" in chunk.columns else pd.Series("", index=chunk.index)
+        avo = (normalize_avo_ref_series(safestr_series(chunk["AVOMaterialNo"]))
+               if "AVOMaterialNo" in chunk.columns else pd.Series("", index=chunk.index))
+        keys.update(zip(site, avo))
+    return keys
+
+
+def insert_upload_streamed(path, ext, file_type, *, chunk_rows=None, commit_per_chunk=None, on_chunk=None,
+                           batch_key=None, force=False, file_name=None):
+    """
+    Read a large upload chunk by chunk and insert each chunk as soon as it is normalized,
+    so memory stays bounded by chunk_rows. By default the whole file is one transaction;
+    commit_per_chunk=True commits after every chunk (a failure keeps the chunks already done).
+    A single-transaction delivery import reads the file twice: first its keys, to lock
+    them all up front (_delivery_file_keys), then the chunks.
+    Delivery duplicates are pre-aggregated within a chunk only; quantities end up the same.
+    on_chunk(lines, written) is called with the running totals after every chunk.
+    batch_key / force / file_name: ingestion ledger, as for insert_ediglobal.
+    Every chunk goes through _conform_upload first; its invalid rows are left out
+    before the chunk reaches the database and collected in rejected.
+    Returns (lines read, rows written, rejected), rejected being
+    {"count", "rows": the first INGEST_MAX_REPORTED (row, message), "missing"}.
+    """
+    if not engine:
+        raise ConnectionError("Database engine is not available.")
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    commit_per_chunk = STREAM_COMMIT_PER_CHUNK if commit_per_chunk is None else commit_per_chunk
+
+    rejected = {"count": 0, "rows": [], "missing": ()}
+
+    def load(conn, chunk):
+        conformed = _conform_upload(chunk, file_type, first_row=2 + lines)
+        rejected["count"] += len(conformed.rejected)
+        rejected["rows"] += conformed.rejected[:INGEST_MAX_REPORTED - len(rejected["rows"])]
+        rejected["missing"] = conformed.missing
+        n_read, chunk = len(chunk), conformed.frame
+        if chunk.empty:
+            return n_read, 0
+        if file_type == "EDI" and EDI_INSERT_MODE == "merge":
+            counts = _merge_ediglobal(conn, chunk)
+            return n_read, counts["inserted"] + counts["updated"]
+        if file_type == "EDI":
+            return n_read, _copy_ediglobal(conn, chunk)
+        norm, _ = _normalize_delivery_frame(chunk)
+        _apply_delivery_batch(conn, norm)
+        return n_read, len(norm)
+
+    lines = written = 0
+    chunks = iter_upload_chunks(path, ext, chunk_rows=chunk_rows, usecols=_usecols(file_type))
+    if commit_per_chunk:
+        # one connection for the whole import: it holds the ledger claim across the commits
+        with engine.connect() as conn, (ledger.held(conn, batch_key, force=force) if batch_key
+                                        else contextlib.nullcontext()):
+            for chunk in chunks:
+                with conn.begin():
+                    n_in, n_out = load(conn, chunk)
+                lines += n_in
+                written += n_out
+                if on_chunk:
+                    on_chunk(lines, written)
+            if batch_key:
+                with conn.begin():
+                    ledger.record(conn, batch_key, file_type, written, file_name)
+    else:
+        with engine.begin() as conn:
+            if batch_key:
+                ledger.claim(conn, batch_key, force=force)
+            if file_type == "LIVRAISON":
+                # the keys of the whole file in one sorted call: locking them chunk by chunk
+                # in one transaction can deadlock with another stream of overlapping keys
+                key_locks.lock_keys(conn, _delivery_file_keys(path, ext, chunk_rows))
+            for chunk in chunks:
+                n_in, n_out = load(conn, chunk)
+                lines += n_in
+                written += n_out
+                if on_chunk:
+                    on_chunk(lines, written)
+            if batch_key:
+                ledger.record(conn, batch_key, file_type, written, file_name)
+    return lines, written, rejected
+
+
+@metrics.stage("ledger.hash")
+def _batch_key(df, file_type):
+    """Ledger key of a parsed upload: content hash of the rows as they will be written."""
+    if file_type == "EDI":
+        return ledger.frame_key(_edi_frame(df), file_type)
+    norm, _ = _normalize_delivery_frame(df.copy())
+    return ledger.frame_key(norm, file_type)
+
+
+@metrics.stage("ledger.lookup")
+def _known_batch(batch_key):
+    """Ledger entry for batch_key, or None (also when the database cannot be reached)."""
+    try:
+        with engine.begin() as conn:
+            return ledger.lookup(conn, batch_key)
+    except Exception as e:
+        print(f"Ingestion ledger lookup failed: {e}")
+        return None
+
+
+def _already_imported_msg(entry):
+    return (f"This file was already imported on {entry['IngestedAt']:%Y-%m-%d %H:%M} "
+            f"({entry['RowCount']} rows).")
+
+
+def _run_insert(token, file_type, progress, force=False):
+    """Body of an /insert job: load the staged batch, write it, return the user message."""
+    try:
+        with temp_store.hold(token), metrics.batch(file_type) as batch:
+            _wait_staged(token)
+            meta = staging.meta(token)
+            ledger_args = {"batch_key": meta.get("batch_key"), "force": force, "file_name": meta.get("file_name")}
+            upload = staging.upload_path(token)
+            if upload:
+                # Large upload staged as-is: stream it into the database chunk by chunk.
+                lines, written, rejected = insert_upload_streamed(
+                    upload, meta.get("ext", ""), file_type,
+                    on_chunk=lambda lines, written: progress(lines), **ledger_args)
+                progress(lines)
+                batch["rows"] = lines
+                notes = _ingest_notes(rejected["rows"], rejected["missing"], total=rejected["count"])
+                if file_type == "EDI" and EDI_INSERT_MODE == "merge":
+                    msg = f"✅ EDI data merged successfully: {written} rows added or updated (from {lines} lines)."
+                elif file_type == "EDI":
+                    msg = f"✅ EDI data inserted successfully: {written} rows added."
+                else:
+                    msg = f"✅ Delivery data inserted successfully: {written} rows (aggregated from {lines} lines)."
+                return f"{msg} {notes}".rstrip()
+
+            # Typed frame exactly as /preview parsed it (memory-mapped, no re-parse).
+            with metrics.stage("insert.load"):
+                df = staging.load(token)
+            batch["rows"] = len(df)
+
+            if file_type == "EDI" and EDI_INSERT_MODE == "merge":
+                counts = merge_ediglobal(df, **ledger_args)
+                progress(len(df))
+                return (f"✅ EDI data merged successfully: {counts['inserted']} new, {counts['updated']} updated, "
+                        f"{counts['unchanged']} unchanged.")
+
+            if file_type == "EDI":
+                insert_ediglobal(df, **ledger_args)
+                progress(len(df))
+                return f"✅ EDI data inserted successfully: {len(df)} rows added."
+
+            elif file_type == "LIVRAISON":
+                df, pre_count = _normalize_delivery_frame(df)
+                post_count = len(df)
+
+                # Insert with sum-aware logic (your updated insert_deliverydetails with _upsert_sum_delivery)
+                insert_deliverydetails(df, **ledger_args)
+                progress(pre_count)
+                return f"✅ Delivery data inserted successfully: {post_count} rows (aggregated from {pre_count} lines)."
+
+            else:
+                raise ValueError("Unknown file type specified.")
+    except ledger.AlreadyIngested as e:
+        return f"⏭️ Skipped: {_already_imported_msg(e.entry)} Nothing was written; tick “Import again” to force it."
+    finally:
+        staging.discard(token)
+        temp_store.release(token)  # the original upload (and anything else the token owns)
 
 
 @app.route("/insert", methods=["POST"])
 def insert():
-    temp_file = request.form.get("temp_file")
+    token = request.form.get("token")
     file_type = request.form.get("file_type")
     active_tab = 'edi' if file_type == 'EDI' else 'deliveries'
 
-    if not temp_file:
+    if not token:
         error_msg = "Temporary file is missing. Please try again."
-        return render_template_string(HTML_PAGE, active_tab=active_tab,
+        return render_template(PAGE_TEMPLATE, active_tab=active_tab,
                                       edi_msg=error_msg, edi_ok=False, deliv_msg=error_msg, deliv_ok=False)
 
-    path = os.path.join(OUTPUT_DIR, secure_filename(temp_file))
-
-    if not os.path.exists(path):
+    if not staging.exists(token):
         error_msg = "Temporary file not found. It may have expired. Please upload again."
-        return render_template_string(HTML_PAGE, active_tab=active_tab,
+        return render_template(PAGE_TEMPLATE, active_tab=active_tab,
                                       edi_msg=error_msg, edi_ok=False, deliv_msg=error_msg, deliv_ok=False)
 
-    try:
-        # Read everything as strings to avoid NaN/float issues.
-        df = pd.read_csv(path, dtype=str, keep_default_na=False, na_filter=False)
-
-        if file_type == "EDI":
-            insert_ediglobal(df)
-            success_msg = f"✅ EDI data inserted successfully: {len(df)} rows added."
-            return render_template_string(HTML_PAGE, active_tab=active_tab, edi_msg=success_msg, edi_ok=True)
-
-        elif file_type == "LIVRAISON":
-            # Normalize expected columns
-            for col in ["Site","AVOMaterialNo","DeliveryNo","Date","Status"]:
-                if col not in df.columns:
-                    df[col] = ""
-                df[col] = df[col].map(_safestr)
-            df["AVOMaterialNo"] = df.apply(
-                    lambda r: _normalize_avo_ref(r.get("AVOMaterialNo"), None),
-                    axis=1
-                )
-            # Quantity as clean int
-            if "Quantity" not in df.columns:
-                df["Quantity"] = 0
-            df["Quantity"] = df["Quantity"].apply(_clean_qty).astype(int)
-
-            # Status normalization
-            df["Status"] = df["Status"].apply(_norm_status)
-
-            # ---- NEW: pre-aggregate duplicates (same Site/AVO/Delivery/Date/Status) ----
-            key_cols = ["Site","AVOMaterialNo","DeliveryNo","Date","Status"]
-            pre_count = len(df)
-            df = (df.groupby(key_cols, as_index=False)["Quantity"].sum())
-            # Optional: drop zeros
-            df = df[df["Quantity"] != 0]
-            post_count = len(df)
+    # The database work runs in the background; the page polls /jobs/<id>.
+    job_id = insert_jobs.submit(_run_insert, token, file_type, kind=file_type,
+                                force=request.form.get("force") == "1")
+    return render_template(PAGE_TEMPLATE, active_tab=active_tab, job_id=job_id)
+
+
+def _run_insert_batch(tokens, file_type, progress, force=False):
+    """One /insert per staged file, each in its own transaction; a failing file does not stop the rest."""
+    done = {"rows": 0}
+    lines = []
+    for token in tokens:
+        try:
+            name = staging.meta(token).get("file_name") or token
+        except KeyError:
+            lines.append(f"{token}: ❌ staged file not found, please upload again.")
+            continue
+
+        def file_progress(rows, message=None, base=done["rows"]):
+            done["rows"] = base + rows
+            progress(done["rows"], message)
+
+        try:
+            msg = _run_insert(token, file_type, file_progress, force=force)
+        except Exception as e:
+            msg = f"❌ Error during database insertion: {e}"
+        lines.append(f"{name}: {msg}")
+    return "\n".join(lines)
+
+
+@app.route("/insert/batch", methods=["POST"])
+def insert_batch():
+    tokens = request.form.getlist("token")
+    file_type = request.form.get("file_type")
+    active_tab = 'edi' if file_type == 'EDI' else 'deliveries'
 
-            # Insert with sum-aware logic (your updated insert_deliverydetails with _upsert_sum_delivery)
-            insert_deliverydetails(df)
+    tokens = [t for t in tokens if staging.exists(t)]
+    if not tokens:
+        error_msg = "Temporary files not found. They may have expired. Please upload again."
+        return render_template(PAGE_TEMPLATE, active_tab=active_tab,
+                                      edi_msg=error_msg, edi_ok=False, deliv_msg=error_msg, deliv_ok=False)
 
-            success_msg = f"✅ Delivery data inserted successfully: {post_count} rows (aggregated from {pre_count} lines)."
-            return render_template_string(HTML_PAGE, active_tab=active_tab, deliv_msg=success_msg, deliv_ok=True)
+    job_id = insert_jobs.submit(_run_insert_batch, tokens, file_type, kind=f"{file_type}-batch",
+                                force=request.form.get("force") == "1")
+    return render_template(PAGE_TEMPLATE, active_tab=active_tab, job_id=job_id)
 
-        else:
-            raise ValueError("Unknown file type specified.")
 
-    except Exception as e:
-        error_msg = f"Error during database insertion: {e}"
-        return render_template_string(HTML_PAGE, active_tab=active_tab,
-                                      edi_msg=error_msg if active_tab == "edi" else None, edi_ok=False,
-                                      deliv_msg=error_msg if active_tab == "deliveries" else None, deliv_ok=False)
-    finally:
-        if os.path.exists(path):
-            os.remove(path)  # Clean up the temp file
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    try:
+        return jsonify(insert_jobs.status(job_id))
+    except KeyError:
+        abort(404, description="Unknown job")
 
 
 @app.route("/download/template/<name>.<ext>")
@@ -564,27 +1418,107 @@ def download_template(name, ext):
     headers = TEMPLATE_SCHEMAS.get(name)
     if not headers:
         abort(404, description="Unknown template name")
+    if ext not in TEMPLATE_MIMETYPES:
+        abort(404, description="Unsupported file extension")
 
-    if ext == "csv":
-        buf = io.StringIO()
-        pd.DataFrame(columns=headers).to_csv(buf, index=False)
-        data = buf.getvalue().encode("utf-8-sig")
-        return Response(data, mimetype="text/csv", headers={"Content-Disposition": f'attachment; filename="{name}.csv"'})
+    etag, data = _template_bytes(name, ext)
+    resp = Response(data, mimetype=TEMPLATE_MIMETYPES[ext],
+                    headers={"Content-Disposition": f'attachment; filename="{name}.{ext}"'})
+    resp.set_etag(etag)
+    resp.last_modified = _TEMPLATES_LAST_MODIFIED
+    resp.cache_control.public = True
+    resp.cache_control.max_age = TEMPLATE_MAX_AGE
+    # 304 Not Modified on If-None-Match / If-Modified-Since
+    return resp.make_conditional(request)
 
-    if ext == "xlsx":
-        notes_map = EDI_NOTES if name == "edi_template" else DELIVERY_NOTES
-        excel_bytes = _build_excel_with_notes(headers, notes_map)
-        return Response(excel_bytes, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        headers={"Content-Disposition": f'attachment; filename="{name}.xlsx"'})
 
-    abort(404, description="Unsupported file extension")
 
+@app.route("/db-pool/stats")
+def db_pool_stats():
+    if not isinstance(engine, LazyEngine):
+        return jsonify({})
+    return jsonify(engine.pool_stats())
 
 
-def parse_delivery_pdf_bytes(pdf_bytes: bytes, *, default_site: str = "Tunisia") -> pd.DataFrame:
-    import io, re, pdfplumber, pandas as pd
-    from dateutil.parser import parse as dtparse
+# -----------------------
+# Delivery PDF parsing
+# -----------------------
+# PDF_PARSE_WORKERS > 1 spreads pages (and files of a batch) over a process pool
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "1"))
+_pdf_pools = {}  # workers -> ProcessPoolExecutor, created on first parallel parse
+_pdf_pools_lock = threading.Lock()
+
+# bump whenever the rows produced for a given PDF change, so cached parses are not reused
+PDF_PARSER_VERSION = "3"
+pdf_parse_cache = ParseCache(
+    os.path.join(OUTPUT_DIR, "pdf_cache"),
+    max_entries=int(os.getenv("PDF_CACHE_MEM_ENTRIES", "32")),
+    max_bytes=int(os.getenv("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    max_age=float(os.getenv("PDF_CACHE_MAX_AGE_HOURS", "168")) * 3600,
+)
 
+_PDF_HEADER_NO_PAT   = re.compile(r"FACTURE\s*n[°o]\s*([A-Za-z0-9\-_/]+)", re.IGNORECASE)
+_PDF_HEADER_DATE_PAT = re.compile(r"\bDate\s+(\d{1,2}/\d{1,2}/\d{4})\b", re.IGNORECASE)
+_PDF_ANY_DATE_PAT    = re.compile(r"\b(\d{1,2}/\d{1,2}/\d{4})\b")
+_PDF_SITE_PAT        = re.compile(r"\bAVOCARBON[^\n]*", re.IGNORECASE)
+_PDF_TOTAL_ROW_PAT   = re.compile(r"^\s*TOTAL\b", re.IGNORECASE)
+_PDF_HEADER_REF      = re.compile(r"\bREFERENCE\b|\bREFERENCE\s+ARTICLE\b|\bREF\b", re.IGNORECASE)
+_PDF_HEADER_QTY      = re.compile(r"\bQUANTITE\b|\bQTE\b|\bQTY\b", re.IGNORECASE)
+_PDF_MATERIAL_PAT    = re.compile(r"^[A-Za-z0-9][A-Za-z0-9.\-_/]*[A-Za-z0-9]$")
+_PDF_QTY_PAT         = re.compile(r"^-?\d+(?:\.\d+)?$")
+# fallback line parser:
+# ex line: "85030010 OUI V502.730 SP PPC 11TA ... 960 1,9672 0,3262 ..."
+# capture ref (V502.730) and the quantity (960) that appears BEFORE 2–4 decimal numbers
+_PDF_LINE_PAT = re.compile(
+    r"^\s*\d{8}\s+(?:OUI|NON)\s+([A-Z0-9][A-Z0-9.\-]+)(?:\s+(PL|SP))?\s+.+?\s+(\d{1,9})\s+(?:\d+[.,]\d+\s+){2,4}\S+",
+    re.IGNORECASE
+)
+
+
+def _get_pdf_pool(workers):
+    # one pool per size: /preview and /preview/batch may ask for different sizes concurrently
+    with _pdf_pools_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            pool = _pdf_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+@metrics.stage("pdf.extract")
+def _extract_pdf_batch(files, workers):
+    """
+    Extract every page of every file (path or bytes) once. Returns, per file,
+    (metadata, [(tables, text)] by page). With workers > 1 the pages are cut into
+    contiguous chunks and sent to the process pool; results are put back in
+    file/page order so parsing stays deterministic.
+    """
+    infos = [pdf_info(src) for src in files]
+    if workers <= 1:
+        return [(meta, [(t, txt) for _, t, txt in extract_pages(src, range(n))])
+                for src, (n, meta) in zip(files, infos)]
+
+    total_pages = sum(n for n, _ in infos)
+    chunk = max(1, math.ceil(total_pages / (workers * 2)))
+    pool = _get_pdf_pool(workers)
+    futures = []
+    try:
+        for fi, (src, (n, _)) in enumerate(zip(files, infos)):
+            for start in range(0, n, chunk):
+                futures.append((fi, pool.submit(extract_pages, src, range(start, min(n, start + chunk)))))
+        pages = [dict() for _ in files]
+        for fi, fut in futures:
+            for page_no, tables, text in fut.result():
+                pages[fi][page_no] = (tables, text)
+    except BrokenProcessPool:
+        with _pdf_pools_lock:
+            if _pdf_pools.get(workers) is pool:
+                del _pdf_pools[workers]
+        raise
+    return [(meta, [pages[fi][i] for i in range(n)]) for fi, (n, meta) in enumerate(infos)]
+
+
+@metrics.stage("pdf.rows")
+def _delivery_rows_from_pages(meta, pages, default_site):
     delivery_no = None
     doc_date_iso = None
     detected_site = None
@@ -601,136 +1535,90 @@ def parse_delivery_pdf_bytes(pdf_bytes: bytes, *, default_site: str = "Tunisia")
             "Status": "Dispatched",
         })
 
-    # patterns
-    header_no_pat   = re.compile(r"FACTURE\s*n[°o]\s*([A-Za-z0-9\-_/]+)", re.IGNORECASE)
-    header_date_pat = re.compile(r"\bDate\s+(\d{1,2}/\d{1,2}/\d{4})\b", re.IGNORECASE)
-    site_pat        = re.compile(r"\bAVOCARBON[^\n]*", re.IGNORECASE)
-    total_row_pat   = re.compile(r"^\s*TOTAL\b", re.IGNORECASE)
-
-    # fallback line parser:
-    # ex line: "85030010 OUI V502.730 SP PPC 11TA ... 960 1,9672 0,3262 ..."
-    # capture ref (V502.730) and the quantity (960) that appears BEFORE 2–4 decimal numbers
-    line_pat = re.compile(
-    r"^\s*\d{8}\s+(?:OUI|NON)\s+([A-Z0-9][A-Z0-9.\-]+)(?:\s+(PL|SP))?\s+.+?\s+(\d{1,9})\s+(?:\d+[.,]\d+\s+){2,4}\S+",
-    re.IGNORECASE
-)
-
+    # -------- header (page 1, with fallbacks) --------
+    if pages:
+        p0_text = pages[0][1]
+        m_no = _PDF_HEADER_NO_PAT.search(p0_text)
+        if m_no:
+            delivery_no = m_no.group(1).strip()
+        m_date = _PDF_HEADER_DATE_PAT.search(p0_text) or _PDF_ANY_DATE_PAT.search(p0_text)
+        if m_date:
+            doc_date_iso = dtparse(m_date.group(1), dayfirst=True).date().isoformat()
+        m_site = _PDF_SITE_PAT.search(p0_text)
+        if m_site:
+            detected_site = "Tunisia"
+    # if date still missing, try PDF metadata
+    if not doc_date_iso:
+        try:
+            meta_date = meta.get("CreationDate") or meta.get("ModDate")
+            if meta_date:
+                doc_date_iso = dtparse(meta_date).date().isoformat()
+        except Exception:
+            pass
+
+    # -------- attempt 1: table extraction --------
+    found = 0
+    for tables, _ in pages:
+        for tbl in tables:
+            if not tbl or len(tbl) < 2:
+                continue
+            ref_idx = qty_idx = None
+            # find headers in first rows
+            for r in tbl[:3]:
+                if not r: continue
+                for i, c in enumerate(r):
+                    cell = (c or "").strip()
+                    if ref_idx is None and _PDF_HEADER_REF.search(cell or ""):
+                        ref_idx = i
+                    if qty_idx is None and _PDF_HEADER_QTY.search(cell or ""):
+                        qty_idx = i
+                if ref_idx is not None and qty_idx is not None:
+                    break
+            # fallback heuristic on row 0
+            if ref_idx is None or qty_idx is None:
+                r0 = tbl[0]
+                for i, c in enumerate(r0):
+                    low = (c or "").lower()
+                    if ref_idx is None and "ref" in low and "prix" not in low:
+                        ref_idx = i
+                    if qty_idx is None and any(k in low for k in ("quant", "qty", "qte")):
+                        qty_idx = i
+            if ref_idx is None or qty_idx is None:
+                continue
 
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        # -------- header (page 1, with fallbacks) --------
-        if pdf.pages:
-            p0_text = pdf.pages[0].extract_text() or ""
-            m_no = header_no_pat.search(p0_text)
-            if m_no:
-                delivery_no = m_no.group(1).strip()
-            m_date = header_date_pat.search(p0_text) or re.search(r"\b(\d{1,2}/\d{1,2}/\d{4})\b", p0_text)
-            if m_date:
-                doc_date_iso = dtparse(m_date.group(1), dayfirst=True).date().isoformat()
-            m_site = site_pat.search(p0_text)
-            if m_site:
-                detected_site = "Tunisia"
-        # if date still missing, try PDF metadata
-        if not doc_date_iso:
-            try:
-                meta = pdf.metadata or {}
-                meta_date = meta.get("CreationDate") or meta.get("ModDate")
-                if meta_date:
-                    doc_date_iso = dtparse(meta_date).date().isoformat()
-            except Exception:
-                pass
-
-        # -------- attempt 1: table extraction --------
-        tbl_settings = dict(
-            vertical_strategy="lines",
-            horizontal_strategy="lines",
-            intersect_tolerance=5,
-            snap_tolerance=3,
-            join_tolerance=3,
-            text_x_tolerance=2,
-            text_y_tolerance=3,
-            keep_blank_chars=False,
-            edge_min_length=3,
-        )
-        header_ref = re.compile(r"\bREFERENCE\b|\bREFERENCE\s+ARTICLE\b|\bREF\b", re.IGNORECASE)
-        header_qty = re.compile(r"\bQUANTITE\b|\bQTE\b|\bQTY\b", re.IGNORECASE)
-        material_pat = re.compile(r"^[A-Za-z0-9][A-Za-z0-9.\-_/]*[A-Za-z0-9]$")
-
-        found = 0
-        for page in pdf.pages:
-            tables = []
-            try:
-                t = page.extract_table(tbl_settings)
-                if t: tables.append(t)
-            except Exception:
-                pass
-            try:
-                ts = page.extract_tables(tbl_settings) or []
-                tables.extend(ts)
-            except Exception:
-                pass
-
-            for tbl in tables:
-                if not tbl or len(tbl) < 2:
+            data_rows = tbl[1:]
+            for r in data_rows:
+                if not r: continue
+                if _PDF_TOTAL_ROW_PAT.search(" ".join([(c or "").strip() for c in r if c])):
                     continue
-                ref_idx = qty_idx = None
-                # find headers in first rows
-                for r in tbl[:3]:
-                    if not r: continue
-                    for i, c in enumerate(r):
-                        cell = (c or "").strip()
-                        if ref_idx is None and header_ref.search(cell or ""):
-                            ref_idx = i
-                        if qty_idx is None and header_qty.search(cell or ""):
-                            qty_idx = i
-                    if ref_idx is not None and qty_idx is not None:
-                        break
-                # fallback heuristic on row 0
-                if ref_idx is None or qty_idx is None:
-                    r0 = tbl[0]
-                    for i, c in enumerate(r0):
-                        low = (c or "").lower()
-                        if ref_idx is None and "ref" in low and "prix" not in low:
-                            ref_idx = i
-                        if qty_idx is None and any(k in low for k in ("quant", "qty", "qte")):
-                            qty_idx = i
-                if ref_idx is None or qty_idx is None:
+                raw_ref = (r[ref_idx] or "").strip() if ref_idx < len(r) else ""
+                following = (r[ref_idx + 1] if (ref_idx + 1) < len(r) else "")
+                ref_val = _normalize_avo_ref(raw_ref, following)
+                qty_val = (r[qty_idx] or "").strip() if qty_idx < len(r) else ""
+                if not ref_val or not qty_val:
                     continue
-
-                data_rows = tbl[1:]
-                for r in data_rows:
-                    if not r: continue
-                    if total_row_pat.search(" ".join([(c or "").strip() for c in r if c])):
-                        continue
-                    raw_ref = (r[ref_idx] or "").strip() if ref_idx < len(r) else ""
-                    following = (r[ref_idx + 1] if (ref_idx + 1) < len(r) else "")
-                    ref_val = _normalize_avo_ref(raw_ref, following)
-                    qty_val = (r[qty_idx] or "").strip() if qty_idx < len(r) else ""
-                    if not ref_val or not qty_val: 
-                        continue
-                    if not material_pat.match(ref_val): 
-                        continue
-                    qtxt = qty_val.replace("\u00A0", "").replace(" ", "").replace(",", "")
-                    if not re.match(r"^-?\d+(?:\.\d+)?$", qtxt):
-                        continue
-                    _add(ref_val, int(float(qtxt)))
-                    found += 1
-
-        # -------- attempt 2: text-line regex fallback --------
-        if found == 0:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                for line in text.splitlines():
-                    if total_row_pat.search(line):
-                        continue
-                    m = line_pat.search(line)
-                    if not m:
-                        continue
-                    ref_core = m.group(1).strip()
-                    ref_sfx = (m.group(2) or "").strip().upper()
-                    ref_val = ref_core + (ref_sfx if ref_sfx in SUFFIX_TOKENS else "")
-                    qty_val = int(m.group(3))
-                    _add(ref_val, qty_val)
-
+                if not _PDF_MATERIAL_PAT.match(ref_val):
+                    continue
+                qtxt = qty_val.replace("\u00A0", "").replace(" ", "").replace(",", "")
+                if not _PDF_QTY_PAT.match(qtxt):
+                    continue
+                _add(ref_val, int(float(qtxt)))
+                found += 1
+
+    # -------- attempt 2: text-line regex fallback --------
+    if found == 0:
+        for _, text in pages:
+            for line in text.splitlines():
+                if _PDF_TOTAL_ROW_PAT.search(line):
+                    continue
+                m = _PDF_LINE_PAT.search(line)
+                if not m:
+                    continue
+                ref_core = m.group(1).strip()
+                ref_sfx = (m.group(2) or "").strip().upper()
+                ref_val = ref_core + (ref_sfx if ref_sfx in SUFFIX_TOKENS else "")
+                qty_val = int(m.group(3))
+                _add(ref_val, qty_val)
 
     df = pd.DataFrame(rows, columns=["Date","DeliveryNo","AVOMaterialNo","Quantity","Site","Status"])
     if not df.empty:
@@ -738,16 +1626,201 @@ def parse_delivery_pdf_bytes(pdf_bytes: bytes, *, default_site: str = "Tunisia")
     return df
 
 
+def _pdf_digest(src, digest=None):
+    if digest:
+        return digest
+    if isinstance(src, (bytes, bytearray)):
+        return hashlib.sha256(src).hexdigest()
+    return upload_store.file_sha256(src)
+
+
+def parse_delivery_pdf_batch(files, *, default_site: str = "Tunisia", workers: int = None,
+                             use_cache: bool = True, digests=None) -> list:
+    """
+    Parse several delivery PDFs (paths or bytes); one DataFrame per file, in input order.
+    Files already in pdf_parse_cache (same bytes, same parser version) are not parsed again;
+    digests are the files' sha256 when already known (taken while the upload was saved).
+    """
+    files = list(files)
+    digests = list(digests) if digests is not None else [None] * len(files)
+    workers = PDF_PARSE_WORKERS if workers is None else workers
+    tag = f"delivery-pdf:{PDF_PARSER_VERSION}:{default_site}"
+    keys = [pdf_parse_cache.key_for_digest(_pdf_digest(src, d), tag) if use_cache else None
+            for src, d in zip(files, digests)]
+    out = [pdf_parse_cache.get(k) if k else None for k in keys]
+
+    todo = [i for i, df in enumerate(out) if df is None]
+    if todo:
+        extracted = _extract_pdf_batch([files[i] for i in todo], workers)
+        for i, (meta, pages) in zip(todo, extracted):
+            out[i] = _delivery_rows_from_pages(meta, pages, default_site)
+            if keys[i]:
+                try:
+                    pdf_parse_cache.put(keys[i], out[i])
+                except Exception as e:
+                    print(f"⚠️ PDF parse cache write failed: {e}")
+    return out
+
+
+def parse_delivery_pdf_bytes(pdf_bytes: bytes, *, default_site: str = "Tunisia", workers: int = None,
+                             use_cache: bool = True) -> pd.DataFrame:
+    return parse_delivery_pdf_batch([pdf_bytes], default_site=default_site, workers=workers,
+                                    use_cache=use_cache)[0]
+
+
+def parse_delivery_pdf_file(path, *, default_site: str = "Tunisia", workers: int = None,
+                            use_cache: bool = True, digest=None) -> pd.DataFrame:
+    """Parse a PDF on disk in place (never read into memory as a whole)."""
+    return parse_delivery_pdf_batch([path], default_site=default_site, workers=workers,
+                                    use_cache=use_cache, digests=[digest])[0]
+
+
+def parse_delivery_pdf_head(source, *, default_site: str = "Tunisia", digest=None) -> pd.DataFrame:
+    """Rows of the first page only (same header detection as the full parse), for fast previews."""
+    tag = f"delivery-pdf:{PDF_PARSER_VERSION}:{default_site}"
+    cached = pdf_parse_cache.get(pdf_parse_cache.key_for_digest(_pdf_digest(source, digest), tag))
+    if cached is not None:
+        return cached
+    n_pages, meta = pdf_info(source)
+    pages = [(t, txt) for _, t, txt in extract_pages(source, range(min(1, n_pages)))]
+    return _delivery_rows_from_pages(meta, pages, default_site)
+
+
+@app.route("/pdf-cache/stats")
+def pdf_cache_stats():
+    return jsonify(pdf_parse_cache.snapshot())
+
+
+@app.route("/temp-store/stats")
+def temp_store_stats():
+    return jsonify(temp_store.snapshot())
+
+
+@metrics.stage("parse")
+def _parse_upload(temp_path, ext, file_type, *, pdf_workers=None, digest=None):
+    """
+    Parse a saved upload (digest: its sha256, when known). Returns (frame, streamed, notes);
+    for streamed uploads (too large to hold in memory) the frame is only the head of the
+    file and /insert reads the rest. CSV / Excel frames come out of _conform_upload, and
+    notes tells the user which rows it left out ('' when none).
+    """
+    if ext != ".pdf" and os.path.getsize(temp_path) > STREAM_THRESHOLD_BYTES:
+        # Too large to hold in memory: preview the head, stream the rest on /insert.
+        # The head still goes through the schema, so a wrong layout fails here.
+        head = _conform_upload(read_upload_head(temp_path, ext, PREVIEW_ROWS, usecols=_usecols(file_type)),
+                               file_type)
+        return head.frame, True, ""
+    if ext == ".pdf":
+        if file_type != "LIVRAISON":
+            raise ValueError("PDF files can only be uploaded as deliveries.")
+        # Parse the delivery invoice PDF
+        return parse_delivery_pdf_file(temp_path, default_site="Tunisia", workers=pdf_workers,
+                                       digest=digest), False, ""
+    # Excel / CSV path: only the template columns are read
+    conformed = _conform_upload(read_upload(temp_path, ext, usecols=_usecols(file_type)), file_type)
+    return conformed.frame, False, _ingest_notes(conformed.rejected, conformed.missing)
+
+
+def _stage_upload(temp_path, ext, file_type, file_name, *, pdf_workers=None, digest=None):
+    """
+    Parse a saved upload and stage it for /insert. Returns a dict with the staging
+    token, the (preview) frame, whether it is streamed, its ingestion ledger entry and
+    the notes of _parse_upload. Invalid rows are rejected before the ledger lookup, the
+    first database access.
+    """
+    df, streamed, notes = _parse_upload(temp_path, ext, file_type, pdf_workers=pdf_workers, digest=digest)
+
+    # Ledger key: the normalized rows, or the raw bytes when the file is only streamed
+    batch_key = ledger.file_key(temp_path, file_type, digest) if streamed else _batch_key(df, file_type)
+    known = _known_batch(batch_key)
+    meta = {"file_type": file_type, "batch_key": batch_key, "file_name": file_name}
+
+    if streamed:
+        token = staging.adopt(temp_path, meta={**meta, "ext": ext})
+    else:
+        # Stage the typed frame for /insert
+        with metrics.stage("staging.save"):
+            token = staging.save(df, meta=meta)
+    temp_store.track(token, *staging.files(token), temp_path)
+    return {"token": token, "df": df, "streamed": streamed, "known": known, "notes": notes}
+
+
+@metrics.stage("parse.head")
+def _parse_head(temp_path, ext, file_type, digest=None):
+    """First PREVIEW_ROWS rows only: nrows for CSV / .xls, read-only iterator for .xlsx, page 1 of a PDF."""
+    if ext == ".pdf":
+        if file_type != "LIVRAISON":
+            raise ValueError("PDF files can only be uploaded as deliveries.")
+        return parse_delivery_pdf_head(temp_path, default_site="Tunisia", digest=digest)
+    return _conform_upload(read_upload_head(temp_path, ext, PREVIEW_ROWS, usecols=_usecols(file_type)),
+                           file_type).frame
+
+
+def _finish_parse(token, temp_path, ext, file_type, progress, digest=None):
+    """Background half of a fast preview: full parse, ledger key, frame staged under token."""
+    try:
+        with temp_store.hold(token):
+            df, _, notes = _parse_upload(temp_path, ext, file_type, digest=digest)
+            batch_key = _batch_key(df, file_type)
+            known = _known_batch(batch_key)
+            staging.save(df, meta={"batch_key": batch_key, "rows": len(df)}, token=token)
+    except Exception as e:
+        if staging.exists(token):
+            staging.update_meta(token, parse_error=str(e))
+        raise
+    progress(len(df))
+    msg = f"Parsed {len(df)} rows."
+    if notes:
+        msg += f" {notes}"
+    if known:
+        msg += f" ⚠️ {_already_imported_msg(known)} Sending it again is skipped unless you tick “Import again”."
+    return {"message": msg, "rows": len(df), "known": bool(known)}
+
+
+def _wait_staged(token, timeout=PARSE_WAIT_SECONDS):
+    """Block until a fast-preview token's background parse has written its frame."""
+    deadline = time.monotonic() + timeout
+    while staging.pending(token):
+        meta = staging.meta(token)
+        if meta.get("parse_error"):
+            raise ValueError(f"Parsing the file failed: {meta['parse_error']}")
+        job_id = meta.get("parse_job")
+        if job_id and parse_jobs.status(job_id)["state"] == "failed":
+            raise ValueError(f"Parsing the file failed: {parse_jobs.status(job_id)['error']}")
+        if time.monotonic() > deadline:
+            raise TimeoutError("The file is still being parsed; please try again in a moment.")
+        time.sleep(0.2)
+
+
+@app.route("/preview/rows/<token>")
+def preview_rows(token):
+    """A page of a staged batch: ?offset=&limit= (JSON, split orientation)."""
+    if not staging.exists(token):
+        abort(404, description="Unknown or expired preview")
+    if staging.pending(token):
+        return jsonify({"state": "parsing"}), 202
+    if staging.upload_path(token):
+        return jsonify({"error": "Large files are streamed on insert; only the first rows can be previewed."}), 409
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = min(PREVIEW_PAGE_MAX_ROWS, max(1, request.args.get("limit", 50, type=int)))
+    page = staging.load_slice(token, offset, limit)
+    out = json.loads(page.to_json(orient="split", index=False, date_format="iso"))
+    out.update(offset=offset, total=staging.num_rows(token))
+    return jsonify(out)
+
+
 @app.route("/preview", methods=["POST"])
 def preview():
-    file = request.files.get("file")
+    with metrics.stage("upload.receive"):
+        # the form parser writes the file to disk while reading the body
+        file = request.files.get("file")
     file_type = request.form.get("file_type")
     active_tab = 'edi' if file_type == 'EDI' else 'deliveries'
 
     if not file or not allowed_file(file.filename):
         error_msg = "Invalid file. Please select a .csv, .xlsx, .xls, or .pdf file."
-        return render_template_string(
-            HTML_PAGE,
+        return render_template(
+            PAGE_TEMPLATE,
             active_tab=active_tab,
             edi_msg=error_msg if active_tab == "edi" else None, edi_ok=False,
             deliv_msg=error_msg if active_tab == "deliveries" else None, deliv_ok=False
@@ -755,57 +1828,74 @@ def preview():
 
     try:
         ext = os.path.splitext(file.filename)[1].lower()
-        temp_path = os.path.join(OUTPUT_DIR, f"upload_{int(time.time())}{ext}")
-        file.save(temp_path)
+        # already on disk: the form parser wrote it there (and hashed it) while reading the body
+        stored = upload_store.keep(file, OUTPUT_DIR)
+        temp_path = stored.path
 
         pdf_file_for_embed = None
-
-        if ext in (".xls", ".xlsx"):
-            df = pd.read_excel(temp_path)
-
-        elif ext == ".pdf" and file_type == "LIVRAISON":
-            # Parse the delivery invoice PDF
-            with open(temp_path, "rb") as fh:
-                pdf_bytes = fh.read()
-            df = parse_delivery_pdf_bytes(pdf_bytes, default_site="Tunisia")
-            # enable inline PDF preview in the Delivery tab
-            pdf_name = f"pdf_{int(time.time())}.pdf"
-            pdf_copy_path = os.path.join(OUTPUT_DIR, secure_filename(pdf_name))
-            # keep a copy (you can also just reuse temp_path if you prefer)
-            io.open(pdf_copy_path, "wb").write(pdf_bytes)
-            pdf_file_for_embed = pdf_name
-
+        if ext == ".pdf" and file_type == "LIVRAISON":
+            # the inline PDF preview in the Delivery tab serves the upload itself
+            pdf_file_for_embed = os.path.basename(temp_path)
+
+        parse_job_id = None
+        too_large = ext != ".pdf" and os.path.getsize(temp_path) > STREAM_THRESHOLD_BYTES
+        if FAST_PREVIEW and not too_large:
+            # Parse just the head now; the full parse (and ledger check) runs in the background.
+            df = _parse_head(temp_path, ext, file_type, digest=stored.sha256)
+            parse_job_id = uuid.uuid4().hex
+            token = staging.reserve(meta={"file_type": file_type, "file_name": file.filename,
+                                          "parse_job": parse_job_id})
+            temp_store.track(token, *staging.files(token), temp_path)
+            parse_jobs.submit(_finish_parse, token, temp_path, ext, file_type, digest=stored.sha256,
+                              kind="parse", job_id=parse_job_id)
+            streamed, known, notes = False, None, ""
         else:
-            # CSV path
-            with open(temp_path, "rb") as f:
-                sample = f.read(200_000)
-            enc = chardet.detect(sample)["encoding"] or "utf-8"
-            df = pd.read_csv(temp_path, encoding=enc, sep=None, engine="python")
-
-        # Persist a temp CSV for insertion reuse
-        temp_csv_name = f"preview_{int(time.time())}.csv"
-        temp_csv_path = os.path.join(OUTPUT_DIR, temp_csv_name)
-        df.to_csv(temp_csv_path, index=False)
+            staged = _stage_upload(temp_path, ext, file_type, file.filename, digest=stored.sha256)
+            df, token, streamed, known = staged["df"], staged["token"], staged["streamed"], staged["known"]
+            notes = staged["notes"]
 
-        table_html = df.head(20).to_html(index=False, classes="table", table_id="preview-table", border=0)
+        with metrics.stage("render"):
+            table_html = df.head(PREVIEW_ROWS).to_html(index=False, classes="table", table_id="preview-table", border=0)
 
         # Delivery tab message
         deliv_msg = None
         deliv_ok = None
         edi_msg = None
         edi_ok = None
-        if active_tab == "deliveries":
+        if streamed:
+            mb = os.path.getsize(staging.upload_path(token)) / (1024 * 1024)
+            big_msg = f"Large file ({mb:.0f} MB): showing the first {len(df)} rows, the rest is streamed on insert."
+            deliv_msg, deliv_ok, edi_msg, edi_ok = (big_msg, True, None, None) if active_tab == "deliveries" \
+                else (None, None, big_msg, True)
+        elif parse_job_id:
+            pass  # the parse status box reports the final row count
+        elif active_tab == "deliveries":
             deliv_msg = f"Parsed {len(df)} rows."
             deliv_ok = True
         else:
             edi_msg = "Preview ready."
             edi_ok = True
+        if notes:
+            if active_tab == "deliveries":
+                deliv_msg = f"{deliv_msg} {notes}"
+            else:
+                edi_msg = f"{edi_msg} {notes}"
+        if known:
+            dup_msg = f"⚠️ {_already_imported_msg(known)} Sending it again is skipped unless you tick “Import again”."
+            if active_tab == "deliveries":
+                deliv_msg, deliv_ok = dup_msg, False
+            else:
+                edi_msg, edi_ok = dup_msg, False
 
-        return render_template_string(
-            HTML_PAGE,
+        return render_template(
+            PAGE_TEMPLATE,
             table_html=table_html,
             file_type=file_type,
-            temp_file=temp_csv_name,
+            token=token,
+            known_batch=bool(known),
+            parse_job_id=parse_job_id,
+            page_token=None if streamed else token,
+            preview_rows=min(len(df), PREVIEW_ROWS),
             active_tab=active_tab,
             pdf_file=pdf_file_for_embed,   # << used only when defined
             deliv_msg=deliv_msg, deliv_ok=deliv_ok,
@@ -814,20 +1904,270 @@ def preview():
 
     except Exception as e:
         error_msg = f"Error processing file: {e}"
-        return render_template_string(
-            HTML_PAGE,
+        return render_template(
+            PAGE_TEMPLATE,
             active_tab=active_tab,
             edi_msg=error_msg if active_tab == "edi" else None, edi_ok=False,
             deliv_msg=error_msg if active_tab == "deliveries" else None, deliv_ok=False
         )
 
 
+# -----------------------
+# Batch upload (several files or one ZIP)
+# -----------------------
+BATCH_PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(os.cpu_count() or 2)))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+BATCH_MAX_UNZIPPED_BYTES = int(os.getenv("BATCH_MAX_UNZIPPED_MB", "500")) * 1024 * 1024
+BATCH_PREVIEW_ROWS = 100
+
+
+def _save_batch_files(files):
+    """
+    Collect the uploaded files under OUTPUT_DIR (ZIP archives are unpacked).
+    Returns [(display name, saved path or None, ext, error or None, sha256 or None)] in upload order.
+    """
+    out = []
+
+    def _add(name, file=None, stream=None):
+        ext = os.path.splitext(name)[1].lower()
+        if not allowed_file(name):
+            out.append((name, None, ext, "Unsupported file type.", None))
+            return
+        if file is not None:
+            # written to disk by the form parser already
+            stored = upload_store.keep(file, OUTPUT_DIR)
+        else:
+            stored = upload_store.save_stream(stream, upload_store.upload_path(OUTPUT_DIR, name))
+        out.append((name, stored.path, ext, None, stored.sha256))
+
+    for f in files:
+        if not f or not f.filename:
+            continue
+        if f.filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(f.stream) as zf:
+                members = [m for m in zf.infolist()
+                           if not m.is_dir() and not m.filename.startswith("__MACOSX/")]
+                if sum(m.file_size for m in members) > BATCH_MAX_UNZIPPED_BYTES:
+                    raise ValueError(f"{f.filename}: archive too large once unpacked.")
+                for m in members:
+                    with zf.open(m) as src:
+                        _add(os.path.basename(m.filename), stream=src)
+        else:
+            _add(f.filename, file=f)
+        if len(out) > BATCH_MAX_FILES:
+            raise ValueError(f"Too many files (max {BATCH_MAX_FILES}).")
+    return out
+
+
+def _stage_batch_file(name, path, ext, file_type, digest=None):
+    try:
+        staged = _stage_upload(path, ext, file_type, name, pdf_workers=BATCH_PARSE_WORKERS, digest=digest)
+    except Exception as e:
+        return {"name": name, "error": str(e)}
+    finally:
+        # parsed frames are staged; only streamed uploads keep (move) their file
+        if os.path.exists(path):
+            os.remove(path)
+    return {"name": name, **staged}
+
+
+@app.route("/preview/batch", methods=["POST"])
+def preview_batch():
+    file_type = request.form.get("file_type")
+    active_tab = 'edi' if file_type == 'EDI' else 'deliveries'
+
+    def _error(msg):
+        return render_template(
+            PAGE_TEMPLATE, active_tab=active_tab,
+            edi_msg=msg if active_tab == "edi" else None, edi_ok=False,
+            deliv_msg=msg if active_tab == "deliveries" else None, deliv_ok=False)
+
+    try:
+        saved = _save_batch_files(request.files.getlist("files"))
+    except (ValueError, zipfile.BadZipFile) as e:
+        return _error(f"Error processing files: {e}")
+    if not saved:
+        return _error("No file received. Please select one or more files or a ZIP archive.")
+
+    # Parse concurrently: tabular files in the threads, PDF pages in the process pool.
+    with ThreadPoolExecutor(max_workers=max(1, BATCH_PARSE_WORKERS)) as pool:
+        futures = [pool.submit(_stage_batch_file, name, path, ext, file_type, digest) if path else None
+                   for name, path, ext, _, digest in saved]
+        results = [fut.result() if fut else {"name": name, "error": err}
+                   for fut, (name, _, _, err, _) in zip(futures, saved)]
+
+    summary, frames, tokens = [], [], []
+    for r in results:
+        if r.get("error"):
+            status = f"❌ {r['error']}"
+        elif r["known"]:
+            status = f"⚠️ {_already_imported_msg(r['known'])}"
+        elif r["streamed"]:
+            status = "✅ Large file, streamed on insert"
+        else:
+            status = "✅ OK"
+        if not r.get("error") and r["notes"]:
+            status += f" {r['notes']}"
+        rows = "–" if r.get("error") or r["streamed"] else len(r["df"])
+        summary.append({"File": r["name"], "Rows": rows, "Status": status})
+        if not r.get("error"):
+            tokens.append(r["token"])
+            frames.append(r["df"].head(BATCH_PREVIEW_ROWS).assign(SourceFile=r["name"]))
+
+    batch_html = pd.DataFrame(summary).to_html(index=False, classes="table", border=0)
+    n_err = sum(1 for r in results if r.get("error"))
+    msg = f"{len(tokens)} of {len(results)} files ready" + (f", {n_err} with errors." if n_err else ".")
+    ok = bool(tokens)
+    table_html = None
+    if frames:
+        merged = pd.concat(frames, ignore_index=True).head(BATCH_PREVIEW_ROWS)
+        merged = merged[["SourceFile"] + [c for c in merged.columns if c != "SourceFile"]]
+        table_html = merged.to_html(index=False, classes="table", table_id="preview-table", border=0)
+
+    return render_template(
+        PAGE_TEMPLATE,
+        table_html=table_html,
+        batch_html=batch_html,
+        batch_tokens=tokens,
+        known_batch=any(r.get("known") for r in results),
+        file_type=file_type,
+        active_tab=active_tab,
+        deliv_msg=msg if active_tab == "deliveries" else None, deliv_ok=ok,
+        edi_msg=msg if active_tab == "edi" else None, edi_ok=ok,
+    )
+
+
+# -----------------------
+# Machine-to-machine ingestion API (JSON array or NDJSON body)
+# -----------------------
+API_BATCH_ROWS = int(os.getenv("API_BATCH_ROWS", "10000"))
+API_MAX_ERRORS = 50
+
+
+def _api_frame(records, file_type, offset):
+    """
+    Validate one batch of API records with the INGEST_SCHEMAS entry of the uploads.
+    Returns (frame ready for the insert path, [(record number, message)] for the
+    rejected ones).
+    """
+    schema = INGEST_SCHEMAS[file_type]
+    errors = []
+    rows, numbers = [], []
+    for i, rec in enumerate(records, start=offset):
+        if isinstance(rec, dict):
+            rows.append(rec)
+            numbers.append(i)
+        else:
+            errors.append((i, "record is not a JSON object"))
+    conformed = schema.apply(pd.DataFrame.from_records(rows, columns=schema.columns), first_row=0)
+    errors += [(numbers[n], msg) for n, msg in conformed.rejected]
+    return conformed.frame, sorted(errors)
+
+
+def _api_ingest(file_type):
+    """
+    Stream the request body, validate and insert it batch by batch in one transaction.
+    ?strict=1 rejects the whole call (nothing written) when any record is invalid.
+    """
+    started = time.perf_counter()
+    strict = request.args.get("strict") == "1"
+    merge = file_type == "EDI" and EDI_INSERT_MODE == "merge"
+    summary = {"received": 0, "accepted": 0, "rejected": 0, "written": 0, "batches": 0, "errors": []}
+    if merge:
+        summary.update(inserted=0, updated=0, unchanged=0)
+
+    def batches():
+        buf = []
+        for rec in iter_json_records(request.stream):
+            buf.append(rec)
+            if len(buf) >= API_BATCH_ROWS:
+                yield buf
+                buf = []
+        if buf:
+            yield buf
+
+    class _StrictReject(Exception):
+        pass
+
+    try:
+        with engine.begin() as conn, metrics.batch(file_type) as batch:
+            for records in batches():
+                with metrics.stage("api.validate"):
+                    df, errors = _api_frame(records, file_type, summary["received"])
+                summary["received"] += len(records)
+                summary["batches"] += 1
+                summary["accepted"] += len(df)
+                batch["rows"] += len(df)
+                summary["rejected"] += len(errors)
+                room = API_MAX_ERRORS - len(summary["errors"])
+                summary["errors"] += [{"record": i, "error": msg} for i, msg in errors[:max(0, room)]]
+                if errors and strict:
+                    raise _StrictReject()
+                if df.empty:
+                    continue
+                if merge:
+                    counts = _merge_ediglobal(conn, df)
+                    for k, v in counts.items():
+                        summary[k] += v
+                    summary["written"] += counts["inserted"] + counts["updated"]
+                elif file_type == "EDI":
+                    summary["written"] += _copy_ediglobal(conn, df)
+                else:
+                    norm, _ = _normalize_delivery_frame(df)
+                    _apply_delivery_batch(conn, norm)
+                    summary["written"] += len(norm)
+    except RecordStreamError as e:
+        return jsonify({**summary, "written": 0, "error": str(e)}), 400
+    except _StrictReject:
+        return jsonify({**summary, "written": 0, "error": "Invalid records; nothing was written."}), 422
+    except Exception as e:
+        return jsonify({**summary, "written": 0, "error": f"Database insertion failed: {e}"}), 500
+
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return jsonify(summary)
+
+
+@app.route("/api/edi", methods=["POST"])
+def api_edi():
+    return _api_ingest("EDI")
+
+
+@app.route("/api/deliveries", methods=["POST"])
+def api_deliveries():
+    return _api_ingest("LIVRAISON")
+
+
+@app.route("/api/stock")
+def api_stock():
+    """
+    Stock position per (Site, AVOMaterialNo) from "StockSummary", refreshed by every insert.
+    ?site= exact site, ?avo= part-number prefix, ?limit= (max 1000) and ?offset= for paging.
+    """
+    try:
+        limit = int(request.args.get("limit", 100))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    try:
+        with metrics.stage("stock.read"):
+            result = stock.read(engine, site=request.args.get("site", "").strip(),
+                                avo=request.args.get("avo", "").strip(), limit=limit, offset=offset)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"Database query failed: {e}"}), 500
+    response = jsonify(result)
+    response.headers["Cache-Control"] = f"private, max-age={int(stock.CACHE_SECONDS)}"
+    return response
+
+
 @app.route("/view/temp/<filename>")
 def view_temp_file(filename):
     path = os.path.join(OUTPUT_DIR, secure_filename(filename))
     if not os.path.exists(path):
         abort(404)
-    return send_file(path)
+    # conditional: ETag / Last-Modified and Range requests, so the PDF viewer can fetch pages lazily
+    return send_file(path, conditional=True)
 
 def _upsert_sum_delivery(conn, *, site, avo_mat, delivery_no, date, status, qty):
     """
@@ -859,8 +2199,6 @@ def _upsert_sum_delivery(conn, *, site, avo_mat, delivery_no, date, status, qty)
         """)
         conn.execute(ins, params)
 
-SUFFIX_TOKENS = {"PL", "SP"}
-
 def _normalize_avo_ref(s: object, following_hint: object = None) -> str:
     """
     Merge a short type token (PL/SP) into the AVOMaterialNo, removing the space.
@@ -0,0 +1,62 @@
+"""
+CSV upload read time: chardet + sniffing Python parser vs fast detection + C parser.
+
+    python benchmarks/bench_csv_read.py --rows 200000
+
+Writes a semicolon-delimited Latin-1 EDI export (accented product names, as the
+ERP produces them), reads it both ways and checks the frames are identical.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import chardet
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import PRODUCTS, make_edi_frame  # noqa: E402
+from upload_reader import read_upload  # noqa: E402
+
+
+def legacy_read(path):
+    # what /preview did before: chardet over 200 KB, then sep=None on the Python engine
+    with open(path, "rb") as f:
+        enc = chardet.detect(f.read(200_000))["encoding"] or "utf-8"
+    return pd.read_csv(path, encoding=enc, sep=None, engine="python")
+
+
+def timed(fn, path):
+    t0 = time.perf_counter()
+    df = fn(path)
+    return df, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+
+    df = make_edi_frame(args.rows)
+    df["ProductName"] = [PRODUCTS[i % len(PRODUCTS)] for i in range(len(df))]
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        df.to_csv(path, sep=";", index=False, encoding="latin-1")
+        mb = os.path.getsize(path) / 1e6
+
+        old, t_old = timed(legacy_read, path)
+        new, t_new = timed(lambda p: read_upload(p, ".csv"), path)
+        if not old.equals(new):
+            sys.exit("MISMATCH between legacy and fast CSV read")
+
+        for label, dt in (("legacy", t_old), ("fast", t_new)):
+            print(f"{label:<7} {len(new):>8} rows  {mb:6.1f} MB  {dt:7.2f} s  {len(new) / dt:10.0f} rows/s")
+        print(f"speedup x{t_old / t_new:.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
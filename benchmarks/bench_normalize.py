@@ -0,0 +1,157 @@
+"""
+Equivalence check and timing of normalize.py against the scalar helpers in App.py.
+
+    python benchmarks/bench_normalize.py --rows 200000
+
+Exits non-zero if any vectorized helper disagrees with its scalar counterpart.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import App  # noqa: E402
+import normalize  # noqa: E402
+
+TRICKY_QTY = [
+    None, np.nan, float("nan"), "", "  ", "nan", "NaN", "None", "none", "0", "-0", "12", " 12 ",
+    "1 234,0", "1 234", "1,234.56", "-7.9", "7.9", "2.5", "12 pcs", "ca. 40", "-", "abc",
+    "1e3", "\t5\n", 3, 0, -4, True, 2.5, 3.5, -2.5, 7.0, np.float64(4.5),
+]
+TRICKY_STATUS = [
+    None, np.nan, "", "sent", " SENT ", "Dispatched", "dispatched", "in transit", "In Transit",
+    "in-transit", "IN - TRANSIT", "intransit", "Delivered", " delivered ", "Returned", 5, "nan",
+]
+TRICKY_REF = [
+    None, np.nan, "", "   ", "V504.243", "V504.243 PL", "v504.243 sp", "V504.243 PL",
+    "V504.243  PL extra", "V504.243 XX", "V504.243\tSP", " V1 ", 504.0, 12, "PL",
+]
+TRICKY_HINT = [
+    "PL", None, "SP x", "", "sp", np.nan, "PL", "SP", "XX", "pl", "PL", "SP", "PL", "SP", "PL",
+]
+
+
+def _same(label, expected, got):
+    exp, res = list(expected), list(got)
+    bad = [(i, e, r) for i, (e, r) in enumerate(zip(exp, res)) if e != r or type(e) != type(r)]
+    # ints coming out of int64 Series are numpy ints; compare those by value
+    bad = [(i, e, r) for i, e, r in bad if not (isinstance(e, int) and e == r)]
+    if bad or len(exp) != len(res):
+        print(f"MISMATCH {label}: {bad[:10]}")
+        return False
+    return True
+
+
+def check_equivalence():
+    ok = True
+    # reps=3 repeats every value so the distinct-values path of normalize.py is used too
+    for dtype, reps in ((object, 1), (None, 1), (object, 3), (None, 3)):
+        qty = pd.Series(TRICKY_QTY * reps, dtype=object)
+        if dtype is None:
+            qty = pd.Series([v for v in TRICKY_QTY if isinstance(v, str)] * reps)
+        ok &= _same("clean_qty", qty.map(App._clean_qty), normalize.clean_qty_series(qty))
+
+        st = pd.Series(TRICKY_STATUS * reps, dtype=dtype)
+        ok &= _same("norm_status", st.map(App._norm_status), normalize.norm_status_series(st))
+        ok &= _same("safestr", st.map(App._safestr), normalize.safestr_series(st))
+
+        ref = pd.Series(TRICKY_REF * reps, dtype=dtype)
+        hint = pd.Series(TRICKY_HINT * reps, dtype=dtype)
+        ok &= _same("safestr(ref)", ref.map(App._safestr), normalize.safestr_series(ref))
+        ok &= _same("avo_ref", ref.map(lambda v: App._normalize_avo_ref(v, None)),
+                    normalize.normalize_avo_ref_series(ref))
+        ok &= _same("avo_ref+hint", [App._normalize_avo_ref(a, b) for a, b in zip(ref, hint)],
+                    normalize.normalize_avo_ref_series(ref, hint))
+
+    for floats in (pd.Series([1.0, 2.5, 3.5, np.nan, -0.5]), pd.Series([1, 2, 3]), pd.Series([True, False])):
+        ok &= _same(f"clean_qty[{floats.dtype}]", floats.map(App._clean_qty), normalize.clean_qty_series(floats))
+
+    bad_qty = pd.Series(["1-2", "--"])
+    for fn in (lambda: bad_qty.map(App._clean_qty), lambda: normalize.clean_qty_series(bad_qty)):
+        try:
+            fn()
+            print("MISMATCH clean_qty('1-2'): expected ValueError")
+            ok = False
+        except ValueError:
+            pass
+
+    def _rejects(v):
+        try:
+            App._clean_qty(v)
+            return False
+        except ValueError:
+            return True
+
+    for mixed in (pd.Series(["12", "1-2", " 3 ", "--", None, "4 pcs"] * 3), pd.Series([1, "1-2", 2.5, None, "7"])):
+        values, bad = normalize.clean_qty_checked(mixed)
+        expected = mixed.map(_rejects)
+        ok &= _same(f"clean_qty_checked mask[{mixed.dtype}]", expected, bad)
+        ok &= _same(f"clean_qty_checked values[{mixed.dtype}]",
+                    mixed.map(lambda v: 0 if _rejects(v) else App._clean_qty(v)), values)
+    return ok
+
+
+def make_delivery_frame(n_rows, seed=0):
+    rnd = random.Random(seed)
+    qty = ["1 234,0", "960", " 12 ", "1 500", "", "nan", "7.0", "12 pcs"]
+    status = ["Dispatched", "sent", "in transit", "Delivered", "In-Transit", " delivered "]
+    return pd.DataFrame({
+        "Site": [rnd.choice([" Tunisia", "Tunisia ", "France"]) for _ in range(n_rows)],
+        "AVOMaterialNo": [f"V{rnd.randrange(50):03d}.{rnd.randrange(40):03d}" + rnd.choice(["", " PL", " sp"])
+                          for _ in range(n_rows)],
+        "DeliveryNo": [f" FAC{i // 40:06d}" for i in range(n_rows)],
+        "Date": ["2025-07-01"] * n_rows,
+        "Quantity": [rnd.choice(qty) for _ in range(n_rows)],
+        "Status": [rnd.choice(status) for _ in range(n_rows)],
+    }, dtype=str)
+
+
+def scalar_pipeline(df):
+    for col in ["Site", "AVOMaterialNo", "DeliveryNo", "Date", "Status"]:
+        df[col] = df[col].map(App._safestr)
+    df["AVOMaterialNo"] = df.apply(lambda r: App._normalize_avo_ref(r.get("AVOMaterialNo"), None), axis=1)
+    df["Quantity"] = df["Quantity"].apply(App._clean_qty).astype(int)
+    df["Status"] = df["Status"].apply(App._norm_status)
+    return df
+
+
+def vector_pipeline(df):
+    for col in ["Site", "AVOMaterialNo", "DeliveryNo", "Date", "Status"]:
+        df[col] = normalize.safestr_series(df[col])
+    df["AVOMaterialNo"] = normalize.normalize_avo_ref_series(df["AVOMaterialNo"])
+    df["Quantity"] = normalize.clean_qty_series(df["Quantity"])
+    df["Status"] = normalize.norm_status_series(df["Status"])
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+
+    if not check_equivalence():
+        sys.exit(1)
+    print("equivalence: ok")
+
+    df = make_delivery_frame(args.rows)
+    t0 = time.perf_counter()
+    a = scalar_pipeline(df.copy())
+    t_scalar = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    b = vector_pipeline(df.copy())
+    t_vector = time.perf_counter() - t0
+    if not all(a[c].tolist() == b[c].tolist() for c in a.columns):
+        sys.exit("MISMATCH on generated frame")
+
+    print(f"scalar     {args.rows:>8} rows  {t_scalar:8.2f} s")
+    print(f"vectorized {args.rows:>8} rows  {t_vector:8.2f} s")
+    print(f"speedup    {t_scalar / t_vector:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Timing of parse_delivery_pdf_batch with different worker counts on synthetic invoices.
+
+    python benchmarks/bench_pdf_parse.py --files 6 --pages 12 --workers 1 2 4 [--table]
+
+--table draws the item lines as a ruled table (the extract_tables path), otherwise
+they are text lines (the regex fallback). The serial result must hold exactly the
+(reference, quantity) lines of the invoices, and every worker count must return
+exactly the serial result. The
+worker runs bypass the parse cache, so each one really parses. A last pass times
+the cache: one cold run into an empty temporary cache, then one warm run.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import App  # noqa: E402
+from pdf_cache import ParseCache  # noqa: E402
+from synthetic_pdf import make_invoice_pdf  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--files", type=int, default=6)
+    ap.add_argument("--pages", type=int, default=12)
+    ap.add_argument("--lines", type=int, default=45, help="item lines per page")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--table", action="store_true", help="item lines in a ruled table")
+    args = ap.parse_args()
+
+    made = [make_invoice_pdf(args.pages, args.lines, invoice_no=f"F2025-{i:04d}", table=args.table, seed=i)
+            for i in range(args.files)]
+    files = [pdf for pdf, _ in made]
+    n_pages = args.files * args.pages
+
+    reference = None
+    for w in args.workers:
+        t0 = time.perf_counter()
+        res = App.parse_delivery_pdf_batch(files, workers=w, use_cache=False)
+        dt = time.perf_counter() - t0
+        if reference is None:
+            reference = res
+            for i, (df, (_, expected)) in enumerate(zip(res, made)):
+                got = set(zip(df["AVOMaterialNo"], df["Quantity"]))
+                if df.empty or got != set(expected):
+                    sys.exit(f"WRONG ROWS in file {i}: {len(df)} rows parsed, "
+                             f"{len(set(expected))} distinct lines in the invoice")
+        elif not all(a.equals(b) for a, b in zip(reference, res)):
+            sys.exit(f"MISMATCH with workers={w}")
+        print(f"workers={w:<3} {n_pages:>5} pages  {dt:8.2f} s  {n_pages / dt:8.1f} pages/s")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        App.pdf_parse_cache = ParseCache(cache_dir)
+        for label in ("cache cold", "cache warm"):
+            t0 = time.perf_counter()
+            res = App.parse_delivery_pdf_batch(files, workers=args.workers[-1])
+            dt = time.perf_counter() - t0
+            if not all(a.equals(b) for a, b in zip(reference, res)):
+                sys.exit(f"MISMATCH with {label}")
+            print(f"{label:<11} {n_pages:>5} pages  {dt:8.2f} s  {n_pages / dt:8.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
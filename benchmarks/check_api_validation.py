@@ -0,0 +1,130 @@
+"""
+Check that the JSON API rejects the rows the upload path rejects.
+
+    EDI_BENCH_DB_URL=postgresql+psycopg2://... python benchmarks/check_api_validation.py
+
+Posts NDJSON bodies to /api/edi and /api/deliveries through the Flask test client:
+valid records mixed with records that lack a required column or carry a malformed
+week, date or quantity. The valid ones
+must be written and the others reported with their record number and message,
+exactly as INGEST_SCHEMAS rejects them on upload; ?strict=1 must write nothing.
+Everything is written under Site 'APICHECK' and deleted again at the end. Exits
+with status 1 on any mismatch.
+"""
+import json
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import App  # noqa: E402
+import stock  # noqa: E402
+
+SITE = "APICHECK"
+
+
+def edi(**values):
+    rec = {"Site": SITE, "ClientCode": "C1", "ClientMaterialNo": "CM-1", "AVOMaterialNo": "V1",
+           "DateFrom": "2025-W10", "ForecastDate": "2025-W09", "Quantity": 100}
+    rec.update(values)
+    return {k: v for k, v in rec.items() if v is not None}
+
+
+def delivery(**values):
+    rec = {"Site": SITE, "AVOMaterialNo": "V1", "DeliveryNo": "D1", "Quantity": "10",
+           "Date": "2025-07-14", "Status": "Dispatched"}
+    rec.update(values)
+    return {k: v for k, v in rec.items() if v is not None}
+
+
+# (name, file type, records, {record number: message} expected, rows expected written)
+CASES = [
+    ("EDI required columns and weeks", "EDI", [
+        edi(),
+        {"Site": SITE, "Quantity": 5},                       # only Site and Quantity
+        edi(DateFrom="2025-W60"),                            # no such week
+        edi(ForecastDate="week 9"),                          # not a week
+        edi(ClientMaterialNo=None),                          # required column left out
+        edi(DateFrom="2025w7", Quantity="1 200"),            # accepted spellings
+        edi(Quantity="12.5"),                                # not an integer
+    ], {1: "ClientMaterialNo is required", 2: "DateFrom must be a week like 2025-W28",
+        3: "ForecastDate must be a week like 2025-W28", 4: "ClientMaterialNo is required",
+        6: "Quantity must be an integer"}, 2),
+    ("delivery required columns, dates and quantities", "LIVRAISON", [
+        delivery(),
+        delivery(DeliveryNo="D2", Date="14/07/2025"),        # not ISO
+        delivery(DeliveryNo="D3", Status=None),              # required column left out
+        delivery(DeliveryNo="D4", Quantity="1-2"),           # _clean_qty rejects it
+        delivery(DeliveryNo="D5", Quantity="1 200", Date="2025-07-15T08:30:00"),
+        delivery(DeliveryNo="D6", Site={"name": SITE}),      # nested value
+        "not an object",
+    ], {1: "Date must be a date like 2025-07-14", 2: "Status is required",
+        3: "Quantity must be a number", 5: "nested values are not allowed",
+        6: "record is not a JSON object"}, 2),
+]
+
+ROUTES = {"EDI": "/api/edi", "LIVRAISON": "/api/deliveries"}
+
+
+def cleanup(engine):
+    with engine.begin() as conn:
+        for table in ("EDIGlobal", "DeliveryDetails", stock.SUMMARY_TABLE):
+            conn.execute(text(f'DELETE FROM "{table}" WHERE "Site" = :s'), {"s": SITE})
+
+
+def run_case(client, engine, name, file_type, records, expected, written):
+    ok = True
+    body = "\n".join(json.dumps(r) for r in records)
+    strict = client.post(ROUTES[file_type] + "?strict=1", data=body, content_type="application/x-ndjson")
+    if strict.status_code != 422 or (strict.get_json() or {}).get("written") != 0:
+        print(f"FAIL  {name} (strict): {strict.status_code} {strict.get_json()}")
+        ok = False
+
+    resp = client.post(ROUTES[file_type], data=body, content_type="application/x-ndjson")
+    summary = resp.get_json() or {}
+    got = {e["record"]: e["error"] for e in summary.get("errors", [])}
+    if resp.status_code != 200 or got != expected or summary.get("written") != written:
+        print(f"FAIL  {name}: {resp.status_code} written {summary.get('written')} (expected {written})")
+        for i in sorted(set(got) | set(expected)):
+            if got.get(i) != expected.get(i):
+                print(f"      record {i}: got {got.get(i)!r}, expected {expected.get(i)!r}")
+        ok = False
+    with engine.begin() as conn:
+        if file_type == "EDI":
+            stored = conn.execute(text('SELECT "DateFrom", "ForecastDate", "Quantity" FROM "EDIGlobal" '
+                                       'WHERE "Site" = :s'), {"s": SITE}).all()
+            stored_ok = all(r[0].startswith("2025-W") and r[1].startswith("2025-W") for r in stored)
+        else:
+            # the Dispatched lines as sent; the InTransit row they feed is the stress test's business
+            stored = conn.execute(text('SELECT "DeliveryNo", "Quantity" FROM "DeliveryDetails" '
+                                       'WHERE "Site" = :s AND "Status" = \'Dispatched\' ORDER BY 1'),
+                                  {"s": SITE}).all()
+            stored_ok = [tuple(r) for r in stored] == [("D1", 10), ("D5", 1200)]
+    if len(stored) != written or not stored_ok:
+        print(f"FAIL  {name}: stored {stored}")
+        ok = False
+    if ok:
+        print(f"ok    {name}: {summary['accepted']} accepted, {summary['rejected']} rejected")
+    return ok
+
+
+def main():
+    url = os.environ.get("EDI_BENCH_DB_URL")
+    if not url:
+        sys.exit("Set EDI_BENCH_DB_URL to a Postgres database with the app's tables.")
+    App.engine = engine = create_engine(url)
+    client = App.app.test_client()
+    ok = True
+    try:
+        for case in CASES:
+            cleanup(engine)
+            ok &= run_case(client, engine, *case)
+    finally:
+        cleanup(engine)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Fail if any hot query of the delivery / stock / ledger paths plans a sequential scan.
+
+    EDI_BENCH_DB_URL=postgresql+psycopg2://... python benchmarks/check_query_plans.py
+
+Applies the migrations (migrations.py) to the database, then, inside a transaction
+that is rolled back, fills "DeliveryDetails" with a realistic mix of history and
+InTransit rows (mostly Dispatched / Delivered) and "EDIGlobal" with forecast
+releases for the same parts, ANALYZEs both, and EXPLAINs every
+query with the same SQL text the app sends. Exits with status 1 when a plan reads
+one of the app's tables with a Seq Scan, or when merge mode's INSERT ... ON CONFLICT
+has no arbiter index. The natural-key index of merge mode (migration 5) is created
+inside the rolled-back transaction when the database does not have it.
+"""
+import datetime
+import json
+import os
+import sys
+
+from psycopg2.extras import execute_values
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import App  # noqa: E402
+import ledger  # noqa: E402
+import migrations  # noqa: E402
+import stock  # noqa: E402
+
+TABLES = {"DeliveryDetails", "EDIGlobal", ledger.LEDGER_TABLE, stock.SUMMARY_TABLE}
+SEED_ROWS = int(os.getenv("PLAN_CHECK_ROWS", "200000"))
+
+
+def seed(conn, n_rows):
+    """
+    n_rows delivery rows over 20 sites x 2000 part numbers, one in ten InTransit, a few
+    without part number; as many EDI forecast lines for the same keys, and a summary
+    row per key.
+    """
+    conn.execute(text("""
+        INSERT INTO "DeliveryDetails" ("Site","AVOMaterialNo","DeliveryNo","Quantity","Date","Status")
+        SELECT 'PLAN' || (i % 20),
+               CASE WHEN i % 997 = 0 THEN NULL ELSE 'V' || lpad((i % 2000)::text, 4, '0') END,
+               'FAC' || lpad((i / 3)::text, 7, '0'),
+               1 + i % 500,
+               DATE '2024-01-01' + (i % 600),
+               CASE WHEN i % 10 = 0 THEN 'InTransit' WHEN i % 10 < 6 THEN 'Dispatched' ELSE 'Delivered' END
+        FROM generate_series(1, :n) AS i
+    """), {"n": n_rows})
+    # forecast lines for the same keys, 52 weekly releases
+    conn.execute(text("""
+        INSERT INTO "EDIGlobal" ("Site","ClientCode","ClientMaterialNo","AVOMaterialNo","DateFrom","Quantity",
+                                 "ForecastDate")
+        SELECT 'PLAN' || (i % 20), 'PLAN', 'C' || i, 'V' || lpad((i % 2000)::text, 4, '0'),
+               '2025-W' || lpad((1 + i % 52)::text, 2, '0'), 1 + i % 900,
+               '2025-W' || lpad((1 + (i / 2000) % 52)::text, 2, '0')
+        FROM generate_series(1, :n) AS i
+    """), {"n": n_rows})
+    conn.execute(text(f"""
+        INSERT INTO "{stock.SUMMARY_TABLE}" ("Site", "AVOMaterialNo")
+        SELECT DISTINCT COALESCE("Site",''), COALESCE("AVOMaterialNo",'') FROM "DeliveryDetails"
+        WHERE "Site" LIKE 'PLAN%'
+        ON CONFLICT DO NOTHING
+    """))
+    conn.execute(text('ANALYZE "DeliveryDetails"'))
+    conn.execute(text('ANALYZE "EDIGlobal"'))
+    conn.execute(text(f'ANALYZE "{stock.SUMMARY_TABLE}"'))
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child)
+
+
+def _summary(plan):
+    return ", ".join(
+        f"{n['Node Type']}" + (f" using {n['Index Name']}" if "Index Name" in n else "")
+        + (f" on {n['Relation Name']}" if "Relation Name" in n else "")
+        + (f" arbiter {', '.join(n['Conflict Arbiter Indexes'])}" if n.get("Conflict Arbiter Indexes") else "")
+        for n in _nodes(plan) if "Relation Name" in n)
+
+
+def _problems(plan):
+    """Seq Scans of the app's tables, ON CONFLICT without an arbiter index."""
+    out = [f"Seq Scan on {n['Relation Name']}" for n in _nodes(plan)
+           if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in TABLES]
+    out += ["ON CONFLICT without arbiter index" for n in _nodes(plan)
+            if n.get("Conflict Resolution") and not n.get("Conflict Arbiter Indexes")]
+    return out
+
+
+def ensure_natural_key(conn):
+    """Migration 5's index, inside the caller's transaction, when merge mode was never migrated."""
+    if conn.execute(text("SELECT to_regclass(:i)"), {"i": f'"{migrations.EDI_NATURAL_KEY_INDEX}"'}).scalar():
+        return
+    m = next(m for m in migrations.MIGRATIONS if m.version == 5)
+    for stmt in m.statements:
+        conn.execute(text(stmt))
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+def explain_values(conn, sql, values):
+    with conn.connection.cursor() as cur:
+        (plan,), = execute_values(cur, "EXPLAIN (FORMAT JSON) " + sql, values, fetch=True)
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+def main():
+    url = os.environ.get("EDI_BENCH_DB_URL")
+    if not url:
+        sys.exit("Set EDI_BENCH_DB_URL to a Postgres database the check may migrate.")
+    engine = create_engine(url)
+    for m in migrations.migrate(engine):
+        print(f"applied migration {m.version}: {m.name}")
+
+    keys = [(f"PLAN{i % 20}", f"V{i:04d}") for i in range(0, 2000, 40)] + [("PLAN0", "")]
+    edi_cols = App.TEMPLATE_SCHEMAS["edi_template"]
+    # one line of merge_ediglobal's upsert: the ON CONFLICT probe goes through the arbiter index
+    merge_sql = f"""
+        INSERT INTO "EDIGlobal" AS t ({",".join(f'"{c}"' for c in edi_cols)})
+        VALUES ({",".join(f":{c}" for c in edi_cols)})
+        ON CONFLICT ({migrations.EDI_NATURAL_KEY_EXPRS}) DO UPDATE SET "Quantity" = EXCLUDED."Quantity"
+    """
+    merge_row = {**{c: None for c in edi_cols}, "Site": "PLAN3", "ClientCode": "PLAN", "ClientMaterialNo": "C42",
+                 "DateFrom": "2025-W01", "ForecastDate": "2025-W01", "Quantity": 1}
+    # as _apply_delivery_batch sends them: the old Date as read back from the database
+    day = datetime.date(2024, 3, 1)
+    old = [(site, avo, f"FAC{i:07d}", day, f"FAC{i:07d}", 10, day + datetime.timedelta(days=1))
+           for i, (site, avo) in enumerate(keys)]
+    checks = [
+        ("latest InTransit (row path)",
+         lambda c: explain(c, App.LATEST_INTRANSIT_SQL, {"site": "PLAN3", "avo_mat": "V0123"})),
+        ("latest InTransit, no part number (row path)",
+         lambda c: explain(c, App.LATEST_INTRANSIT_SQL, {"site": "PLAN3", "avo_mat": ""})),
+        ("move InTransit row (row path)",
+         lambda c: explain(c, App.MOVE_INTRANSIT_SQL, {"qty": 1, "date": "2024-03-02", "curr_del_no": "X",
+                                                       "old_del_no": "FAC0000123", "old_date": day})),
+        ("InTransit rows per key (bulk path)",
+         lambda c: explain(c, App.INTRANSIT_BATCH_SQL,
+                           {"sites": [k[0] for k in keys], "avos": [k[1] for k in keys]})),
+        ("move InTransit rows (bulk path)",
+         lambda c: explain_values(c, App.BULK_MOVE_INTRANSIT_SQL, old)),
+        ("stock summary refresh",
+         lambda c: explain(c, f"WITH keys AS ({stock._KEYS_PARAM}) {stock._AGGREGATE_SQL}",
+                           {"sites": [k[0] for k in keys], "avos": [k[1] for k in keys]})),
+        ("EDI merge upsert (ON CONFLICT)",
+         lambda c: explain(c, merge_sql, merge_row)),
+        ("stock read, part-number prefix",
+         lambda c: explain(c, stock.READ_SQL.format(where=stock._filters(None, "V019")[0]),
+                           {**stock._filters(None, "V019")[1], "limit": 100, "offset": 0})),
+        ("ledger lookup",
+         lambda c: explain(c, f'SELECT * FROM "{ledger.LEDGER_TABLE}" WHERE "BatchHash" = :k', {"k": "0" * 64})),
+    ]
+
+    failures = 0
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            seed(conn, SEED_ROWS)
+            ensure_natural_key(conn)
+            for name, run in checks:
+                plan = run(conn)
+                problems = _problems(plan)
+                failures += bool(problems)
+                print(f"{'FAIL' if problems else 'ok':<5} {name}: {_summary(plan)}"
+                      + (f" ({'; '.join(problems)})" if problems else ""))
+        finally:
+            trans.rollback()
+    if failures:
+        sys.exit(f"{failures} quer{'y' if failures == 1 else 'ies'} without a usable index")
+
+
+if __name__ == "__main__":
+    main()
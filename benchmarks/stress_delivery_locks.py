@@ -0,0 +1,213 @@
+"""
+Multi-process stress test of concurrent delivery imports.
+
+    EDI_BENCH_DB_URL=postgresql+psycopg2://... python benchmarks/stress_delivery_locks.py --processes 8
+
+Every (Site 'STRESS', AVOMaterialNo) key starts with one InTransit row of 1,000,000.
+Each process, like a separate gunicorn worker, then imports batches of Dispatched
+(+qty) and Delivered (-qty) lines through insert_deliverydetails. Some part numbers
+are shared by all processes (--overlap of the lines) and the rest are private. The
+quantities never get near zero, so the final InTransit balance of every key is the
+seed plus its dispatched minus its delivered quantities, whatever order the batches
+ran in. The check also requires exactly one InTransit row per key, every
+Dispatched / Delivered line written, and "StockSummary" agreeing with the table.
+
+--streamed writes each process's batches to one CSV file and imports it through
+insert_upload_streamed as a single transaction, one batch per chunk: overlapping
+streams must neither deadlock nor lose updates (with --overlap 0.01 --hot-keys 20,
+consecutive chunks share few keys: the case that deadlocks when each chunk locks
+only its own). --without-locks disables key_locks
+in the workers to show the lost updates the locks prevent. Exits with status 1 on
+any mismatch.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+import stock  # noqa: E402
+
+SITE = "STRESS"
+SEED_QTY = 1_000_000
+
+
+def hot_keys(args):
+    return [f"H{i:03d}" for i in range(args.hot_keys)]
+
+
+def private_keys(args, proc):
+    return [f"P{proc:02d}-{i:03d}" for i in range(args.private_keys)]
+
+
+def make_batches(args, proc):
+    """[(frame columns as dict of lists, {avo: expected InTransit delta})] for one process."""
+    rnd = random.Random(proc)
+    hot, own = hot_keys(args), private_keys(args, proc)
+    batches = []
+    for b in range(args.batches):
+        cols = {c: [] for c in ("Site", "AVOMaterialNo", "DeliveryNo", "Date", "Quantity", "Status")}
+        delta = {}
+        for i in range(args.lines):
+            avo = rnd.choice(hot) if rnd.random() < args.overlap else rnd.choice(own)
+            qty = rnd.randint(1, 100)
+            status = rnd.choice(["Dispatched", "Delivered"])
+            cols["Site"].append(SITE)
+            cols["AVOMaterialNo"].append(avo)
+            cols["DeliveryNo"].append(f"S{proc:02d}{b:04d}{i:05d}")
+            cols["Date"].append(f"2025-{rnd.randint(2, 12):02d}-{rnd.randint(1, 28):02d}")
+            cols["Quantity"].append(str(qty))
+            cols["Status"].append(status)
+            delta[avo] = delta.get(avo, 0) + (qty if status == "Dispatched" else -qty)
+        batches.append((cols, delta))
+    return batches
+
+
+def worker(proc, args, start, results):
+    import pandas as pd
+    import App
+    import key_locks
+    if args.without_locks:
+        key_locks.lock_keys = lambda conn, keys, namespace=None: 0
+    App.engine = create_engine(args.db_url)
+    batches = [(pd.DataFrame(cols), delta) for cols, delta in make_batches(args, proc)]
+    if args.streamed:
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, f"stress_{proc:02d}.csv")
+        pd.concat([df for df, _ in batches]).to_csv(path, index=False)
+    start.wait()  # all workers set up: time the imports only
+    t0 = time.perf_counter()
+    errors = []
+    if args.streamed:
+        try:
+            App.insert_upload_streamed(path, ".csv", "LIVRAISON", chunk_rows=args.lines, commit_per_chunk=False)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e).splitlines()[0]}")
+        os.remove(path)
+        os.rmdir(tmp)
+        batches = []
+    for df, _ in batches:
+        norm, _ = App._normalize_delivery_frame(df)
+        try:
+            App.insert_deliverydetails(norm, bulk=not args.row_path)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e).splitlines()[0]}")
+    results.put((proc, time.perf_counter() - t0, errors))
+
+
+def _cleanup(conn):
+    conn.execute(text(f"""DELETE FROM "DeliveryDetails" WHERE "Site" = '{SITE}'"""))
+    if stock._has_table(conn):
+        conn.execute(text(f"""DELETE FROM "{stock.SUMMARY_TABLE}" WHERE "Site" = '{SITE}'"""))
+
+
+def seed(engine, args):
+    keys = hot_keys(args) + [k for p in range(args.processes) for k in private_keys(args, p)]
+    with engine.begin() as conn:
+        _cleanup(conn)
+        conn.execute(text("""
+            INSERT INTO "DeliveryDetails" ("Site","AVOMaterialNo","DeliveryNo","Quantity","Date","Status")
+            SELECT :site, avo, 'SEED-' || avo, :qty, DATE '2025-01-01', 'InTransit'
+            FROM unnest(CAST(:avos AS text[])) AS avo
+        """), {"site": SITE, "qty": SEED_QTY, "avos": keys})
+        stock.refresh(conn, [(SITE, avo) for avo in keys])
+    return keys
+
+
+def verify(engine, args, keys, expected):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT "AVOMaterialNo" AS avo,
+                   sum("Quantity") FILTER (WHERE "Status" = 'InTransit') AS in_transit,
+                   count(*) FILTER (WHERE "Status" = 'InTransit') AS transit_rows,
+                   count(*) FILTER (WHERE "Status" IN ('Dispatched', 'Delivered')) AS lines
+            FROM "DeliveryDetails" WHERE "Site" = :site GROUP BY 1
+        """), {"site": SITE}).mappings().all()
+        summary = {}
+        if stock._has_table(conn):
+            summary = dict(conn.execute(text(f"""
+                SELECT "AVOMaterialNo", "InTransitQty" FROM "{stock.SUMMARY_TABLE}" WHERE "Site" = :site
+            """), {"site": SITE}).all())
+    got = {r["avo"]: r for r in rows}
+    problems = []
+    lines = sum(r["lines"] for r in rows)
+    if lines != args.processes * args.batches * args.lines:
+        problems.append(f"{lines} Dispatched/Delivered lines written, "
+                        f"expected {args.processes * args.batches * args.lines}")
+    for avo in keys:
+        want = SEED_QTY + expected.get(avo, 0)
+        r = got.get(avo)
+        if r is None or r["transit_rows"] != 1 or r["in_transit"] != want:
+            problems.append(f"{avo}: InTransit {r and r['in_transit']} in {r and r['transit_rows']} row(s), "
+                            f"expected {want} in 1")
+        elif summary and summary.get(avo) != want:
+            problems.append(f"{avo}: StockSummary InTransitQty {summary.get(avo)}, expected {want}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--processes", type=int, default=8)
+    ap.add_argument("--batches", type=int, default=20, help="batches per process")
+    ap.add_argument("--lines", type=int, default=200, help="lines per batch")
+    ap.add_argument("--hot-keys", type=int, default=10, help="part numbers shared by all processes")
+    ap.add_argument("--private-keys", type=int, default=200, help="part numbers of each process")
+    ap.add_argument("--overlap", type=float, default=0.2, help="share of lines on a shared part number")
+    ap.add_argument("--row-path", action="store_true", help="use the row-by-row path instead of the bulk one")
+    ap.add_argument("--streamed", action="store_true",
+                    help="import one file per process, streamed in a single transaction")
+    ap.add_argument("--without-locks", action="store_true")
+    ap.add_argument("--keep", action="store_true", help="leave the STRESS rows in the database")
+    ap.add_argument("--db-url", default=os.environ.get("EDI_BENCH_DB_URL"))
+    args = ap.parse_args()
+    if not args.db_url:
+        sys.exit("Set EDI_BENCH_DB_URL (or --db-url) to a throwaway Postgres database.")
+
+    engine = create_engine(args.db_url)
+    keys = seed(engine, args)
+    expected = {}
+    for p in range(args.processes):
+        for _, delta in make_batches(args, p):
+            for avo, d in delta.items():
+                expected[avo] = expected.get(avo, 0) + d
+
+    ctx = mp.get_context("spawn")  # fresh interpreters, like separate gunicorn workers
+    start, results = ctx.Barrier(args.processes + 1), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(p, args, start, results)) for p in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    start.wait()
+    t0 = time.perf_counter()
+    outcomes = [results.get() for _ in procs]
+    wall = time.perf_counter() - t0
+    for proc in procs:
+        proc.join()
+
+    errors = [e for _, _, errs in outcomes for e in errs]
+    busy = sum(t for _, t, _ in outcomes)
+    n_lines = args.processes * args.batches * args.lines
+    print(f"{args.processes} processes x {args.batches} batches x {args.lines} lines "
+          f"({'streamed' if args.streamed else 'row' if args.row_path else 'bulk'} path, "
+          f"{'no locks' if args.without_locks else 'key locks'}): "
+          f"{wall:.1f} s wall, {n_lines / wall:.0f} lines/s, parallelism {busy / wall:.1f}x")
+    problems = [f"import failed: {e}" for e in errors] + verify(engine, args, keys, expected)
+    if not args.keep:
+        with engine.begin() as conn:
+            _cleanup(conn)
+    if problems:
+        print(f"{len(problems)} problem(s):")
+        for p in problems[:20]:
+            print("  " + p)
+        sys.exit(1)
+    print(f"ok: {len(keys)} InTransit balances match")
+
+
+if __name__ == "__main__":
+    main()
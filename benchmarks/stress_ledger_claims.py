@@ -0,0 +1,126 @@
+"""
+Concurrent imports of the same file must write it once.
+
+    EDI_BENCH_DB_URL=postgresql+psycopg2://... python benchmarks/stress_ledger_claims.py --processes 2
+
+Writes one delivery CSV of Dispatched lines (Site 'LEDGERCHECK'), then starts the
+processes, like separate gunicorn workers, that all stream it at the same moment
+through insert_upload_streamed with the same ledger key (ledger.file_key). Run once
+with commit_per_chunk and once as a single transaction. Exactly one import must
+succeed and the others must stop with ledger.AlreadyIngested; "DeliveryDetails"
+must then hold every line of the file exactly once. Exits with status 1 otherwise.
+"""
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+import ledger  # noqa: E402
+import stock  # noqa: E402
+
+SITE = "LEDGERCHECK"
+
+
+def write_file(path, n_lines):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Site", "AVOMaterialNo", "DeliveryNo", "Quantity", "Date", "Status"])
+        for i in range(n_lines):
+            w.writerow([SITE, f"L{i % 50:03d}", f"LC{i:07d}", 1 + i % 9, f"2025-06-{1 + i % 28:02d}", "Dispatched"])
+
+
+def worker(proc, args, path, commit_per_chunk, start, results):
+    import App
+    App.engine = create_engine(args.db_url)
+    key = ledger.file_key(path, "LIVRAISON")
+    start.wait()
+    t0 = time.perf_counter()
+    try:
+        _, written, _ = App.insert_upload_streamed(path, ".csv", "LIVRAISON", chunk_rows=args.chunk_rows,
+                                                   commit_per_chunk=commit_per_chunk, batch_key=key,
+                                                   file_name=os.path.basename(path))
+        outcome = f"written {written}"
+    except ledger.AlreadyIngested:
+        outcome = "already imported"
+    except Exception as e:
+        outcome = f"{type(e).__name__}: {str(e).splitlines()[0]}"
+    results.put((proc, time.perf_counter() - t0, outcome))
+
+
+def _cleanup(conn, key):
+    conn.execute(text('DELETE FROM "DeliveryDetails" WHERE "Site" = :s'), {"s": SITE})
+    if stock._has_table(conn):
+        conn.execute(text(f'DELETE FROM "{stock.SUMMARY_TABLE}" WHERE "Site" = :s'), {"s": SITE})
+    ledger.ensure_table(conn)
+    conn.execute(text(f'DELETE FROM "{ledger.LEDGER_TABLE}" WHERE "BatchHash" = :k'), {"k": key})
+
+
+def run(engine, args, path, commit_per_chunk):
+    key = ledger.file_key(path, "LIVRAISON")
+    with engine.begin() as conn:
+        _cleanup(conn, key)
+    ctx = mp.get_context("spawn")
+    start, results = ctx.Barrier(args.processes), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(p, args, path, commit_per_chunk, start, results))
+             for p in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    outcomes = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    with engine.begin() as conn:
+        lines = conn.execute(text("""
+            SELECT count(*) FROM "DeliveryDetails" WHERE "Site" = :s AND "Status" = 'Dispatched'
+        """), {"s": SITE}).scalar()
+        if not args.keep:
+            _cleanup(conn, key)
+    mode = "commit per chunk" if commit_per_chunk else "single transaction"
+    problems = []
+    done = [o for _, _, o in outcomes if o.startswith("written")]
+    if len(done) != 1:
+        problems.append(f"{len(done)} imports wrote the file, expected 1")
+    problems += [f"import failed: {o}" for _, _, o in outcomes
+                 if not o.startswith("written") and o != "already imported"]
+    if lines != args.lines:
+        problems.append(f"{lines} Dispatched lines in the table, expected {args.lines}")
+    slowest = max(t for _, t, _ in outcomes)
+    print(f"{'FAIL' if problems else 'ok':<5} {mode}: {', '.join(sorted(o for _, _, o in outcomes))} "
+          f"({slowest:.1f} s)")
+    for p in problems:
+        print("      " + p)
+    return not problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--processes", type=int, default=2)
+    ap.add_argument("--lines", type=int, default=20000, help="lines of the file")
+    ap.add_argument("--chunk-rows", type=int, default=500)
+    ap.add_argument("--keep", action="store_true", help="leave the LEDGERCHECK rows in the database")
+    ap.add_argument("--db-url", default=os.environ.get("EDI_BENCH_DB_URL"))
+    args = ap.parse_args()
+    if not args.db_url:
+        sys.exit("Set EDI_BENCH_DB_URL (or --db-url) to a throwaway Postgres database.")
+
+    engine = create_engine(args.db_url)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger_check.csv")
+        write_file(path, args.lines)
+        for commit_per_chunk in (True, False):
+            ok &= run(engine, args, path, commit_per_chunk)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
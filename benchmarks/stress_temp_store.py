@@ -0,0 +1,67 @@
+"""
+Multi-process stress test of TempStore entry updates.
+
+    python benchmarks/stress_temp_store.py --processes 6 --updates 300
+
+The processes, like separate gunicorn workers, share one owner in a temporary
+directory: process 0 alternately tracks a file and holds the entry (an insert job),
+the others only track files (uploads). Every tracked path must end up in the entry,
+and a sweep run while process 0 holds the entry must not evict it. Exits with
+status 1 on any lost path.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from temp_store import TempStore  # noqa: E402
+
+OWNER = "5" * 32
+
+
+def worker(directory, proc, updates, start):
+    store = TempStore(directory, max_bytes=0)
+    start.wait()
+    for i in range(updates):
+        path = os.path.join(directory, f"upload_{proc}_{i}")
+        if proc == 0 and i % 2:
+            with store.hold(OWNER):
+                store.sweep()  # max_bytes=0: evicts whatever is not held
+            continue
+        with open(path, "w") as fh:
+            fh.write("x")
+        store.track(OWNER, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--processes", type=int, default=6)
+    ap.add_argument("--updates", type=int, default=300, help="updates per process")
+    args = ap.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        TempStore(directory).track(OWNER)
+        ctx = mp.get_context("spawn")
+        start = ctx.Barrier(args.processes)
+        procs = [ctx.Process(target=worker, args=(directory, p, args.updates, start))
+                 for p in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        entry = TempStore(directory)._read(OWNER)
+        kept = len(entry["paths"]) if entry else 0
+        want = (args.processes - 1) * args.updates + args.updates // 2
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"{kept} of {want} tracked paths kept")
+    if kept != want:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Benchmark suite: rows/sec and peak RSS of each pipeline stage on synthetic data.
+
+    python benchmarks/suite.py --rows 100000 --save before
+    python benchmarks/suite.py --rows 100000 --compare before
+
+Inputs are generated once into a temporary directory (synthetic.py), then every
+stage runs in a Python process of its own, so the peak RSS reported is that
+stage's. The db.* stages need EDI_BENCH_DB_URL pointing to a throwaway Postgres
+that already has the tables (db.edi.merge also needs merge mode's index:
+EDI_INSERT_MODE=merge python migrations.py). Without it they are skipped: the insert paths rely on
+COPY, DISTINCT ON and ON CONFLICT on expressions, which a SQLite stand-in would not
+exercise. Their rows are tagged with ClientCode / Site 'BENCH' and deleted afterwards.
+
+Baselines are JSON files under benchmarks/baselines/; numbers are only comparable
+between runs on the same machine with the same parameters. --compare exits with
+status 1 when a stage got slower (or its peak RSS grew) by more than --threshold.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_DIR = os.path.join(HERE, "baselines")
+
+
+# ---------------------------------------------------------------- stages
+# name -> (needs database, setup(data_dir, args) -> ctx, run(ctx) -> rows processed)
+
+def _app(args):
+    import App
+    if args.db_url:
+        from sqlalchemy import create_engine
+        App.engine = create_engine(args.db_url)
+    return App
+
+
+def _setup_file(name):
+    def setup(data_dir, args):
+        import upload_reader  # imported here so pandas/openpyxl start-up is not timed
+        return {"reader": upload_reader, "path": os.path.join(data_dir, name)}
+    return setup
+
+
+def _run_read(ctx):
+    path = ctx["path"]
+    return len(ctx["reader"].read_upload(path, os.path.splitext(path)[1]))
+
+
+def _run_xlsx_stream(ctx):
+    chunks = ctx["reader"].iter_upload_chunks(ctx["path"], ".xlsx", chunk_rows=50_000)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def _setup_pdf(data_dir, args):
+    App = _app(args)
+    paths = sorted(os.path.join(data_dir, n) for n in os.listdir(data_dir) if n.endswith(".pdf"))
+    return {"App": App, "paths": paths}
+
+
+def _run_pdf(ctx):
+    frames = ctx["App"].parse_delivery_pdf_batch(ctx["paths"], workers=1, use_cache=False)
+    return sum(len(df) for df in frames)
+
+
+def _setup_delivery(data_dir, args):
+    from synthetic import make_delivery_frame
+    return {"App": _app(args), "df": make_delivery_frame(args.rows, dup_ratio=args.dup_ratio)}
+
+
+def _run_normalize(ctx):
+    ctx["App"]._normalize_delivery_frame(ctx["df"].copy())
+    return len(ctx["df"])
+
+
+def _setup_edi(data_dir, args):
+    from synthetic import make_edi_frame
+    return {"App": _app(args), "df": make_edi_frame(args.rows, dup_ratio=args.dup_ratio)}
+
+
+def _run_schema(ctx):
+    ctx["App"]._conform_upload(ctx["df"], "EDI")
+    return len(ctx["df"])
+
+
+def _run_ledger_hash(ctx):
+    import ledger
+    ledger.frame_key(ctx["App"]._edi_frame(ctx["df"]), "EDI")
+    return len(ctx["df"])
+
+
+def _clean_bench_rows(App):
+    from sqlalchemy import text
+    with App.engine.begin() as conn:
+        conn.execute(text("""DELETE FROM "EDIGlobal" WHERE "ClientCode" = 'BENCH'"""))
+        conn.execute(text("""DELETE FROM "DeliveryDetails" WHERE "Site" = 'BENCH'"""))
+
+
+def _setup_db(base_setup):
+    def setup(data_dir, args):
+        ctx = base_setup(data_dir, args)
+        _clean_bench_rows(ctx["App"])
+        return ctx
+    return setup
+
+
+def _run_edi_copy(ctx):
+    try:
+        return ctx["App"].insert_ediglobal(ctx["df"])
+    finally:
+        _clean_bench_rows(ctx["App"])
+
+
+def _run_edi_merge(ctx):
+    try:
+        ctx["App"].merge_ediglobal(ctx["df"])
+        return len(ctx["df"])
+    finally:
+        _clean_bench_rows(ctx["App"])
+
+
+def _run_delivery_insert(ctx):
+    App = ctx["App"]
+    try:
+        df, pre_count = App._normalize_delivery_frame(ctx["df"].copy())
+        App.insert_deliverydetails(df)
+        return pre_count
+    finally:
+        _clean_bench_rows(App)
+
+
+STAGES = {
+    "csv.read": (False, _setup_file("edi.csv"), _run_read),
+    "xlsx.read": (False, _setup_file("edi.xlsx"), _run_read),
+    "xlsx.stream": (False, _setup_file("edi.xlsx"), _run_xlsx_stream),
+    "pdf.parse": (False, _setup_pdf, _run_pdf),
+    "normalize.delivery": (False, _setup_delivery, _run_normalize),
+    "schema.edi": (False, _setup_edi, _run_schema),
+    "ledger.hash": (False, _setup_edi, _run_ledger_hash),
+    "db.edi.copy": (True, _setup_db(_setup_edi), _run_edi_copy),
+    "db.edi.merge": (True, _setup_db(_setup_edi), _run_edi_merge),
+    "db.delivery": (True, _setup_db(_setup_delivery), _run_delivery_insert),
+}
+
+
+# ---------------------------------------------------------------- measuring
+
+def _status_mb(field):
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM (Linux) so the peak covers the stage only, not the setup."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_stage(name, data_dir, args):
+    """Child process body: set the stage up, measure one run, print the result as JSON."""
+    _, setup, run = STAGES[name]
+    ctx = setup(data_dir, args)
+    rss_before = _status_mb("VmRSS")
+    exact_peak = _reset_peak_rss()
+    t0 = time.perf_counter()
+    rows = run(ctx)
+    seconds = time.perf_counter() - t0
+    peak = _status_mb("VmHWM") if exact_peak else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"rows": rows, "seconds": seconds, "rows_per_s": rows / seconds if seconds else None,
+                      "peak_rss_mb": peak, "rss_growth_mb": peak - rss_before if rss_before else None}))
+
+
+def generate_inputs(data_dir, args):
+    from synthetic import make_edi_frame, write_csv, write_invoice_pdfs, write_xlsx
+    edi = make_edi_frame(args.rows, dup_ratio=args.dup_ratio)
+    write_csv(edi, os.path.join(data_dir, "edi.csv"))
+    write_xlsx(edi.head(args.xlsx_rows), os.path.join(data_dir, "edi.xlsx"))
+    write_invoice_pdfs(data_dir, args.pdf_files, args.pdf_pages, args.pdf_lines)
+
+
+def _child_args(args):
+    out = ["--rows", str(args.rows), "--dup-ratio", str(args.dup_ratio)]
+    if args.db_url:
+        out += ["--db-url", args.db_url]
+    return out
+
+
+def run_suite(args):
+    names = args.stages or list(STAGES)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="edi_bench_") as data_dir:
+        t0 = time.perf_counter()
+        generate_inputs(data_dir, args)
+        print(f"inputs generated in {time.perf_counter() - t0:.1f} s ({data_dir})")
+        for name in names:
+            if STAGES[name][0] and not args.db_url:
+                print(f"{name:<20} skipped (set EDI_BENCH_DB_URL)")
+                continue
+            runs = []
+            for _ in range(args.repeat):
+                # cwd=data_dir: App's outputs/ directory is created there, not in the repo
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--stage", name, "--data", data_dir,
+                     *_child_args(args)],
+                    cwd=data_dir, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"{name:<20} FAILED\n{proc.stderr.strip()[-2000:]}")
+                    break
+                runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            if not runs:
+                continue
+            best = min(runs, key=lambda r: r["seconds"])
+            best["peak_rss_mb"] = max(r["peak_rss_mb"] for r in runs)
+            results[name] = best
+            print(f"{name:<20} {best['rows']:>9} rows  {best['seconds']:8.2f} s  "
+                  f"{best['rows_per_s']:11.0f} rows/s  peak {best['peak_rss_mb']:7.1f} MB"
+                  f"  (+{best['rss_growth_mb'] or 0:.1f} MB)")
+    return results
+
+
+# ---------------------------------------------------------------- baselines
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _params(args):
+    return {k: getattr(args, k) for k in ("rows", "dup_ratio", "xlsx_rows", "pdf_files", "pdf_pages", "pdf_lines")}
+
+
+def save_baseline(name, args, results):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"name": name, "commit": _git_commit(), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "params": _params(args), "results": results}, fh, indent=2, sort_keys=True)
+    print(f"baseline saved to {path}")
+
+
+def compare(name, args, results):
+    with open(os.path.join(BASELINE_DIR, f"{name}.json"), encoding="utf-8") as fh:
+        base = json.load(fh)
+    if base["params"] != _params(args):
+        print(f"warning: baseline parameters differ: {base['params']}")
+    print(f"\nagainst baseline '{name}' (commit {base.get('commit')}, {base.get('created')}):")
+    regressions = []
+    for stage, now in results.items():
+        old = base["results"].get(stage)
+        if not old:
+            print(f"{stage:<20} (not in baseline)")
+            continue
+        speed = now["rows_per_s"] / old["rows_per_s"] - 1
+        rss = now["peak_rss_mb"] / old["peak_rss_mb"] - 1
+        flag = ""
+        if speed < -args.threshold or rss > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(stage)
+        print(f"{stage:<20} rows/s {speed:+7.1%}   peak RSS {rss:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--rows", type=int, default=100_000, help="EDI / delivery rows")
+    ap.add_argument("--dup-ratio", type=float, default=0.1, help="share of lines repeating an earlier key")
+    ap.add_argument("--xlsx-rows", type=int, default=20_000)
+    ap.add_argument("--pdf-files", type=int, default=4)
+    ap.add_argument("--pdf-pages", type=int, default=10)
+    ap.add_argument("--pdf-lines", type=int, default=45, help="item lines per page")
+    ap.add_argument("--stages", nargs="+", choices=list(STAGES), help="default: all")
+    ap.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is kept")
+    ap.add_argument("--db-url", default=os.environ.get("EDI_BENCH_DB_URL"))
+    ap.add_argument("--save", metavar="NAME", help="save the results as baseline NAME")
+    ap.add_argument("--compare", metavar="NAME", help="compare the results with baseline NAME")
+    ap.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    ap.add_argument("--stage", help=argparse.SUPPRESS)
+    ap.add_argument("--data", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    sys.path[:0] = [HERE, ROOT]
+    if args.stage:
+        run_stage(args.stage, args.data, args)
+        return
+
+    results = run_suite(args)
+    if args.save:
+        save_baseline(args.save, args, results)
+    if args.compare and compare(args.compare, args, results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
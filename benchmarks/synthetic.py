@@ -0,0 +1,99 @@
+"""
+Synthetic inputs for the benchmarks: EDI forecasts and delivery batches of any size,
+with a configurable share of duplicate keys, written as the files users upload
+(semicolon Latin-1 CSV, .xlsx), plus multi-page invoice PDFs (see synthetic_pdf).
+
+Everything is deterministic for a given seed, so runs on different commits parse
+and insert exactly the same data.
+"""
+import os
+import random
+
+import pandas as pd
+from openpyxl import Workbook
+
+from synthetic_pdf import make_invoice_pdf  # noqa: F401  (re-exported)
+
+PRODUCTS = ["Porte-balai équipé", "Balai carbone Ø12", "Collecteur à lamelles", "Brush holder assembly"]
+EDI_COLUMNS = ["Site", "ClientCode", "ClientMaterialNo", "AVOMaterialNo", "DateFrom", "DateUntil", "Quantity",
+               "ForecastDate", "LastDeliveryDate", "LastDeliveredQuantity", "CumulatedQuantity", "EDIStatus",
+               "ProductName", "LastDeliveryNo"]
+
+
+def _duplicate_sources(n_rows, dup_ratio, seed):
+    """For each row, the index of an earlier row whose key it repeats, or None."""
+    rnd = random.Random(seed)
+    return [rnd.randrange(i) if i and rnd.random() < dup_ratio else None for i in range(n_rows)]
+
+
+def make_edi_frame(n_rows, *, dup_ratio=0.0, client="BENCH", seed=0):
+    """
+    EDI lines as /insert receives them (all strings). dup_ratio of the lines repeat the
+    natural key (Site, ClientCode, ClientMaterialNo, ForecastDate, DateFrom) of an earlier
+    line with another quantity, as a re-sent forecast does.
+    """
+    dup_of = _duplicate_sources(n_rows, dup_ratio, seed)
+    rows = []
+    for i in range(n_rows):
+        src = i if dup_of[i] is None else dup_of[i]
+        rows.append({
+            "Site": "Tunisia", "ClientCode": client, "ClientMaterialNo": f"C-{src:06d}",
+            "AVOMaterialNo": f"V{src % 500:03d}.{src % 997:03d}", "DateFrom": f"2025-W{1 + src % 52:02d}",
+            "DateUntil": "2025-12-31", "Quantity": str(100 + i % 900), "ForecastDate": "2025-W28",
+            "LastDeliveryDate": "2025-W27", "LastDeliveredQuantity": "120", "CumulatedQuantity": str(i),
+            "EDIStatus": "Forcast", "ProductName": "Brush holder assembly", "LastDeliveryNo": f"BL{i:07d}",
+        })
+    return pd.DataFrame(rows, columns=EDI_COLUMNS, dtype=str)
+
+
+def make_delivery_frame(n_rows, *, dup_ratio=0.0, n_materials=800, site="BENCH", seed=0):
+    """
+    Delivery lines (all strings). dup_ratio of the lines repeat the
+    (Site, AVOMaterialNo, DeliveryNo, Date, Status) of an earlier line, which the
+    normalization pre-aggregates.
+    """
+    rnd = random.Random(seed)
+    dup_of = _duplicate_sources(n_rows, dup_ratio, seed + 1)
+    rows = []
+    for i in range(n_rows):
+        if dup_of[i] is not None:
+            rows.append({**rows[dup_of[i]], "Quantity": str(rnd.randint(1, 500))})
+            continue
+        rows.append({
+            "Site": site, "AVOMaterialNo": f"V{rnd.randrange(n_materials):04d}",
+            "DeliveryNo": f"FAC{i // 50:06d}", "Date": f"2025-{1 + i * 12 // n_rows:02d}-15",
+            "Quantity": str(rnd.randint(1, 500)), "Status": rnd.choice(["Dispatched", "Dispatched", "Delivered"]),
+        })
+    return pd.DataFrame(rows, dtype=str)
+
+
+def write_csv(df, path, *, sep=";", encoding="latin-1"):
+    """The ERP export format: semicolon-delimited Latin-1 with accented product names."""
+    out = df.copy()
+    if "ProductName" in out.columns:
+        out["ProductName"] = [PRODUCTS[i % len(PRODUCTS)] for i in range(len(out))]
+    out.to_csv(path, sep=sep, index=False, encoding=encoding)
+    return path
+
+
+def write_xlsx(df, path):
+    """Write-only openpyxl workbook (fast enough for a few hundred thousand rows)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(list(row))
+    wb.save(path)
+    return path
+
+
+def write_invoice_pdfs(directory, n_files, n_pages, lines_per_page, *, seed=0):
+    """n_files invoice PDFs under directory; returns their paths."""
+    paths = []
+    for i in range(n_files):
+        data, _ = make_invoice_pdf(n_pages, lines_per_page, invoice_no=f"F2025-{i:04d}", seed=seed + i)
+        path = os.path.join(directory, f"invoice_{i:03d}.pdf")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        paths.append(path)
+    return paths
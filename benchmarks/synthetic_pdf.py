@@ -0,0 +1,86 @@
+"""
+Minimal, dependency-free writer for synthetic customs invoices that look like the
+ones parse_delivery_pdf_bytes reads: a "FACTURE n° ..." / "Date dd/mm/yyyy" header
+and item lines in the layout line_pat expects, optionally drawn as a ruled table
+with REFERENCE / QUANTITE headers so the table path is exercised too.
+"""
+import random
+
+
+def _esc(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text(x, y, s, size=8):
+    return f"BT /F1 {size} Tf {x} {y} Td ({_esc(s)}) Tj ET"
+
+
+def _page_stream(lines, header, table):
+    ops = []
+    y = 800
+    for h in header:
+        ops.append(_text(40, y, h, 10))
+        y -= 16
+    y -= 10
+    if table:
+        cols = [40, 110, 230, 330, 420, 560]
+        heads = ["NGP", "REFERENCE", "DESIGNATION", "QUANTITE", "PRIX"]
+        top = y + 12
+        rows = [heads] + [[l["ngp"], l["ref"], l["name"], str(l["qty"]), l["price"]] for l in lines]
+        for r in rows:
+            for x, cell in zip(cols, r):
+                ops.append(_text(x + 3, y, cell))
+            y -= 14
+        bottom = y + 12 - 2
+        for x in cols:
+            ops.append(f"{x} {top} m {x} {bottom} l S")
+        yy = top
+        for _ in range(len(rows) + 1):
+            ops.append(f"{cols[0]} {yy} m {cols[-1]} {yy} l S")
+            yy -= 14
+    else:
+        for l in lines:
+            ops.append(_text(40, y, f'{l["ngp"]} OUI {l["ref"]} {l["name"]} {l["qty"]} {l["price"]} 0,3262 313,15'))
+            y -= 12
+    ops.append(_text(40, max(y - 10, 20), "TOTAL"))
+    return "\n".join(ops).encode("latin-1")
+
+
+def make_invoice_pdf(n_pages=3, lines_per_page=40, *, invoice_no="F2025-0001", date="15/07/2025",
+                     n_materials=200, table=False, seed=0):
+    """Return (pdf_bytes, expected [(ref, qty)]) for a synthetic invoice."""
+    rnd = random.Random(seed)
+    pages, expected = [], []
+    for p in range(n_pages):
+        lines = []
+        for _ in range(lines_per_page):
+            core = f"V{rnd.randrange(n_materials):03d}.{rnd.randrange(1000):03d}"
+            sfx = rnd.choice(["", "", " SP", " PL"])
+            qty = rnd.randint(1, 5000)
+            lines.append({"ngp": "85030010", "ref": core + sfx, "name": "PPC 11TA BROSSE",
+                          "qty": qty, "price": f"{rnd.randint(1, 9)},{rnd.randint(1000, 9999)}"})
+            expected.append((core + sfx.strip(), qty))
+        header = [f"FACTURE n° {invoice_no}", f"Date {date}", "AVOCARBON TUNISIA"] if p == 0 else [f"Page {p + 1}"]
+        pages.append(_page_stream(lines, header, table))
+
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for stream in pages:
+        content_id = len(objs) + 1
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(len(objs) + 1)
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                    f"/Contents {content_id} 0 R >>".encode())
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out), expected
@@ -0,0 +1,152 @@
+"""
+Lazily created, per-process SQLAlchemy engine.
+
+Nothing connects at import time: the engine is built on first use in each process,
+with pool size / overflow / recycle / pre-ping taken from the environment. An engine
+inherited through fork (gunicorn --preload) is disposed without closing the parent's
+sockets and rebuilt in the child. Time spent waiting for a pooled connection is
+recorded so pool starvation shows up in pool_stats(). That wait excludes opening new
+connections and the pre-ping round trip, timed through the engine's connect events
+and reported apart as setup, so slow connects are not mistaken for pool starvation.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+
+def pool_options_from_env(prefix="DB_"):
+    """create_engine pool keyword arguments from DB_POOL_SIZE, DB_MAX_OVERFLOW, ..."""
+    return {
+        "pool_size": int(os.getenv(f"{prefix}POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv(f"{prefix}MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv(f"{prefix}POOL_TIMEOUT", "30")),
+        # Azure drops idle connections; recycle well before that and ping on checkout
+        "pool_recycle": int(os.getenv(f"{prefix}POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv(f"{prefix}POOL_PRE_PING", "1") == "1",
+    }
+
+
+class LazyEngine:
+    """Engine stand-in exposing connect() / begin() / dispose(); the real engine is built on demand."""
+
+    def __init__(self, url, **engine_kwargs):
+        self.url = url
+        self.engine_kwargs = engine_kwargs
+        self._engine = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()  # setup time of the connect() running in this thread
+        self._reset_stats()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset_stats(self):
+        self._stats = {"checkouts": 0, "wait_total_s": 0.0, "wait_max_s": 0.0, "timeouts": 0,
+                       "connects": 0, "setup_total_s": 0.0}
+
+    def _after_fork(self):
+        # the child must not reuse (or close) the parent's pooled sockets
+        if self._engine is not None:
+            self._engine.dispose(close=False)
+        self._engine = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def get(self):
+        """The engine for the current process, created on first call."""
+        pid = os.getpid()
+        if self._engine is not None and self._pid == pid:
+            return self._engine
+        with self._lock:
+            if self._engine is not None and self._pid != pid:
+                self._engine.dispose(close=False)
+                self._engine = None
+            if self._engine is None:
+                self._engine = create_engine(self.url, **self.engine_kwargs)
+                self._instrument(self._engine)
+                self._pid = pid
+            return self._engine
+
+    def _instrument(self, engine):
+        """Time new DBAPI connections (do_connect -> connect) and pre-pings into self._local."""
+        local = self._local
+
+        @event.listens_for(engine, "do_connect")
+        def _connect_start(dialect, conn_rec, cargs, cparams):
+            local.connect_t0 = time.perf_counter()
+
+        @event.listens_for(engine, "connect")
+        def _connect_done(dbapi_connection, connection_record):
+            t0, local.connect_t0 = getattr(local, "connect_t0", None), None
+            if t0 is not None:
+                local.setup_s = getattr(local, "setup_s", 0.0) + time.perf_counter() - t0
+                local.connects = getattr(local, "connects", 0) + 1
+
+        ping = engine.dialect.do_ping
+
+        def timed_ping(dbapi_connection):
+            t0 = time.perf_counter()
+            try:
+                return ping(dbapi_connection)
+            finally:
+                local.setup_s = getattr(local, "setup_s", 0.0) + time.perf_counter() - t0
+
+        # pool_pre_ping calls dialect.do_ping; there is no event for it
+        engine.dialect.do_ping = timed_ping
+
+    def __bool__(self):
+        return True
+
+    def connect(self):
+        engine = self.get()
+        self._local.setup_s, self._local.connects = 0.0, 0
+        t0 = time.perf_counter()
+        try:
+            conn = engine.connect()
+        except PoolTimeout:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise
+        setup = self._local.setup_s
+        waited = max(0.0, time.perf_counter() - t0 - setup)
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_total_s"] += waited
+            self._stats["wait_max_s"] = max(self._stats["wait_max_s"], waited)
+            self._stats["connects"] += self._local.connects
+            self._stats["setup_total_s"] += setup
+        return conn
+
+    @contextmanager
+    def begin(self):
+        """Same contract as Engine.begin(): a connection inside a transaction, committed on exit."""
+        with self.connect() as conn:
+            with conn.begin():
+                yield conn
+
+    def dispose(self):
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+            self._engine = None
+            self._pid = None
+
+    def pool_stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            engine = self._engine if self._pid == os.getpid() else None
+        out["wait_avg_s"] = out["wait_total_s"] / out["checkouts"] if out["checkouts"] else 0.0
+        out["pid"] = os.getpid()
+        out["created"] = engine is not None
+        if engine is not None:
+            pool = engine.pool
+            for name in ("size", "checkedin", "checkedout", "overflow"):
+                fn = getattr(pool, name, None)
+                if callable(fn):
+                    out[name] = fn()
+        return out
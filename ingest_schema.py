@@ -0,0 +1,226 @@
+"""
+Typed ingestion of uploaded EDI / delivery files, driven by App.TEMPLATE_SCHEMAS.
+
+A Schema knows the template columns, the customer spellings accepted for each of
+them (header aliases), which columns are required and which hold YYYY-WXX weeks,
+ISO dates, integers or free-form quantities. Headers are matched on a key that ignores case, accents, spaces
+and punctuation ("Customer Part No." == "customerpartno"). Schema.accepts is the
+usecols filter of the readers, so columns nobody maps are never parsed.
+
+The column mapping of a header row (Layout) is compiled once per distinct layout
+and cached: every file of a customer has the same headers, and the streamed path
+sees the same headers on every chunk. Schema.apply() renames, coerces and validates
+a frame column by column and returns the rows that can be written, plus the
+rejected ones with a message, without touching the database. It is the one
+validator of both the uploads and the JSON API (App._api_frame).
+"""
+import datetime
+import functools
+import re
+import unicodedata
+from collections import namedtuple
+
+import pandas as pd
+
+from normalize import clean_qty_checked, safestr_series
+
+LAYOUT_CACHE_SIZE = 256
+INT32_MAX = 2**31 - 1  # "Quantity" & co. are integer columns
+
+# 2025-W28, 2025-w28, 2025W28, 2025 - W 8
+_WEEK_RE = r"^(\d{4})\s*-?\s*[Ww]\s*(\d{1,2})$"
+
+# source header -> template column; source headers to read, in template order; template columns not found
+Layout = namedtuple("Layout", "rename columns missing")
+# rows that can be written; [(spreadsheet row, message)]; template columns the file does not have
+Conformed = namedtuple("Conformed", "frame rejected missing")
+
+
+class LayoutError(ValueError):
+    """The file lacks a required column (under any accepted spelling)."""
+
+
+def header_key(header):
+    """Comparison key of a header: lower case, accents and non-alphanumerics removed."""
+    s = unicodedata.normalize("NFKD", str(header)).casefold()
+    return re.sub(r"[^0-9a-z]", "", "".join(ch for ch in s if not unicodedata.combining(ch)))
+
+
+def _iso_weeks(year):
+    return 53 if datetime.date(year, 12, 28).isocalendar()[1] == 53 else 52
+
+
+def _per_distinct(fn, s: pd.Series):
+    """
+    fn(s) -> (values, mask), computed on the distinct values of s only and broadcast
+    back, as normalize._on_uniques does: weeks and quantities repeat a lot.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    if len(uniques) * 2 > len(s):
+        return fn(s)
+    values, mask = fn(pd.Series(uniques, dtype=s.dtype))
+    return values.take(codes).set_axis(s.index), mask.take(codes).set_axis(s.index)
+
+
+def week_series(s: pd.Series):
+    """
+    (values as 'YYYY-WXX' text, mask of non-blank cells that are not a week). Blank
+    cells give None. Dates (Excel date cells, YYYY-MM-DD text) become their ISO week.
+    """
+    return _per_distinct(_weeks, s)
+
+
+def _weeks(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        blank = s.isna()
+        year = week = pd.Series(float("nan"), index=s.index)
+        dates = s
+    else:
+        txt = safestr_series(s)
+        blank = txt == ""
+        parts = txt.str.extract(_WEEK_RE)
+        year, week = pd.to_numeric(parts[0]), pd.to_numeric(parts[1])
+        dates = pd.to_datetime(txt.where(year.isna() & ~blank), format="ISO8601", errors="coerce")
+    if dates.notna().any():
+        iso = dates.dt.isocalendar()
+        year = year.fillna(iso["year"].astype("float64"))
+        week = week.fillna(iso["week"].astype("float64"))
+    # week 53 only exists in some years; there are few distinct years, so check those in Python
+    limit = year.map({y: _iso_weeks(int(y)) for y in year.dropna().unique()})
+    ok = year.notna() & (week >= 1) & (week <= limit)
+    out = year.astype("Int64").astype(str) + "-W" + week.astype("Int64").astype(str).str.zfill(2)
+    out = out.astype(object).where(ok, None)
+    return out, ~blank & ~ok
+
+
+def date_series(s: pd.Series):
+    """
+    (values as 'YYYY-MM-DD' text, mask of non-blank cells that are not an ISO date).
+    Blank cells give None; a time part is dropped ("Date" is a date column).
+    """
+    return _per_distinct(_dates, s)
+
+
+def _dates(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        blank, dates = s.isna(), s
+    else:
+        txt = safestr_series(s)
+        blank = txt == ""
+        dates = pd.to_datetime(txt.where(~blank), format="ISO8601", errors="coerce")
+    ok = dates.notna()
+    return dates.dt.strftime("%Y-%m-%d").astype(object).where(ok, None), ~blank & ~ok
+
+
+def integer_series(s: pd.Series):
+    """
+    (values as Int64, mask of non-blank cells that are not a whole number in the range
+    of an integer column). Blank cells give <NA>; spaces inside numbers are thousand
+    separators ("1 200").
+    """
+    return _per_distinct(_integers, s)
+
+
+def _integers(s):
+    if pd.api.types.is_bool_dtype(s):
+        num, blank = pd.Series(float("nan"), index=s.index), pd.Series(False, index=s.index)
+    elif pd.api.types.is_numeric_dtype(s):
+        num, blank = s.astype("float64"), s.isna()
+    else:
+        txt = safestr_series(s).str.replace(r"\s", "", regex=True)
+        blank = txt == ""
+        num = pd.to_numeric(txt.where(~blank), errors="coerce")
+    bad = ~blank & (num.isna() | (num % 1 != 0) | (num.abs() > INT32_MAX))
+    return num.where(~bad).astype("Int64"), bad
+
+
+class Schema:
+    """
+    Compiled ingestion rules of one template. aliases maps a template column to the
+    other headers accepted for it (the column name itself always is). quantities are
+    cleaned with the delivery rules (normalize.clean_qty_checked: blank -> 0, thousand
+    separators), integers must be whole numbers as sent.
+    """
+
+    def __init__(self, columns, *, aliases=None, required=(), weeks=(), dates=(), integers=(), quantities=()):
+        self.columns = list(columns)
+        self.required = [c for c in self.columns if c in set(required)]
+        self.weeks = [c for c in self.columns if c in set(weeks)]
+        self.dates = [c for c in self.columns if c in set(dates)]
+        self.integers = [c for c in self.columns if c in set(integers)]
+        self.quantities = [c for c in self.columns if c in set(quantities)]
+        self._lookup = {}
+        for col in self.columns:
+            for name in [col, *(aliases or {}).get(col, ())]:
+                key = header_key(name)
+                if self._lookup.setdefault(key, col) != col:
+                    raise ValueError(f"Header alias {name!r} is used for both {self._lookup[key]} and {col}")
+        self.layout = functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)(self._compile)
+
+    def accepts(self, header):
+        """usecols filter: True for the headers that map to a template column."""
+        return header_key(header) in self._lookup
+
+    def column_of(self, header):
+        """Template column a header maps to, or None."""
+        return self._lookup.get(header_key(header))
+
+    def _compile(self, headers):
+        found = {}
+        for h in headers:
+            col = self._lookup.get(header_key(h))
+            # the template's own spelling wins over an alias, otherwise the first one in the file
+            if col is not None and (col not in found or h == col):
+                found[col] = h
+        return Layout(rename={h: c for c, h in found.items()},
+                      columns=tuple(found[c] for c in self.columns if c in found),
+                      missing=tuple(c for c in self.columns if c not in found))
+
+    def apply(self, df, first_row=2):
+        """
+        Map df's headers to the template, coerce the week / integer columns and split
+        off the invalid rows. first_row is the spreadsheet row of df's first line (the
+        header is row 1), used in the messages. Raises LayoutError for a missing
+        required column.
+        """
+        layout = self.layout(tuple(df.columns))
+        absent = [c for c in self.required if c in layout.missing]
+        if absent:
+            raise LayoutError(f"Missing required column(s): {', '.join(absent)}. "
+                              f"Recognised columns: {', '.join(map(str, df.columns)) or 'none'}.")
+        out = df[list(layout.columns)].rename(columns=layout.rename).reset_index(drop=True)
+        bad = pd.Series("", index=out.index, dtype=object)
+
+        def reject(mask, message):
+            nonlocal bad
+            bad = bad.mask(mask.to_numpy() & (bad == "").to_numpy(), message)
+
+        for c in out.columns:
+            # only JSON records hold objects / arrays, in columns pandas cannot type ("mixed")
+            if pd.api.types.infer_dtype(out[c], skipna=True) == "mixed":
+                nested = out[c].map(type).isin([dict, list])
+                reject(nested, "nested values are not allowed")
+                out[c] = out[c].mask(nested, None)  # unhashable: the other rules factorize
+        parsed = [(c, week_series, "a week like 2025-W28") for c in self.weeks]
+        parsed += [(c, date_series, "a date like 2025-07-14") for c in self.dates]
+        for c in self.required:
+            if c not in self.weeks and c not in self.dates:
+                reject(safestr_series(out[c]) == "", f"{c} is required")
+        for c, parse, what in parsed:
+            if c in out.columns:
+                out[c], wrong = parse(out[c])
+                if c in self.required:
+                    reject(out[c].isna() & ~wrong, f"{c} is required")
+                reject(wrong, f"{c} must be {what}")
+        for c in self.integers:
+            if c in out.columns:
+                out[c], wrong = integer_series(out[c])
+                reject(wrong, f"{c} must be an integer")
+        for c in self.quantities:
+            if c in out.columns:
+                out[c], wrong = clean_qty_checked(out[c])
+                reject(wrong, f"{c} must be a number")
+
+        rejected = [(first_row + i, msg) for i, msg in bad[bad != ""].items()]
+        good = out[(bad == "").to_numpy()].reset_index(drop=True)
+        return Conformed(good, rejected, layout.missing)
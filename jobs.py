@@ -0,0 +1,119 @@
+"""
+Background jobs for long database work, run on a local thread pool.
+
+Job state lives in one small JSON file per job, so whichever gunicorn worker
+receives the poll can answer it. A job whose owning process disappeared
+(worker restart, timeout kill) is reported as failed instead of running forever.
+"""
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, directory, workers=2, max_age=24 * 3600):
+        self.directory = directory
+        self.workers = workers
+        self.max_age = max_age
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _executor(self):
+        # one pool per process: a pool inherited through fork has no live threads
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _path(self, job_id):
+        if not _JOB_ID_RE.match(job_id or ""):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job):
+        job["updated_at"] = time.time()
+        path = self._path(job["id"])
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(job, fh)
+        os.replace(tmp, path)
+
+    def _prune(self):
+        """Forget job files older than max_age."""
+        cutoff = time.time() - self.max_age
+        for de in os.scandir(self.directory):
+            try:
+                if de.stat().st_mtime < cutoff:
+                    os.remove(de.path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, fn, *args, kind="", job_id=None, **kwargs) -> str:
+        """
+        Run fn(*args, progress=..., **kwargs) in the background and return the job id.
+        fn reports work done with progress(rows, message=None) and returns a result message,
+        or a JSON-serializable dict kept as job["result"] (its "message" becomes the message).
+        job_id lets the caller record the id somewhere before the job can start.
+        """
+        job = {"id": job_id or uuid.uuid4().hex, "kind": kind, "state": "queued", "rows_processed": 0,
+               "message": None, "error": None, "pid": os.getpid(), "created_at": time.time()}
+        self._write(job)
+
+        def progress(rows, message=None):
+            job["rows_processed"] = int(rows)
+            if message is not None:
+                job["message"] = message
+            self._write(job)
+
+        def run():
+            job.update(state="running", started_at=time.time())
+            self._write(job)
+            try:
+                result = fn(*args, progress=progress, **kwargs)
+                if isinstance(result, dict):
+                    job["result"] = result
+                    result = result.get("message")
+                job["message"] = result
+                job["state"] = "done"
+            except Exception as e:
+                job["state"] = "failed"
+                job["error"] = str(e)
+                traceback.print_exc()
+            job["finished_at"] = time.time()
+            self._write(job)
+
+        self._prune()
+        self._executor().submit(run)
+        return job["id"]
+
+    def status(self, job_id) -> dict:
+        """Current job state; KeyError for unknown ids."""
+        try:
+            with open(self._path(job_id), encoding="utf-8") as fh:
+                job = json.load(fh)
+        except FileNotFoundError:
+            raise KeyError(job_id) from None
+        if job["state"] in ("queued", "running") and not _pid_alive(job["pid"]):
+            job["state"] = "failed"
+            job["error"] = "The worker running this job stopped before it finished."
+        return job
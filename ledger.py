@@ -0,0 +1,132 @@
+"""
+Ingestion ledger: one row per batch written to "EDIGlobal" / "DeliveryDetails".
+
+A batch is identified by a content hash of its normalized rows (row order does not
+matter), or of the raw file bytes for uploads too large to normalize up front.
+/preview looks the key up to warn about re-uploads; the insert paths claim the key
+inside their transaction and refuse a known batch unless forced. Imports that commit
+in several transactions (streamed uploads with commit_per_chunk) hold the claim for
+their whole run instead (held()).
+"""
+import contextlib
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from upload_store import file_sha256
+
+LEDGER_TABLE = "IngestionLedger"
+
+
+class AlreadyIngested(Exception):
+    """The batch is already in the ledger; entry is its ledger row."""
+
+    def __init__(self, entry):
+        super().__init__(f"Batch already imported on {entry['IngestedAt']}")
+        self.entry = entry
+
+
+def frame_key(df: pd.DataFrame, file_type: str) -> str:
+    """sha256 over the file type, the column names and the sorted per-row hashes of df."""
+    canon = df.reset_index(drop=True).astype("string")
+    rows = np.sort(pd.util.hash_pandas_object(canon, index=False).to_numpy())
+    h = hashlib.sha256(json.dumps(["frame", file_type, list(map(str, canon.columns))]).encode("utf-8"))
+    h.update(rows.tobytes())
+    return h.hexdigest()
+
+
+def file_key(path, file_type: str, digest=None) -> str:
+    """sha256 over the file type and the sha256 of the raw bytes of path (digest, if already known)."""
+    if digest is None:
+        digest = file_sha256(path)
+    return hashlib.sha256(json.dumps(["file", file_type, digest]).encode("utf-8")).hexdigest()
+
+
+LEDGER_DDL = f"""
+    CREATE TABLE IF NOT EXISTS "{LEDGER_TABLE}" (
+        "BatchHash"  text PRIMARY KEY,
+        "FileType"   text NOT NULL,
+        "FileName"   text,
+        "RowCount"   integer NOT NULL,
+        "IngestedAt" timestamptz NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_table(conn):
+    # databases not migrated yet (see migrations.py) still get the table on first use.
+    # not cached per process: a CREATE inside a transaction that later rolls back is undone
+    if conn.execute(text("SELECT to_regclass(:t)"), {"t": f'"{LEDGER_TABLE}"'}).scalar() is not None:
+        return
+    # concurrent CREATE TABLE IF NOT EXISTS can still collide in pg_type; serialize it
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:t))"), {"t": LEDGER_TABLE})
+    conn.execute(text(LEDGER_DDL))
+
+
+def lookup(conn, key):
+    """Ledger row for key as a dict, or None."""
+    ensure_table(conn)
+    row = conn.execute(text(f"""
+        SELECT "BatchHash","FileType","FileName","RowCount","IngestedAt"
+        FROM "{LEDGER_TABLE}" WHERE "BatchHash" = :k
+    """), {"k": key}).mappings().first()
+    return dict(row) if row else None
+
+
+def _lock_id(key):
+    return int.from_bytes(bytes.fromhex(key[:16]), "big", signed=True)
+
+
+def claim(conn, key, force=False):
+    """
+    Serialize concurrent imports of the same batch (transaction-scoped advisory lock)
+    and raise AlreadyIngested if it was imported before, unless force.
+    """
+    ensure_table(conn)
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _lock_id(key)})
+    if not force:
+        entry = lookup(conn, key)
+        if entry:
+            raise AlreadyIngested(entry)
+
+
+@contextlib.contextmanager
+def held(conn, key, force=False):
+    """
+    claim() for an import that commits several transactions on conn (a connection
+    outside any transaction, kept for the whole import). The advisory lock is
+    session-level: a concurrent import of the same batch waits until this one has
+    recorded it, or failed, and then sees the ledger row. It conflicts with claim()'s
+    transaction-scoped lock on the same key, too.
+    """
+    with conn.begin():
+        ensure_table(conn)
+    conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _lock_id(key)})
+    conn.commit()
+    try:
+        if not force:
+            entry = lookup(conn, key)
+            conn.commit()
+            if entry:
+                raise AlreadyIngested(entry)
+        yield
+    finally:
+        try:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _lock_id(key)})
+            conn.commit()
+        except Exception:
+            conn.invalidate()  # closing the session releases the lock
+
+
+def record(conn, key, file_type, row_count, file_name=None):
+    ensure_table(conn)
+    conn.execute(text(f"""
+        INSERT INTO "{LEDGER_TABLE}" ("BatchHash","FileType","FileName","RowCount")
+        VALUES (:k, :t, :f, :n)
+        ON CONFLICT ("BatchHash") DO UPDATE
+        SET "FileName" = EXCLUDED."FileName", "RowCount" = EXCLUDED."RowCount", "IngestedAt" = now()
+    """), {"k": key, "t": file_type, "f": file_name, "n": int(row_count)})
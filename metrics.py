@@ -0,0 +1,290 @@
+"""
+Stage timing and database round-trip counts, cheap enough to leave on in production.
+
+stage("preview.parse") times a block: the duration lands in a Prometheus histogram
+and, inside a request, in that response's Server-Timing header. batch(file_type)
+wraps one import and records its rows and database round trips. Statements sent
+through SQLAlchemy are counted by an engine event; raw psycopg2 COPY /
+execute_values calls are wrapped in db_call().
+
+Each process keeps its own registry and writes a snapshot to one JSON file per pid
+(at most once per second), and /metrics merges them, so a scrape sees every
+gunicorn worker rather than whichever one answered.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROW_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+TRIP_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 500, 1_000, 10_000)
+
+_timings = ContextVar("metrics_timings", default=None)  # [(stage, seconds)] of the current request
+_batch = ContextVar("metrics_batch", default=None)  # counters of the current import
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=1.0, max_age=24 * 3600):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self._defs = {}  # name -> (kind, help, buckets)
+        self._lock = threading.Lock()
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._values = {}  # (name, labels) -> [bucket counts..., sum, count] or [total]
+        self._last_flush = 0.0
+
+    def _after_fork(self):
+        # the child starts from zero; the parent's numbers stay in the parent's file
+        self._lock = threading.Lock()
+        self._reset()
+
+    def histogram(self, name, help_text, buckets=TIME_BUCKETS):
+        self._defs[name] = ("histogram", help_text, tuple(buckets))
+
+    def counter(self, name, help_text):
+        self._defs[name] = ("counter", help_text, None)
+
+    def observe(self, name, value, **labels):
+        buckets = self._defs[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0] * (len(buckets) + 2)
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    v[i] += 1
+                    break
+            v[-2] += value
+            v[-1] += 1
+        self._maybe_flush()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            v = self._values.setdefault(key, [0])
+            v[0] += value
+        self._maybe_flush()
+
+    # ---- cross-process snapshots ----
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            self._last_flush = time.monotonic()
+            data = [[name, list(labels), v] for (name, labels), v in self._values.items()]
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+
+    def _merged(self):
+        if not self.directory:
+            with self._lock:
+                return {k: list(v) for k, v in self._values.items()}
+        self.flush()
+        merged = {}
+        now = time.time()
+        for de in os.scandir(self.directory):
+            if not de.name.endswith(".json"):
+                continue
+            try:
+                if not _pid_alive(int(de.name[:-5])) and now - de.stat().st_mtime > self.max_age:
+                    os.remove(de.path)
+                    continue
+                with open(de.path, encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (ValueError, OSError):
+                continue
+            for name, labels, v in data:
+                key = (name, tuple(tuple(kv) for kv in labels))
+                acc = merged.get(key)
+                if acc is None or len(acc) != len(v):
+                    merged[key] = list(v)
+                else:
+                    merged[key] = [a + b for a, b in zip(acc, v)]
+        return merged
+
+    def render(self) -> str:
+        """All metrics of all processes in the Prometheus text exposition format."""
+        values = self._merged()
+        lines = []
+        for name, (kind, help_text, buckets) in self._defs.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (n, labels), v in sorted(values.items()):
+                if n != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_num(v[0])}")
+                    continue
+                cumulative = 0
+                for le, count in zip(buckets, v):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _num(le)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {v[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_num(v[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {v[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _num(x):
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    def esc(s):
+        return str(s).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+registry = Registry()
+registry.histogram("edi_stage_seconds", "Time spent in each stage of /preview, /insert and their background jobs.")
+registry.histogram("edi_request_seconds", "Request duration by endpoint.")
+registry.histogram("edi_batch_rows", "Rows per imported batch.", ROW_BUCKETS)
+registry.histogram("edi_batch_db_round_trips", "Database round trips per imported batch.", TRIP_BUCKETS)
+registry.counter("edi_db_round_trips_total", "Database round trips (statements, COPY and execute_values pages).")
+
+
+def configure(directory, flush_interval=1.0):
+    """Share metrics between worker processes through snapshot files in directory."""
+    registry.directory = directory
+    registry.flush_interval = flush_interval
+    os.makedirs(directory, exist_ok=True)
+
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        registry.observe("edi_stage_seconds", dt, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, dt))
+
+
+def _record_db(trips, seconds):
+    registry.inc("edi_db_round_trips_total", trips)
+    b = _batch.get()
+    if b is not None:
+        b["round_trips"] += trips
+    timings = _timings.get()
+    if timings is not None:
+        timings.append(("db", seconds, trips))
+
+
+@contextmanager
+def db_call(trips=1):
+    """Time and count a raw driver call that bypasses SQLAlchemy (COPY, execute_values)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_db(trips, time.perf_counter() - t0)
+
+
+@contextmanager
+def batch(file_type):
+    """Count the database round trips of one import; set ["rows"] on the yielded dict."""
+    b = {"rows": 0, "round_trips": 0}
+    token = _batch.set(b)
+    try:
+        yield b
+    finally:
+        _batch.reset(token)
+        registry.observe("edi_batch_rows", b["rows"], file_type=file_type)
+        registry.observe("edi_batch_db_round_trips", b["round_trips"], file_type=file_type)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_t0", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_t0")
+    if starts:
+        _record_db(1, time.perf_counter() - starts.pop())
+
+
+def server_timing(timings, total):
+    """Server-Timing header value: one entry per stage (repeats summed), db time and count, total."""
+    stages, db_seconds, db_trips = {}, 0.0, 0
+    for item in timings:
+        if item[0] == "db":
+            db_seconds += item[1]
+            db_trips += item[2]
+        else:
+            stages[item[0]] = stages.get(item[0], 0.0) + item[1]
+    parts = [f"{name.replace('.', '-')};dur={dt * 1000:.1f}" for name, dt in stages.items()]
+    if db_trips:
+        parts.append(f'db;dur={db_seconds * 1000:.1f};desc="{db_trips} round trips"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app):
+    """Time every request, add Server-Timing, and serve /metrics."""
+    from flask import Response, request
+
+    @app.before_request
+    def _metrics_start():
+        request.environ["metrics.t0"] = time.perf_counter()
+        request.environ["metrics.token"] = _timings.set([])
+
+    @app.after_request
+    def _metrics_finish(response):
+        t0 = request.environ.get("metrics.t0")
+        if t0 is None:
+            return response
+        total = time.perf_counter() - t0
+        registry.observe("edi_request_seconds", total, endpoint=request.endpoint or "unknown")
+        response.headers["Server-Timing"] = server_timing(_timings.get() or [], total)
+        return response
+
+    @app.teardown_request
+    def _metrics_reset(exc=None):
+        token = request.environ.pop("metrics.token", None)
+        if token is not None:
+            try:
+                _timings.reset(token)
+            except ValueError:
+                _timings.set(None)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
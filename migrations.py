@@ -0,0 +1,198 @@
+"""
+Versioned schema migrations for the EDI / delivery tables.
+
+Each migration has a version number and runs once: applied versions are recorded in
+"SchemaMigrations", inside the same transaction as the migration itself, and a
+transaction-scoped advisory lock keeps two workers or deploy jobs from applying
+them at the same time. The statements are idempotent (IF NOT EXISTS), so a
+database whose tables were created by hand is brought under version control
+without changes to what already exists.
+
+    python migrations.py                # apply pending migrations to DATABASE_URL (or App's database)
+    python migrations.py --status
+
+Index builds take a write lock on their table for the duration of the build; run
+the migrations at deploy time rather than under load.
+
+A migration with a "when" condition is only applied while it holds, and stays
+pending otherwise: the EDIGlobal natural-key index only exists in merge mode
+(EDI_INSERT_MODE=merge), since append mode keeps every line, duplicates included.
+"""
+import argparse
+import os
+import sys
+from collections import namedtuple
+
+from sqlalchemy import create_engine, text
+
+import ledger
+import stock
+
+MIGRATIONS_TABLE = "SchemaMigrations"
+
+Migration = namedtuple("Migration", "version name statements when", defaults=(None,))
+
+# One forecast line per release: (Site, ClientCode, ClientMaterialNo, ForecastDate) + the week it is for.
+# App.merge_ediglobal upserts on it; NULL key parts compare as ''.
+EDI_NATURAL_KEY = ["Site", "ClientCode", "ClientMaterialNo", "ForecastDate", "DateFrom"]
+EDI_NATURAL_KEY_INDEX = "EDIGlobal_natural_key"
+EDI_NATURAL_KEY_EXPRS = ",".join(f"""COALESCE("{c}",'')""" for c in EDI_NATURAL_KEY)
+
+
+def _merge_mode():
+    return os.getenv("EDI_INSERT_MODE", "append") == "merge"
+
+
+MIGRATIONS = [
+    Migration(1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS "EDIGlobal" (
+            "id"                    serial PRIMARY KEY,
+            "Site"                  varchar,
+            "ClientCode"            varchar,
+            "ClientMaterialNo"      varchar,
+            "AVOMaterialNo"         varchar,
+            "DateFrom"              varchar,
+            "DateUntil"             varchar,
+            "Quantity"              integer,
+            "ForecastDate"          varchar,
+            "LastDeliveryDate"      varchar,
+            "LastDeliveredQuantity" integer,
+            "CumulatedQuantity"     integer,
+            "EDIStatus"             varchar,
+            "ProductName"           varchar,
+            "LastDeliveryNo"        varchar
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS "DeliveryDetails" (
+            "Site"          varchar,
+            "AVOMaterialNo" varchar,
+            "DeliveryNo"    varchar,
+            "Quantity"      integer,
+            "Date"          date,
+            "Status"        varchar
+        )
+        """,
+        ledger.LEDGER_DDL,
+    ]),
+    # Latest InTransit row per (Site, AVOMaterialNo): the first entry of an index range.
+    # Partial, so Dispatched / Delivered history (most of the table) does not bloat it.
+    Migration(2, "DeliveryDetails InTransit lookup index", [
+        """
+        CREATE INDEX IF NOT EXISTS "DeliveryDetails_intransit_latest"
+        ON "DeliveryDetails" ("Site", "AVOMaterialNo", "Date" DESC)
+        WHERE "Status" = 'InTransit'
+        """,
+    ]),
+    # The UPDATEs that move an InTransit row match it on (DeliveryNo, Date)
+    Migration(3, "DeliveryDetails delivery number index", [
+        """
+        CREATE INDEX IF NOT EXISTS "DeliveryDetails_delivery_no"
+        ON "DeliveryDetails" ("DeliveryNo", "Date")
+        """,
+        'ANALYZE "DeliveryDetails"',
+    ]),
+    # stock.refresh() recomputes one key from these, reading only that key's rows
+    Migration(4, "stock summary", [
+        """
+        CREATE INDEX IF NOT EXISTS "DeliveryDetails_stock_key"
+        ON "DeliveryDetails" (COALESCE("Site",''), COALESCE("AVOMaterialNo",''), "Status")
+        INCLUDE ("Quantity", "Date")
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS "EDIGlobal_stock_key"
+        ON "EDIGlobal" (COALESCE("Site",''), COALESCE("AVOMaterialNo",''), "ForecastDate")
+        INCLUDE ("Quantity")
+        """,
+        stock.SUMMARY_DDL,
+        stock.REBUILD_SQL,
+    ]),
+    # ON CONFLICT target of merge mode; fails (and nothing is applied) while "EDIGlobal"
+    # still holds duplicate lines for the key
+    Migration(5, "EDIGlobal natural key (merge mode)", [
+        f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS "{EDI_NATURAL_KEY_INDEX}"
+        ON "EDIGlobal" ({EDI_NATURAL_KEY_EXPRS})
+        """,
+    ], when=_merge_mode),
+    # stock.read()'s case-insensitive part-number prefix filter, upper("AVOMaterialNo") LIKE 'V12%'
+    Migration(6, "StockSummary part-number prefix index", [
+        f"""
+        CREATE INDEX IF NOT EXISTS "StockSummary_avo_prefix"
+        ON "{stock.SUMMARY_TABLE}" (upper("AVOMaterialNo") text_pattern_ops)
+        """,
+    ]),
+]
+
+
+def _ensure_table(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{MIGRATIONS_TABLE}" (
+            "Version"   integer PRIMARY KEY,
+            "Name"      text NOT NULL,
+            "AppliedAt" timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def applied_versions(conn):
+    if conn.execute(text("SELECT to_regclass(:t)"), {"t": f'"{MIGRATIONS_TABLE}"'}).scalar() is None:
+        return set()
+    return set(conn.execute(text(f'SELECT "Version" FROM "{MIGRATIONS_TABLE}"')).scalars())
+
+
+def _enabled(m):
+    return m.when is None or m.when()
+
+
+def pending(conn):
+    """Migrations not applied yet whose condition holds."""
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in done and _enabled(m)]
+
+
+def migrate(engine):
+    """Apply the pending migrations in version order, in one transaction. Returns the ones applied."""
+    with engine.begin() as conn:
+        # one migrator at a time; the others wait, then find nothing pending
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:t))"), {"t": MIGRATIONS_TABLE})
+        _ensure_table(conn)
+        todo = pending(conn)
+        for m in todo:
+            for stmt in m.statements:
+                conn.execute(text(stmt))
+            conn.execute(text(f"""
+                INSERT INTO "{MIGRATIONS_TABLE}" ("Version", "Name") VALUES (:v, :n)
+            """), {"v": m.version, "n": m.name})
+        return todo
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Apply the schema migrations.")
+    ap.add_argument("--url", default=os.environ.get("DATABASE_URL"),
+                    help="SQLAlchemy URL (default: $DATABASE_URL, else the database configured in App.py)")
+    ap.add_argument("--status", action="store_true",
+                    help="list pending migrations without applying them (off: condition not met)")
+    args = ap.parse_args()
+
+    if args.url:
+        engine = create_engine(args.url)
+    else:
+        from App import engine
+    if args.status:
+        with engine.connect() as conn:
+            done = applied_versions(conn)
+        for m in MIGRATIONS:
+            state = "applied" if m.version in done else "pending" if _enabled(m) else "off"
+            print(f"{m.version:>4}  {state:<8} {m.name}")
+        return
+    applied = migrate(engine)
+    for m in applied:
+        print(f"applied {m.version}: {m.name}")
+    if not applied:
+        print("schema is up to date")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
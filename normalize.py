@@ -0,0 +1,171 @@
+"""
+Column-at-a-time versions of the App.py cell helpers (_safestr, _normalize_avo_ref,
+_clean_qty, _norm_status). Each function takes a Series and returns a Series with
+exactly what .map()/.apply() of the scalar helper would give, without a Python call
+per value. benchmarks/bench_normalize.py checks the equivalence and the speedup.
+"""
+import numpy as np
+import pandas as pd
+
+SUFFIX_TOKENS = {"PL", "SP"}
+
+_SIMPLE_NUM = r"-?\d+(?:\.\d+)?"
+
+
+def _as_text(s: pd.Series) -> pd.Series:
+    """str(v) for every element (None -> 'None', NaN -> 'nan'), as an object Series."""
+    arr = s.to_numpy(dtype=object)
+    return pd.Series(arr.astype(str), index=s.index, dtype=object)
+
+
+def _is_none(s: pd.Series) -> np.ndarray:
+    return np.equal(s.to_numpy(dtype=object), None)
+
+
+def _on_uniques(fn, s: pd.Series) -> pd.Series:
+    """
+    Run fn over the distinct values of s only and broadcast the result back. Sites,
+    statuses, quantities and part numbers repeat a lot, so this is most of the win.
+    Missing values go through fn on their own (None and NaN do not always map alike).
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    if len(uniques) == 0 or len(uniques) * 2 > len(s):
+        return fn(s)
+    out = fn(pd.Series(uniques, dtype=s.dtype)).to_numpy().take(codes)
+    na = codes == -1
+    if na.any():
+        na_res = fn(s[na]).to_numpy()
+        out = out.astype(np.result_type(out.dtype, na_res.dtype))
+        out[na] = na_res
+    return pd.Series(out, index=s.index)
+
+
+# -----------------------
+# Text cells
+# -----------------------
+def _safestr(s: pd.Series) -> pd.Series:
+    txt = _as_text(s)
+    empty = _is_none(s) | (s.isna().to_numpy() & (txt == "nan").to_numpy())
+    out = txt.str.strip()
+    out[empty] = ""
+    return out
+
+
+def safestr_series(s: pd.Series) -> pd.Series:
+    """Trimmed strings, None/NaN -> '' (same as _safestr)."""
+    return _on_uniques(_safestr, s)
+
+
+def _split_avo_ref(s: pd.Series):
+    """(code, PL/SP suffix or '') from the first two whitespace-separated tokens."""
+    parts = _safestr(s).str.extract(r"^(\S+)\s*(\S*)")
+    code = parts[0].fillna("").astype(object)
+    suffix = parts[1].fillna("").str.upper().astype(object)
+    return code, suffix.where(suffix.isin(SUFFIX_TOKENS), "")
+
+
+def _avo_ref(s: pd.Series) -> pd.Series:
+    code, suffix = _split_avo_ref(s)
+    return code + suffix
+
+
+def normalize_avo_ref_series(s: pd.Series, following: pd.Series = None) -> pd.Series:
+    """
+    Merge a PL/SP token into the AVO reference ("V504.243 PL" -> "V504.243PL"),
+    taking it from the same cell or, failing that, from `following` (same as _normalize_avo_ref).
+    """
+    if following is None:
+        return _on_uniques(_avo_ref, s)
+
+    code, suffix = _split_avo_ref(s)
+    nxt = _safestr(following).str.extract(r"^(\S+)")[0].fillna("").str.upper().astype(object)
+    use_next = (suffix == "") & nxt.isin(SUFFIX_TOKENS) & (code != "")
+    return code + suffix.where(~use_next, nxt)
+
+
+# -----------------------
+# Quantities
+# -----------------------
+def _clean_qty_text(txt: pd.Series):
+    """_clean_qty on values already turned into str(v): (values, mask of the ones it rejects)."""
+    out = pd.Series(0, index=txt.index, dtype="int64")
+    bad = pd.Series(False, index=txt.index)
+    t = txt.str.strip()
+    low = t.str.lower()
+    todo = ~((t == "") | (low == "nan") | (low == "none"))
+    if not todo.any():
+        return out, bad
+
+    # thousand separators: commas, normal and non-breaking spaces
+    t = t[todo].str.replace(r"[, \u00A0]", "", regex=True)
+    simple = t.str.fullmatch(_SIMPLE_NUM).astype(bool)
+    if simple.any():
+        out[simple[simple].index] = np.trunc(t[simple].astype(float)).astype("int64")
+
+    # last resort: strip everything not a digit or minus; what is left must be an int
+    rest = t[~simple].str.replace(r"[^\d-]", "", regex=True)
+    rest = rest[~rest.isin(["", "-"])]
+    if not rest.empty:
+        ok = rest.str.fullmatch(r"-?\d+").astype(bool)
+        bad[ok[~ok].index] = True
+        out[ok[ok].index] = rest[ok].astype("int64")
+    return out, bad
+
+
+def _clean_qty(s: pd.Series):
+    if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+        return _clean_qty_text(_as_text(s).where(s.notna().to_numpy(), ""))
+
+    # mixed object column: numbers keep the numeric rules, everything else goes through str(v)
+    is_num = s.map(type).isin([int, bool, float, np.float64]).to_numpy()
+    out, bad = _clean_qty_text(_as_text(s).where(~is_num & ~_is_none(s), ""))
+    if is_num.any():
+        nums = pd.to_numeric(s[is_num].astype(object))
+        out[is_num] = nums.fillna(0).round().astype("int64")
+    return out, bad
+
+
+def clean_qty_checked(s: pd.Series):
+    """
+    (quantities as int64, mask of the cells _clean_qty raises ValueError for). Same
+    rules as clean_qty_series; the rejected cells come out as 0.
+    """
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+        return s.astype("int64"), pd.Series(False, index=s.index)
+    if pd.api.types.is_float_dtype(s):
+        # np.round is round-half-to-even, like Python's round()
+        return s.fillna(0).round().astype("int64"), pd.Series(False, index=s.index)
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    if len(uniques) * 2 > len(s):
+        out, bad = _clean_qty(s)
+        return out.astype("int64"), bad
+    out, bad = _clean_qty(pd.Series(uniques, dtype=s.dtype))
+    return (pd.Series(out.to_numpy().take(codes), index=s.index, dtype="int64"),
+            pd.Series(bad.to_numpy().take(codes), index=s.index))
+
+
+def clean_qty_series(s: pd.Series) -> pd.Series:
+    """Quantities as int64, same rules as _clean_qty (thousand separators, NaN/None -> 0)."""
+    out, bad = clean_qty_checked(s)
+    if bad.any():
+        raise ValueError(f"invalid literal for int() with base 10: {s[bad].iloc[0]!r}")
+    return out
+
+
+# -----------------------
+# Status
+# -----------------------
+def _norm_status(s: pd.Series) -> pd.Series:
+    t = _as_text(s).str.strip()
+    low = t.str.lower()
+    out = t.copy()
+    out[(low == "sent") | (low == "dispatched")] = "Dispatched"
+    out[low.str.replace(" ", "", regex=False).isin(["intransit", "in-transit"])] = "InTransit"
+    out[low == "delivered"] = "Delivered"
+    out[_is_none(s)] = ""
+    return out
+
+
+def norm_status_series(s: pd.Series) -> pd.Series:
+    """Canonical Dispatched / InTransit / Delivered labels, other values trimmed (same as _norm_status)."""
+    return _on_uniques(_norm_status, s)
@@ -0,0 +1,124 @@
+"""
+Content-addressed cache for parsed delivery PDFs.
+
+Entries are keyed by sha256(parser tag + sha256 of the PDF bytes), so a digest taken
+while the upload was written can be used without reading the file again. A bounded in-memory LRU sits in
+front of a local directory of Feather (Arrow IPC, zstd) files; the directory is kept
+under a size cap and entries older than max_age are dropped.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class ParseCache:
+    def __init__(self, directory, *, max_entries=32, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key_for_digest(digest: str, tag: str) -> str:
+        return hashlib.sha256(f"{tag}\0{digest}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def key(cls, data: bytes, tag: str) -> str:
+        return cls.key_for_digest(hashlib.sha256(data).hexdigest(), tag)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.feather")
+
+    def get(self, key):
+        """Cached DataFrame (a copy, callers may mutate it) or None."""
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and now - hit[0] <= self.max_age:
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return hit[1].copy()
+            if hit is not None:
+                del self._mem[key]
+
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            if now - st.st_mtime > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            df = pd.read_feather(path)
+        except (FileNotFoundError, OSError, ValueError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._remember(key, df, st.st_mtime)
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+        return df.copy()
+
+    def put(self, key, df):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.reset_index(drop=True).to_feather(tmp, compression="zstd")
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self._remember(key, df.copy(), time.time())
+            self.stats["stores"] += 1
+        self._evict_disk()
+
+    def _remember(self, key, df, created):
+        self._mem[key] = (created, df)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _evict_disk(self):
+        """Drop expired files, then the oldest ones until the directory fits max_bytes."""
+        now = time.time()
+        entries = []
+        for de in os.scandir(self.directory):
+            if not de.name.endswith(".feather"):
+                continue
+            try:
+                st = de.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, de.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            with self._lock:
+                self.stats["evictions"] += evicted
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["memory_entries"] = len(self._mem)
+        return out
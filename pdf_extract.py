@@ -0,0 +1,55 @@
+"""
+Page-level pdfplumber extraction, kept out of App.py so process-pool workers can
+import it without pulling in Flask or the database engine.
+
+Sources are a path or the PDF bytes. A path is opened in place (pdfminer reads
+only the objects it needs) and is what process-pool workers should receive: a
+path pickles to a few bytes, the PDF itself would be copied once per task.
+"""
+import io
+import os
+
+import pdfplumber
+
+TABLE_SETTINGS = dict(
+    vertical_strategy="lines",
+    horizontal_strategy="lines",
+    intersection_tolerance=5,
+    snap_tolerance=3,
+    join_tolerance=3,
+    text_x_tolerance=2,
+    text_y_tolerance=3,
+    text_keep_blank_chars=False,
+    edge_min_length=3,
+)
+
+
+def _open(source):
+    if isinstance(source, (str, os.PathLike)):
+        return pdfplumber.open(source)
+    return pdfplumber.open(io.BytesIO(source))
+
+
+def pdf_info(source):
+    """(page count, metadata dict) without running any layout analysis."""
+    with _open(source) as pdf:
+        return len(pdf.pages), dict(pdf.metadata or {})
+
+
+def extract_pages(source, page_numbers):
+    """
+    Extract tables and text of the given pages, each page exactly once.
+    Returns [(page_no, tables, text)] in the order of page_numbers.
+    """
+    out = []
+    with _open(source) as pdf:
+        for i in page_numbers:
+            page = pdf.pages[i]
+            try:
+                tables = page.extract_tables(TABLE_SETTINGS) or []
+            except Exception:
+                tables = []
+            text = page.extract_text() or ""
+            out.append((i, tables, text))
+            page.close()
+    return out
@@ -0,0 +1,96 @@
+"""
+Incremental JSON record reader for request bodies.
+
+Accepts either a JSON array of objects or NDJSON (one object per line) and yields
+the records one at a time while reading the stream in fixed-size blocks, so memory
+stays bounded by the block size plus the largest single record.
+"""
+import codecs
+import json
+
+_WS = " \t\r\n"
+
+
+class RecordStreamError(ValueError):
+    """Malformed body; position is the number of records read before the error."""
+
+    def __init__(self, message, position):
+        super().__init__(f"{message} (after {position} records)")
+        self.position = position
+
+
+def iter_json_records(stream, block_size=64 * 1024, max_record_bytes=1024 * 1024):
+    """Yield the decoded values of a JSON array or an NDJSON body read from stream."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None  # unknown until the first non-blank character
+    expect_value = True
+    closed = False
+    count = 0
+
+    def fill():
+        nonlocal buf, pos, eof
+        block = stream.read(block_size)
+        eof = not block
+        try:
+            buf = buf[pos:] + utf8.decode(block, final=eof)
+        except UnicodeDecodeError:
+            raise RecordStreamError("Body is not valid UTF-8", count) from None
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WS:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                break
+            fill()
+            continue
+
+        ch = buf[pos]
+        if in_array is None:
+            in_array = ch == "["
+            if in_array:
+                pos += 1
+                continue
+        if closed:
+            raise RecordStreamError("Unexpected data after the closing ']'", count)
+        if in_array and ch == "]":
+            if expect_value and count:
+                raise RecordStreamError("Trailing comma before ']'", count)
+            closed = True
+            pos += 1
+            continue
+        if in_array and ch == ",":
+            if expect_value:
+                raise RecordStreamError("Unexpected ','", count)
+            expect_value = True
+            pos += 1
+            continue
+        if in_array and not expect_value:
+            raise RecordStreamError("Expected ',' or ']'", count)
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise RecordStreamError(f"Invalid JSON: {e.msg}", count) from None
+            # the record may continue in the next block
+            if len(buf) - pos > max_record_bytes:
+                raise RecordStreamError("Invalid JSON or record too large", count) from None
+            fill()
+            continue
+        if end == len(buf) and not eof and not isinstance(value, (dict, list, str)):
+            # a bare number/literal may be cut at the block boundary
+            fill()
+            continue
+        pos = end
+        count += 1
+        expect_value = False
+        yield value
+
+    if in_array and not closed:
+        raise RecordStreamError("Unterminated JSON array", count)
@@ -0,0 +1,158 @@
+"""
+Typed staging store for parsed batches between /preview and /insert.
+
+A batch is written once as an uncompressed Arrow IPC file named after a random
+UUID token and read back through a memory map, so /insert gets the same dtypes
+/preview saw without re-parsing and two uploads can never collide.
+Uploads too large to hold in memory are staged as-is (adopt) and streamed by /insert.
+Each token has a small JSON sidecar with the caller's metadata. A token can be
+reserved before its frame exists (fast preview parses the rest in the background).
+"""
+import json
+import os
+import re
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+_TOKEN_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """String column names, unique names, and mixed-type object columns as text."""
+    out = df.copy()
+    seen = {}
+    names = []
+    for c in map(str, out.columns):
+        n = seen.get(c, 0)
+        seen[c] = n + 1
+        names.append(c if n == 0 else f"{c}.{n}")
+    out.columns = names
+    for c in out.columns:
+        s = out[c]
+        if s.dtype != object:
+            continue
+        try:
+            pa.array(s, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # e.g. a spreadsheet column holding both numbers and text
+            out[c] = s.map(lambda v: v if v is None or (isinstance(v, float) and v != v) else str(v))
+    return out.reset_index(drop=True)
+
+
+class StagingStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def valid_token(token) -> bool:
+        return bool(token) and bool(_TOKEN_RE.match(token))
+
+    def path(self, token, suffix=".arrow") -> str:
+        if not self.valid_token(token):
+            raise KeyError(token)
+        return os.path.join(self.directory, f"{token}{suffix}")
+
+    def _write_meta(self, token, meta):
+        with open(self.path(token, ".json"), "w", encoding="utf-8") as fh:
+            json.dump(meta or {}, fh)
+
+    def reserve(self, meta: dict = None) -> str:
+        """A token whose frame is written later with save(..., token=token)."""
+        token = uuid.uuid4().hex
+        self._write_meta(token, meta)
+        return token
+
+    def update_meta(self, token, **fields):
+        meta = self.meta(token)
+        meta.update(fields)
+        tmp = self.path(token, ".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self.path(token, ".json"))
+        return meta
+
+    def save(self, df: pd.DataFrame, meta: dict = None, token: str = None) -> str:
+        """Store df and return its token. meta (JSON-serializable) travels with the batch."""
+        if token is None:
+            token = uuid.uuid4().hex
+            self._write_meta(token, meta)
+        elif meta is not None:
+            self.update_meta(token, **meta)
+        table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+        path = self.path(token)
+        tmp = f"{path}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+        return token
+
+    def adopt(self, upload_path: str, meta: dict = None) -> str:
+        """Stage a raw upload by moving it into the store; /insert streams it from upload_path()."""
+        token = uuid.uuid4().hex
+        self._write_meta(token, meta)
+        os.replace(upload_path, self.path(token, ".upload"))
+        return token
+
+    def upload_path(self, token):
+        """Path of an adopted upload, or None when the token holds a parsed frame."""
+        if not self.valid_token(token):
+            return None
+        path = self.path(token, ".upload")
+        return path if os.path.exists(path) else None
+
+    def load(self, token) -> pd.DataFrame:
+        """The staged frame (memory-mapped, no parsing). KeyError if unknown or expired."""
+        try:
+            source = pa.memory_map(self.path(token), "r")
+        except FileNotFoundError:
+            raise KeyError(token) from None
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+    def load_slice(self, token, offset, length) -> pd.DataFrame:
+        """Rows [offset, offset + length) of the staged frame; only those rows are converted."""
+        try:
+            source = pa.memory_map(self.path(token), "r")
+        except FileNotFoundError:
+            raise KeyError(token) from None
+        table = pa.ipc.open_file(source).read_all()
+        return table.slice(offset, length).to_pandas()
+
+    def num_rows(self, token) -> int:
+        try:
+            source = pa.memory_map(self.path(token), "r")
+        except FileNotFoundError:
+            raise KeyError(token) from None
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+    def meta(self, token) -> dict:
+        try:
+            with open(self.path(token, ".json"), encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            raise KeyError(token) from None
+
+    def exists(self, token) -> bool:
+        """Data staged, or reserved and still being produced."""
+        return self.valid_token(token) and (
+            os.path.exists(self.path(token)) or os.path.exists(self.path(token, ".upload"))
+            or os.path.exists(self.path(token, ".json")))
+
+    def pending(self, token) -> bool:
+        """Reserved but its frame is not written yet."""
+        return self.valid_token(token) and os.path.exists(self.path(token, ".json")) and not (
+            os.path.exists(self.path(token)) or os.path.exists(self.path(token, ".upload")))
+
+    def files(self, token):
+        """Every path the token can occupy, whether written yet or not."""
+        return [self.path(token, suffix) for suffix in (".arrow", ".upload", ".json")]
+
+    def discard(self, token):
+        for suffix in (".arrow", ".upload", ".json"):
+            try:
+                os.remove(self.path(token, suffix))
+            except (FileNotFoundError, KeyError):
+                pass
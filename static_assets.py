@@ -0,0 +1,65 @@
+"""
+Content-fingerprinted URLs for the files under static/.
+
+asset_url("app.css") -> "/assets/app.3f2a1b9c0d.css". The hash changes whenever
+the file does, so the asset route can answer with a one-year immutable
+Cache-Control and browsers still pick up a new stylesheet or logo after a deploy.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, abort, request
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetManifest:
+    def __init__(self, directory, url_prefix="/assets"):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+        self._lock = threading.Lock()
+        self._by_name = {}  # name -> (fingerprinted name, mtime)
+        self._by_hashed = {}  # fingerprinted name -> (name, bytes, etag)
+
+    def _load(self, name):
+        path = os.path.join(self.directory, name)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._by_name.get(name)
+        if cached and cached[1] == mtime:
+            return cached[0]
+        with open(path, "rb") as fh:
+            data = fh.read()
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{digest}{ext}"
+        with self._lock:
+            if cached:
+                self._by_hashed.pop(cached[0], None)
+            self._by_name[name] = (hashed, mtime)
+            self._by_hashed[hashed] = (name, data, digest)
+        return hashed
+
+    def url(self, name):
+        """Fingerprinted URL of static/<name>."""
+        return f"{self.url_prefix}/{self._load(name)}"
+
+    def warm(self, names=None):
+        """Hash the given files (default: everything in the directory) ahead of the first request."""
+        for name in names or sorted(os.listdir(self.directory)):
+            if os.path.isfile(os.path.join(self.directory, name)):
+                self._load(name)
+
+    def response(self, hashed):
+        """Response for a fingerprinted name; 404 for unknown or outdated fingerprints."""
+        entry = self._by_hashed.get(hashed)
+        if entry is None:
+            abort(404)
+        name, data, digest = entry
+        resp = Response(data, mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+        resp.set_etag(digest)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = ASSET_MAX_AGE
+        resp.cache_control.immutable = True
+        return resp.make_conditional(request)
@@ -0,0 +1,225 @@
+"""
+Stock position per (Site, AVOMaterialNo): the read side of EDI_Stock.
+
+"StockSummary" (created by migrations.py) holds one row per key: the InTransit,
+Dispatched and Delivered totals of "DeliveryDetails", the date of the last
+movement, and the quantity of the latest EDI forecast release. The insert paths call
+refresh() with the keys their batch touched, inside their own transaction, so
+the summary commits (or rolls back) together with the rows. Reads never aggregate
+the history tables; they go through a short-TTL cache in each process.
+
+Keys are stored coalesced: a NULL Site or part number is ''. refresh() locks the
+summary rows of its keys in sorted order before aggregating, so two batches touching
+the same key serialize and the second one sees the first one's rows.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import event, text
+
+import metrics
+
+SUMMARY_TABLE = "StockSummary"
+CACHE_SECONDS = float(os.getenv("STOCK_CACHE_SECONDS", "15"))
+MAX_LIMIT = 1000
+
+SUMMARY_DDL = f"""
+    CREATE TABLE IF NOT EXISTS "{SUMMARY_TABLE}" (
+        "Site"          varchar NOT NULL,
+        "AVOMaterialNo" varchar NOT NULL,
+        "InTransitQty"  bigint NOT NULL DEFAULT 0,
+        "DispatchedQty" bigint NOT NULL DEFAULT 0,
+        "DeliveredQty"  bigint NOT NULL DEFAULT 0,
+        "LastMovement"  text,
+        "ForecastWeek"  varchar,
+        "ForecastQty"   bigint,
+        "RefreshedAt"   timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY ("Site", "AVOMaterialNo")
+    )
+"""
+
+# Per-key aggregates, for the keys listed by the "keys" CTE (k.site, k.avo). Both history
+# tables are probed through their (COALESCE(Site,''), COALESCE(AVOMaterialNo,''), ...)
+# indexes, so the cost is the key's own rows, whatever the size of the tables.
+_AGGREGATE_SQL = """
+    INSERT INTO "StockSummary" AS s ("Site", "AVOMaterialNo", "InTransitQty", "DispatchedQty",
+        "DeliveredQty", "LastMovement", "ForecastWeek", "ForecastQty", "RefreshedAt")
+    SELECT k.site, k.avo, COALESCE(d.in_transit, 0), COALESCE(d.dispatched, 0), COALESCE(d.delivered, 0),
+           d.last_movement, f.week, f.qty, now()
+    FROM keys k
+    LEFT JOIN LATERAL (
+        SELECT sum(dd."Quantity") FILTER (WHERE dd."Status" = 'InTransit') AS in_transit,
+               sum(dd."Quantity") FILTER (WHERE dd."Status" = 'Dispatched') AS dispatched,
+               sum(dd."Quantity") FILTER (WHERE dd."Status" = 'Delivered') AS delivered,
+               max(dd."Date")::text AS last_movement
+        FROM "DeliveryDetails" dd
+        WHERE COALESCE(dd."Site",'') = k.site AND COALESCE(dd."AVOMaterialNo",'') = k.avo
+    ) d ON true
+    LEFT JOIN LATERAL (
+        SELECT e."ForecastDate" AS week, sum(e."Quantity") AS qty
+        FROM "EDIGlobal" e
+        WHERE COALESCE(e."Site",'') = k.site AND COALESCE(e."AVOMaterialNo",'') = k.avo
+        GROUP BY e."ForecastDate"
+        ORDER BY e."ForecastDate" DESC NULLS LAST
+        LIMIT 1
+    ) f ON true
+    ON CONFLICT ("Site", "AVOMaterialNo") DO UPDATE SET
+        "InTransitQty" = EXCLUDED."InTransitQty", "DispatchedQty" = EXCLUDED."DispatchedQty",
+        "DeliveredQty" = EXCLUDED."DeliveredQty", "LastMovement" = EXCLUDED."LastMovement",
+        "ForecastWeek" = EXCLUDED."ForecastWeek", "ForecastQty" = EXCLUDED."ForecastQty",
+        "RefreshedAt" = EXCLUDED."RefreshedAt"
+"""
+
+_KEYS_PARAM = "SELECT DISTINCT site, avo FROM unnest(CAST(:sites AS text[]), CAST(:avos AS text[])) AS k(site, avo)"
+
+REBUILD_SQL = f"""
+    DELETE FROM "{SUMMARY_TABLE}";
+    WITH keys AS (
+        SELECT COALESCE("Site",'') AS site, COALESCE("AVOMaterialNo",'') AS avo FROM "DeliveryDetails"
+        UNION
+        SELECT COALESCE("Site",''), COALESCE("AVOMaterialNo",'') FROM "EDIGlobal"
+    )
+    {_AGGREGATE_SQL}
+"""
+
+_table_ready = False
+
+
+def _has_table(conn):
+    # only a positive answer is cached: the table does not go away once migrated
+    global _table_ready
+    if not _table_ready:
+        _table_ready = conn.execute(text("SELECT to_regclass(:t)"), {"t": f'"{SUMMARY_TABLE}"'}).scalar() is not None
+    return _table_ready
+
+
+def frame_keys(df):
+    """(Site, AVOMaterialNo) keys of a frame as the database will store them (NULL -> '')."""
+    if df is None or df.empty:
+        return set()
+    parts = [df[c].astype("string").fillna("") if c in df.columns else pd.Series("", index=df.index)
+             for c in ("Site", "AVOMaterialNo")]
+    return set(zip(parts[0].tolist(), parts[1].tolist()))
+
+
+@metrics.stage("stock.refresh")
+def refresh(conn, keys):
+    """Recompute the summary rows of keys inside conn's transaction. No-op before the migration."""
+    keys = sorted(set(keys))
+    if not keys or not _has_table(conn):
+        return 0
+    params = {"sites": [k[0] for k in keys], "avos": [k[1] for k in keys]}
+    # make sure every key has a row, then lock them in key order (no deadlock between batches);
+    # the aggregate below is a new statement, so it sees whatever the lock waited for
+    conn.execute(text(f"""
+        INSERT INTO "{SUMMARY_TABLE}" ("Site", "AVOMaterialNo")
+        SELECT site, avo FROM ({_KEYS_PARAM}) k ORDER BY site, avo
+        ON CONFLICT DO NOTHING
+    """), params)
+    conn.execute(text(f"""
+        SELECT 1 FROM "{SUMMARY_TABLE}" s
+        JOIN ({_KEYS_PARAM}) k ON s."Site" = k.site AND s."AVOMaterialNo" = k.avo
+        ORDER BY s."Site", s."AVOMaterialNo"
+        FOR UPDATE OF s
+    """), params)
+    conn.execute(text(f"WITH keys AS ({_KEYS_PARAM}) {_AGGREGATE_SQL}"), params)
+    # this worker's cached reads are dropped once the batch is committed
+    event.listen(conn, "commit", lambda _conn: cache.clear(), once=True)
+    return len(keys)
+
+
+def rebuild(conn):
+    """Recompute the whole summary (after edits made outside the app)."""
+    conn.execute(text(REBUILD_SQL))
+
+
+class TTLCache:
+    """Small in-process cache of read results; entries expire after ttl seconds."""
+
+    def __init__(self, ttl=CACHE_SECONDS, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] < time.monotonic():
+                return None
+            return hit[1]
+
+    def put(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.monotonic()
+                self._data = {k: v for k, v in self._data.items() if v[0] >= now}
+                if len(self._data) >= self.max_entries:
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+cache = TTLCache()
+
+
+# page of read(); count(*) OVER () gives the total in the same pass, as long as the page has a row
+READ_SQL = f"""
+    SELECT "Site", "AVOMaterialNo", "InTransitQty", "DispatchedQty", "DeliveredQty",
+           "LastMovement", "ForecastWeek", "ForecastQty", "RefreshedAt",
+           count(*) OVER () AS total
+    FROM "{SUMMARY_TABLE}" {{where}}
+    ORDER BY "Site", "AVOMaterialNo"
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def _filters(site, avo):
+    """WHERE clause and parameters of read(); the avo prefix goes through "StockSummary_avo_prefix"."""
+    where, params = [], {}
+    if site:
+        where.append('"Site" = :site')
+        params["site"] = site
+    if avo:
+        where.append('upper("AVOMaterialNo") LIKE :avo')
+        params["avo"] = avo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return ("WHERE " + " AND ".join(where) if where else ""), params
+
+
+def read(engine, *, site=None, avo=None, limit=100, offset=0):
+    """
+    Summary rows ordered by Site, AVOMaterialNo: site is an exact match, avo a
+    part-number prefix (case-insensitive). Returns {"rows", "total", "cached"}.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+    key = (site or None, (avo or "").upper() or None, limit, offset)
+    hit = cache.get(key)
+    if hit is not None:
+        return {**hit, "cached": True}
+
+    where, params = _filters(key[0], key[1])
+    with engine.connect() as conn:
+        if not _has_table(conn):
+            raise LookupError(f'"{SUMMARY_TABLE}" does not exist yet; run python migrations.py')
+        rows = conn.execute(text(READ_SQL.format(where=where)),
+                            {**params, "limit": limit, "offset": offset}).mappings().all()
+        if rows:
+            total = rows[0]["total"]
+        elif offset:
+            # past the last row: no row carries the window count
+            total = conn.execute(text(f'SELECT count(*) FROM "{SUMMARY_TABLE}" {where}'), params).scalar()
+        else:
+            total = 0
+    result = {
+        "rows": [{**{k: v for k, v in r.items() if k != "total"}, "RefreshedAt": r["RefreshedAt"].isoformat()}
+                 for r in rows],
+        "total": total,
+    }
+    cache.put(key, result)
+    return {**result, "cached": False}
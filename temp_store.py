@@ -0,0 +1,292 @@
+"""
+Lifecycle of the temporary files under the outputs directory.
+
+Every artifact an upload leaves behind (the upload itself, its staged frame and
+sidecar) is tracked under an owner token, the staging token of the batch, with an
+expiry time. The entry is one small JSON file per owner, so any gunicorn worker
+can release or sweep it. A janitor thread drops expired owners, evicts the oldest
+ones while the managed files exceed max_bytes, and deletes orphans: managed files
+that no owner references, e.g. left over from before a restart. Its first pass runs
+as soon as it starts. Owners being parsed or inserted are held and never evicted.
+
+Entries are updated read-modify-write, by several workers at once (an upload tracked
+while the insert job holds the entry), so every update runs under an flock of the
+owner's lock file as well as the in-process lock. Owners share LOCK_STRIPES lock
+files that are never deleted: a per-owner file could be removed while another
+worker waits on it.
+"""
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers: one process, the thread lock is enough
+    fcntl = None
+
+_OWNER_RE = re.compile(r"^[0-9a-f]{32}$")
+LOCK_STRIPES = 64
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TempStore:
+    def __init__(self, directory, *, ttl=24 * 3600, max_bytes=2 * 1024 ** 3, orphan_grace=900,
+                 patterns=("upload_*", "pdf_*"), subdirs=("staging",)):
+        """
+        patterns: top-level file names managed by the store; subdirs: directories
+        whose files are all managed. Anything else under directory is left alone.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.orphan_grace = orphan_grace
+        self.patterns = patterns
+        self.subdirs = subdirs
+        self.index_dir = os.path.join(directory, ".tempstore")
+        self.lock_dir = os.path.join(self.index_dir, "locks")
+        self._lock = threading.Lock()
+        self._janitor = None
+        self._janitor_pid = None
+        self.stats = {"sweeps": 0, "released": 0, "expired": 0, "evicted": 0, "orphans": 0,
+                      "bytes_freed": 0, "last_sweep": None, "managed_bytes": 0}
+        os.makedirs(self.lock_dir, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # ---- entries ----
+    def _entry_path(self, owner):
+        if not _OWNER_RE.match(owner or ""):
+            raise KeyError(owner)
+        return os.path.join(self.index_dir, f"{owner}.json")
+
+    @contextmanager
+    def _owner_lock(self, owner):
+        """Exclusive cross-process lock of owner's entry, for one read-modify-write."""
+        self._entry_path(owner)  # validates owner
+        if fcntl is None:
+            yield
+            return
+        stripe = int(owner[:8], 16) % LOCK_STRIPES
+        fd = os.open(os.path.join(self.lock_dir, f"{stripe:02d}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+    def _read(self, owner):
+        try:
+            with open(self._entry_path(owner), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, entry):
+        path = self._entry_path(entry["owner"])
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp, path)
+
+    def _entries(self):
+        out = []
+        for de in os.scandir(self.index_dir):
+            if de.name.endswith(".json"):
+                entry = self._read(de.name[:-5])
+                if entry:
+                    out.append(entry)
+        return out
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.directory))
+
+    def track(self, owner, *paths, ttl=None):
+        """Add paths to owner's files (created or extended) and push its expiry to now + ttl."""
+        now = time.time()
+        with self._lock, self._owner_lock(owner):
+            entry = self._read(owner) or {"owner": owner, "paths": [], "created": now, "held_by": None}
+            for p in paths:
+                rel = self._rel(p)
+                if rel not in entry["paths"]:
+                    entry["paths"].append(rel)
+            entry["expires"] = now + (self.ttl if ttl is None else ttl)
+            self._write(entry)
+
+    def release(self, owner):
+        """Delete owner's files and forget it."""
+        with self._lock, self._owner_lock(owner):
+            entry = self._read(owner)
+            if entry is None:
+                return 0
+            freed = self._remove_files(entry)
+            self._forget(owner)
+            self.stats["released"] += 1
+            self.stats["bytes_freed"] += freed
+        return freed
+
+    @contextmanager
+    def hold(self, owner):
+        """Keep owner out of expiry and eviction while the block runs (parse, insert)."""
+        with self._lock, self._owner_lock(owner):
+            entry = self._read(owner)
+            if entry is not None:
+                entry["held_by"] = os.getpid()
+                self._write(entry)
+        try:
+            yield
+        finally:
+            with self._lock, self._owner_lock(owner):
+                entry = self._read(owner)
+                if entry is not None:
+                    entry["held_by"] = None
+                    entry["expires"] = max(entry["expires"], time.time() + self.orphan_grace)
+                    self._write(entry)
+
+    def _forget(self, owner):
+        try:
+            os.remove(self._entry_path(owner))
+        except FileNotFoundError:
+            pass
+
+    def _remove_files(self, entry):
+        freed = 0
+        for rel in entry["paths"]:
+            path = os.path.join(self.directory, rel)
+            try:
+                size = os.stat(path).st_size
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    # ---- sweeping ----
+    def _managed_files(self):
+        """(relative path, size, mtime) of every file the store is responsible for."""
+        out = []
+        for de in os.scandir(self.directory):
+            if de.is_file() and any(fnmatch.fnmatch(de.name, p) for p in self.patterns):
+                try:
+                    st = de.stat()
+                except FileNotFoundError:
+                    continue
+                out.append((de.name, st.st_size, st.st_mtime))
+        for sub in self.subdirs:
+            root = os.path.join(self.directory, sub)
+            if not os.path.isdir(root):
+                continue
+            for de in os.scandir(root):
+                if de.is_file():
+                    try:
+                        st = de.stat()
+                    except FileNotFoundError:
+                        continue
+                    out.append((os.path.join(sub, de.name), st.st_size, st.st_mtime))
+        return out
+
+    def sweep(self):
+        """Drop expired owners and old orphans, then evict oldest owners down to max_bytes."""
+        now = time.time()
+        counts = {"expired": 0, "evicted": 0, "orphans": 0, "bytes_freed": 0}
+        with self._lock:
+            entries = self._entries()
+            files = self._managed_files()
+            sizes = {rel: size for rel, size, _ in files}
+
+            live = []
+            for e in entries:
+                # decided on the entry as it is under the owner's lock: another worker may
+                # have held or extended it since _entries() read it
+                with self._owner_lock(e["owner"]):
+                    e = self._read(e["owner"])
+                    if e is None:
+                        continue
+                    held = e.get("held_by") and _pid_alive(e["held_by"])
+                    if not held and e["expires"] <= now:
+                        counts["bytes_freed"] += self._remove_files(e)
+                        self._forget(e["owner"])
+                        counts["expired"] += 1
+                        for rel in e["paths"]:
+                            sizes.pop(rel, None)
+                    else:
+                        live.append((e, held))
+
+            referenced = {rel for e, _ in live for rel in e["paths"]}
+            for rel, size, mtime in files:
+                if rel in referenced or now - mtime < self.orphan_grace:
+                    continue
+                try:
+                    os.remove(os.path.join(self.directory, rel))
+                    counts["orphans"] += 1
+                    counts["bytes_freed"] += size
+                except FileNotFoundError:
+                    pass
+                sizes.pop(rel, None)
+
+            total = sum(sizes.values())
+            for e, held in sorted(live, key=lambda item: item[0]["created"]):
+                if total <= self.max_bytes:
+                    break
+                if held:
+                    continue
+                with self._owner_lock(e["owner"]):
+                    e = self._read(e["owner"])
+                    if e is None or (e.get("held_by") and _pid_alive(e["held_by"])):
+                        continue
+                    freed = self._remove_files(e)
+                    self._forget(e["owner"])
+                total -= sum(sizes.get(rel, 0) for rel in e["paths"])
+                counts["evicted"] += 1
+                counts["bytes_freed"] += freed
+
+            for k, v in counts.items():
+                self.stats[k] += v
+            self.stats["sweeps"] += 1
+            self.stats["last_sweep"] = now
+            self.stats["managed_bytes"] = max(total, 0)
+        return counts
+
+    # ---- janitor ----
+    def _after_fork(self):
+        # the janitor thread does not survive fork; start_janitor() starts a new one in the child
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    def start_janitor(self, interval=300):
+        """
+        Sweep now (startup cleanup of orphans) and then every interval seconds, in a
+        daemon thread. Cheap to call repeatedly: one janitor per process.
+        """
+        if self._janitor is not None and self._janitor_pid == os.getpid():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Temp file sweep failed: {e}")
+                time.sleep(interval)
+
+        self._janitor = threading.Thread(target=run, name="temp-janitor", daemon=True)
+        self._janitor_pid = os.getpid()
+        self._janitor.start()
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+        out["owners"] = sum(1 for n in os.listdir(self.index_dir) if n.endswith(".json"))
+        return out
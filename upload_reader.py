@@ -0,0 +1,149 @@
+"""
+Readers for uploaded CSV / Excel files: whole-file, head-only, and chunked streaming.
+Chunked reads keep memory bounded by chunk_rows whatever the file size; .xlsx goes
+through openpyxl in read-only mode, legacy .xls (xlrd) can only be read whole.
+CSV encoding and delimiter are detected once up front (csv_encoding, shared by all
+three readers) so pandas can use its C parser.
+usecols (a header -> bool filter, e.g. ingest_schema.Schema.accepts) skips the
+columns nobody maps, so they are never parsed.
+"""
+import codecs
+import csv
+
+import chardet
+import pandas as pd
+from openpyxl import load_workbook
+
+import metrics
+
+ENCODING_SAMPLE_BYTES = 64 * 1024
+ENCODING_CHECK_BLOCK = 1024 * 1024
+FALLBACK_ENCODING = "latin-1"
+CHARDET_SAMPLE_BYTES = 200_000
+SNIFF_LINES = 20
+SNIFF_DELIMITERS = ";,\t|"
+
+
+def detect_csv_encoding(path, sample_bytes=ENCODING_SAMPLE_BYTES):
+    """
+    utf-8-sig / utf-8 when a strict decode of the first sample_bytes succeeds,
+    otherwise chardet's guess on a larger sample (Latin-1 / cp1252 exports).
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_bytes)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")("strict").decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    with open(path, "rb") as f:
+        sample = f.read(CHARDET_SAMPLE_BYTES)
+    return chardet.detect(sample)["encoding"] or "utf-8"
+
+
+def detect_csv_delimiter(path, encoding, n_lines=SNIFF_LINES):
+    """Delimiter sniffed from the first n_lines lines, or None when csv.Sniffer cannot tell."""
+    lines = []
+    with open(path, encoding=encoding, errors="replace", newline="") as fh:
+        for line in fh:
+            lines.append(line)
+            if len(lines) >= n_lines:
+                break
+    try:
+        return csv.Sniffer().sniff("".join(lines), delimiters=SNIFF_DELIMITERS).delimiter
+    except csv.Error:
+        return None
+
+
+def csv_encoding(path):
+    """
+    detect_csv_encoding, checked against the whole file: UTF-8 is judged on a sample
+    only, so a file with non-UTF-8 bytes further down is read as latin-1 from the
+    start. Decided once, so whole, chunked and head reads of a file all agree, and a
+    chunked insert cannot fail half-way with UnicodeDecodeError.
+    """
+    encoding = detect_csv_encoding(path)
+    if encoding not in ("utf-8", "utf-8-sig"):
+        return encoding
+    decoder = codecs.getincrementaldecoder(encoding)("strict")
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(ENCODING_CHECK_BLOCK), b""):
+                decoder.decode(block)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return encoding
+
+
+@metrics.stage("csv.detect")
+def _csv_options(path):
+    """read_csv keyword arguments: explicit sep + C engine when the delimiter is known."""
+    encoding = csv_encoding(path)
+    sep = detect_csv_delimiter(path, encoding)
+    if sep is None:
+        return {"encoding": encoding, "sep": None, "engine": "python"}
+    return {"encoding": encoding, "sep": sep}
+
+
+def read_upload(path, ext, usecols=None):
+    """The whole upload as one DataFrame (what /preview always did)."""
+    if ext in (".xls", ".xlsx"):
+        return pd.read_excel(path, usecols=usecols)
+    return pd.read_csv(path, usecols=usecols, **_csv_options(path))
+
+
+def _xlsx_frames(path, chunk_rows, usecols=None):
+    # file handle rather than path: staged uploads do not keep their .xlsx extension
+    with open(path, "rb") as fh:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+            width = len(columns)
+            keep = [i for i, h in enumerate(columns) if usecols is None or usecols(h)]
+            columns = [columns[i] for i in keep]
+            buf = []
+            for r in rows:
+                if r is None or all(v is None for v in r):
+                    continue
+                r = tuple(r[:width]) + (None,) * (width - len(r))
+                buf.append(tuple(r[i] for i in keep) if usecols is not None else r)
+                if len(buf) >= chunk_rows:
+                    yield pd.DataFrame(buf, columns=columns)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=columns)
+        finally:
+            wb.close()
+
+
+def iter_upload_chunks(path, ext, chunk_rows=50_000, usecols=None):
+    """Yield the upload as consecutive DataFrames of at most chunk_rows rows."""
+    if ext == ".xlsx":
+        yield from _xlsx_frames(path, chunk_rows, usecols)
+    elif ext == ".xls":
+        df = pd.read_excel(path, usecols=usecols)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].reset_index(drop=True)
+    else:
+        with pd.read_csv(path, chunksize=chunk_rows, usecols=usecols, **_csv_options(path)) as reader:
+            for chunk in reader:
+                yield chunk.reset_index(drop=True)
+
+
+def read_upload_head(path, ext, n_rows, usecols=None):
+    """Only the first n_rows rows, without reading the rest of the file."""
+    if ext == ".xls":
+        return pd.read_excel(path, nrows=n_rows, usecols=usecols)
+    if ext != ".xlsx":
+        return pd.read_csv(path, nrows=n_rows, usecols=usecols, **_csv_options(path))
+    return next(iter_upload_chunks(path, ext, chunk_rows=n_rows, usecols=usecols), pd.DataFrame())
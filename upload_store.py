@@ -0,0 +1,120 @@
+"""
+Uploads written once, straight to their final file, with the sha256 taken on the way.
+
+The request class returned by upload_request_class() makes werkzeug's multipart
+parser stream every uploaded file part into a HashingFile under the upload
+directory instead of a SpooledTemporaryFile, so nothing has to be copied out of a
+temporary file afterwards. Routes take a file over with keep(); files that no
+route kept are deleted when the request is closed.
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import namedtuple
+
+from flask import Request
+
+BLOCK_SIZE = 1024 * 1024
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+StoredUpload = namedtuple("StoredUpload", "path sha256 size")
+
+
+def file_sha256(path, block_size=BLOCK_SIZE) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def upload_path(directory, filename, prefix="upload"):
+    """A fresh path under directory that keeps the (sanitized) extension of filename."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    ext = ext if _EXT_RE.match(ext) else ""
+    return os.path.join(directory, f"{prefix}_{int(time.time())}_{uuid.uuid4().hex[:12]}{ext}")
+
+
+class HashingFile:
+    """Writable/readable file that hashes everything written through it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.kept = False
+        self._sha = hashlib.sha256()
+        self._fh = open(path, "w+b")
+
+    def write(self, data):
+        self._sha.update(data)
+        self.size += len(data)
+        return self._fh.write(data)
+
+    @property
+    def sha256(self):
+        return self._sha.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+    def __iter__(self):
+        return iter(self._fh)
+
+    def discard(self):
+        self._fh.close()
+        if not self.kept:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def save_stream(src, path, block_size=BLOCK_SIZE) -> StoredUpload:
+    """Copy a readable stream to path, hashing it in the same pass."""
+    out = HashingFile(path)
+    try:
+        shutil.copyfileobj(src, out, block_size)
+    except BaseException:
+        out.discard()
+        raise
+    out.kept = True
+    out.close()
+    return StoredUpload(path, out.sha256, out.size)
+
+
+def keep(file_storage, directory) -> StoredUpload:
+    """
+    Take over an uploaded file: its path on disk, sha256 and size. The file then
+    outlives the request; removing it is up to the caller.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingFile):
+        stream.flush()
+        stream.kept = True
+        return StoredUpload(stream.path, stream.sha256, stream.size)
+    # not parsed by an upload request (e.g. a FileStorage built by hand)
+    stream.seek(0)
+    return save_stream(stream, upload_path(directory, file_storage.filename))
+
+
+def upload_request_class(directory, base=Request):
+    """A Request subclass that streams uploaded files into directory."""
+    os.makedirs(directory, exist_ok=True)
+
+    class UploadRequest(base):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            stream = HashingFile(upload_path(directory, filename))
+            self.__dict__.setdefault("_stored_uploads", []).append(stream)
+            return stream
+
+        def close(self):
+            try:
+                super().close()
+            finally:
+                for stream in self.__dict__.pop("_stored_uploads", ()):
+                    stream.discard()
+
+    return UploadRequest